@@ -2,20 +2,32 @@ from .calculator import (
 	Associability,
 	OperatorInfo,
 	Parser,
-	PrecedenceLayer
+	PrecedenceLayer,
+	TokenizerEngine
 )
 from .ops import *
 from .types import *
 from . import (
+	aio,
+	approx,
+	batch,
+	codegen,
+	compiler,
+	kernel,
 	op_assign,
 	op_basic,
 	op_num,
 	op_rng,
 	op_str,
-	op_utils
+	op_utils,
+	optimize,
+	serialize,
+	vm
 )
 
 def give_basic_parser():
+	# The parser is built once per process by Parser.shared() and the same one is given to every caller,
+	# so it should not be modified
 	default_precedence_table = {
 		9: PrecedenceLayer.right_asso(
 			OperatorInfo(op_num.PowOperator, '**')
@@ -61,9 +73,10 @@ def give_basic_parser():
 		OperatorInfo(op_num.FactorialOperator, '!'),
 	]
 
-	return Parser(default_prefix_ops, default_postfix_ops, default_precedence_table)
+	return Parser.shared(default_prefix_ops, default_postfix_ops, default_precedence_table)
 
 def give_advanced_parser(additional_prefix = None, additional_postfix = None):
+	# Shared like give_basic_parser(): the same additional operators give the same parser
 	if additional_prefix is None:
 		additional_prefix = []
 	if additional_postfix is None:
@@ -134,4 +147,4 @@ def give_advanced_parser(additional_prefix = None, additional_postfix = None):
 		OperatorInfo(op_num.FactorialOperator, '!'),
 	]
 
-	return Parser(default_prefix_ops + additional_prefix, default_postfix_ops + additional_postfix, default_precedence_table)
+	return Parser.shared(default_prefix_ops + additional_prefix, default_postfix_ops + additional_postfix, default_precedence_table)
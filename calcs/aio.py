@@ -0,0 +1,133 @@
+from __future__ import annotations
+from .types import *
+from collections.abc import Callable, MutableMapping
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Optional, TYPE_CHECKING
+import asyncio
+import functools
+
+if TYPE_CHECKING:
+	from .calculator import Parser
+
+__all__ = (
+	'AsyncEvaluator',
+	'eval_async',
+	'parse_async',
+)
+
+'''
+Parsing and evaluating in an executor, so a slow expression (e.g. a huge factorial or power)
+does not block the event loop.
+The executor is a thread pool by default, which helps with slow Python code (e.g. SymPy),
+but a single huge integer operation (e.g. "200000!") holds the GIL, stalling the loop all the same;
+a process pool keeps the loop running for those. With a process pool, the parser, trees and mappings
+are pickled, so the mappings changed by the expressions (e.g. assignments) stay in the workers.
+Evaluations give the constants of their values, like calcs.batch.
+
+Threads and processes cannot be stopped from outside: when a call times out or is cancelled,
+the awaiting coroutine raises at once and work not started yet is dropped,
+but work already running goes on to its end in the executor.
+AsyncEvaluator counts such work in its limit until it ends, so abandoned work cannot pile up.
+'''
+
+def _parse(parser: Optional[Parser], s: str) -> TreeNodeType:
+	if parser is None:
+		from . import give_advanced_parser
+		parser = give_advanced_parser()
+	return parser.parse(s)
+
+def _eval(tree: TreeNodeType, mapping: Optional[MutableMapping[Var, LValue]], kwargs: dict[str, Any]) -> Constant:
+	value = evaluate(tree, {} if mapping is None else mapping, **kwargs)
+	return Operator.extract_constant(value)
+
+async def _run(executor: Optional[Executor], timeout: Optional[float], function: Callable[..., Any], *args) -> Any:
+	loop = asyncio.get_running_loop()
+	async with asyncio.timeout(timeout):
+		return await loop.run_in_executor(executor, function, *args)
+
+async def parse_async(s: str, parser: Optional[Parser] = None,
+	executor: Optional[Executor] = None, timeout: Optional[float] = None) -> TreeNodeType:
+	# Parse s with the parser (give_advanced_parser() by default) in the executor
+	# (the default executor of the loop if None), raising TimeoutError after timeout seconds.
+	return await _run(executor, timeout, _parse, parser, s)
+
+async def eval_async(tree: TreeNodeType, mapping: Optional[MutableMapping[Var, LValue]] = None, *,
+	executor: Optional[Executor] = None, timeout: Optional[float] = None, **kwargs) -> Constant:
+	# Evaluate the tree in the executor, like parse_async; the keyword arguments are passed to eval().
+	return await _run(executor, timeout, _eval, tree, mapping, kwargs)
+
+class AsyncEvaluator:
+	'''
+	parse_async and eval_async with a parser, an executor, a default timeout and a limit
+	of calls running at once; more calls wait for a slot, and the timeout includes the wait.
+	A slot is taken until the work ends in the executor, even if the call is cancelled or times out.
+
+	Without an executor, the evaluator has a thread pool of its own with limit threads,
+	so pathological expressions do not take the default executor of the loop from other code;
+	it is shut down by close() or at the end of "async with".
+	An evaluator should be used in one event loop.
+	'''
+	_missing: Any = object()
+
+	def __init__(self, parser: Optional[Parser] = None, executor: Optional[Executor] = None,
+		limit: Optional[int] = None, timeout: Optional[float] = None):
+		if limit is not None and limit < 1:
+			raise ValueError('limit should be positive')
+
+		self._parser = parser
+		self._own_executor = executor is None
+		self._executor = ThreadPoolExecutor(limit) if executor is None else executor
+		self._timeout = timeout
+		self._slots = None if limit is None else asyncio.Semaphore(limit)
+		self._running = 0
+
+	async def parse_async(self, s: str, timeout: Optional[float] = _missing) -> TreeNodeType:
+		return await self._run(timeout, _parse, self._parser, s)
+
+	async def eval_async(self, tree: TreeNodeType, mapping: Optional[MutableMapping[Var, LValue]] = None, *,
+		timeout: Optional[float] = _missing, **kwargs) -> Constant:
+		return await self._run(timeout, _eval, tree, mapping, kwargs)
+
+	async def _run(self, timeout: Optional[float], function: Callable[..., Any], *args) -> Any:
+		async with asyncio.timeout(self._timeout if timeout is self._missing else timeout):
+			if self._slots is not None:
+				await self._slots.acquire()
+			try:
+				future = self._executor.submit(function, *args)
+			except BaseException:
+				if self._slots is not None:
+					self._slots.release()
+				raise
+
+			self._running += 1
+			# Called in the worker thread, or here if the future is cancelled before it runs
+			future.add_done_callback(functools.partial(self._done, asyncio.get_running_loop()))
+			return await asyncio.wrap_future(future)
+
+	def _done(self, loop: asyncio.AbstractEventLoop, future: Future):
+		try:
+			loop.call_soon_threadsafe(self._end)
+		except RuntimeError:
+			# The loop is closed, and so are the waiters
+			pass
+
+	def _end(self):
+		self._running -= 1
+		if self._slots is not None:
+			self._slots.release()
+
+	@property
+	def running(self) -> int:
+		# The number of calls in the executor, including the work of cancelled calls still running
+		return self._running
+
+	def close(self):
+		# Shut down the own executor without waiting for the work running
+		if self._own_executor:
+			self._executor.shutdown(wait = False, cancel_futures = True)
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *args):
+		self.close()
@@ -0,0 +1,76 @@
+from mpmath import MPContext
+from mpmath.ctx_mp_python import mpnumeric
+from sympy import Expr, Float, I
+from threading import Lock
+from typing import Any, Optional, Union
+
+__all__ = (
+	'DOUBLE_PRECISION',
+	'ApproxType',
+	'context',
+	'is_approx',
+	'precision_of',
+	'to_approx',
+	'to_sympy',
+)
+
+'''
+Approximate numbers are Python float and complex for precisions (significant decimal digits)
+up to DOUBLE_PRECISION, and mpmath mpf and mpc beyond that.
+Every precision has its own mpmath context, so the global precision of mpmath is never changed,
+and evaluations at different precisions can run in different threads.
+Arithmetic on two values of the same context keeps that precision.
+'''
+
+DOUBLE_PRECISION = 15
+
+ApproxType = Union[float, complex, mpnumeric]
+
+_contexts: dict[int, MPContext] = {}
+_contexts_lock = Lock()
+
+def context(precision: int) -> MPContext:
+	if precision not in _contexts:
+		with _contexts_lock:
+			if precision not in _contexts:
+				ctx = MPContext()
+				ctx.dps = precision
+				_contexts[precision] = ctx
+
+	return _contexts[precision]
+
+def is_approx(value: Any) -> bool:
+	return type(value) is float or type(value) is complex or isinstance(value, mpnumeric)
+
+def precision_of(value: ApproxType) -> int:
+	if type(value) is float or type(value) is complex:
+		return DOUBLE_PRECISION
+	return value.context.dps
+
+def to_approx(value: Union[int, Expr, ApproxType], precision: int) -> Optional[ApproxType]:
+	# None if the value has no approximation, e.g. the complex infinity
+	if is_approx(value):
+		if precision_of(value) == precision:
+			return value
+	elif type(value) is not int:
+		try:
+			value = value._to_mpmath(context(max(precision, DOUBLE_PRECISION)).prec)
+		except (TypeError, ValueError):
+			return None
+
+	if precision <= DOUBLE_PRECISION:
+		try:
+			if value.imag == 0:
+				return float(value.real)
+			return complex(value)
+		except OverflowError:
+			# Out of the range of float
+			pass
+
+	return context(precision).convert(value)
+
+def to_sympy(value: ApproxType) -> Expr:
+	precision = precision_of(value)
+	if value.imag == 0:
+		return Float(value.real, precision)
+	return Float(value.real, precision) + Float(value.imag, precision) * I
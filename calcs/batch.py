@@ -0,0 +1,106 @@
+from __future__ import annotations
+from .types import *
+from collections import deque
+from collections.abc import Iterable, Iterator, MutableMapping
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Any, NamedTuple, Optional, TYPE_CHECKING
+import os
+
+if TYPE_CHECKING:
+	from .calculator import Parser
+
+__all__ = (
+	'BatchResult',
+	'evaluate_many',
+)
+
+'''
+Independent (expression, mapping) pairs are parsed and evaluated in worker processes.
+The parser is sent to every worker once, when the worker starts, and the pairs are sent in chunks.
+The results are the evaluated constants, so the mappings changed by the expressions (e.g. assignments)
+stay in the workers and are not sent back.
+Errors of single items (any Exception, e.g. ZeroDivisionError of "7 // 0") are reported in their results;
+only the others, such as KeyboardInterrupt, stop the batch.
+'''
+
+# The errors of an item which do not stop the batch; evaluating may raise almost anything
+ITEM_ERRORS = (Exception,)
+
+class BatchResult(NamedTuple):
+	index: int # The position of the pair in the input
+	value: Optional[Constant]
+	error: Optional[Exception]
+
+Pair = tuple[str, Optional[MutableMapping[Var, LValue]]]
+
+# The state of a worker process
+_parser: Optional[Parser] = None
+_kwargs: dict[str, Any] = {}
+
+def _initialize(parser: Parser, kwargs: dict[str, Any]):
+	global _parser, _kwargs
+	_parser = parser
+	_kwargs = kwargs
+
+def _evaluate(parser: Parser, index: int, s: str, mapping: Optional[MutableMapping[Var, LValue]], kwargs: dict[str, Any]) -> BatchResult:
+	try:
+		tree = parser.parse(s)
+		value = tree.eval({} if mapping is None else mapping, **kwargs)
+		return BatchResult(index, Operator.extract_constant(value), None)
+	except ITEM_ERRORS as e:
+		return BatchResult(index, None, e)
+
+def _run_chunk(chunk: list[tuple[int, Pair]]) -> list[BatchResult]:
+	assert _parser is not None
+	return [_evaluate(_parser, index, s, mapping, _kwargs) for index, (s, mapping) in chunk]
+
+def _chunks(pairs: Iterable[Pair], chunksize: int) -> Iterator[list[tuple[int, Pair]]]:
+	it = enumerate(pairs)
+	while len(chunk := list(islice(it, chunksize))) > 0:
+		yield chunk
+
+def evaluate_many(pairs: Iterable[Pair], parser: Optional[Parser] = None,
+	workers: Optional[int] = None, chunksize: int = 256, ordered: bool = True, **kwargs) -> Iterator[BatchResult]:
+	# Yield a BatchResult for every pair, in the input order if ordered, or as they are completed.
+	# The parser is give_advanced_parser() by default, and the keyword arguments are passed to eval().
+	# workers is the number of processes (os.cpu_count() by default); 0 evaluates in this process.
+	# The pairs are consumed lazily: at most two chunks per worker are in flight.
+	if chunksize < 1:
+		raise ValueError('chunksize should be positive')
+	if parser is None:
+		from . import give_advanced_parser
+		parser = give_advanced_parser()
+
+	if workers == 0:
+		for index, (s, mapping) in enumerate(pairs):
+			yield _evaluate(parser, index, s, mapping, kwargs)
+		return
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+
+	chunks = _chunks(pairs, chunksize)
+	executor = ProcessPoolExecutor(workers, initializer = _initialize, initargs = (parser, kwargs))
+	try:
+		if ordered:
+			queue: deque[Future[list[BatchResult]]] = deque()
+			for chunk in islice(chunks, 2 * workers):
+				queue.append(executor.submit(_run_chunk, chunk))
+
+			while len(queue) > 0:
+				results = queue.popleft().result()
+				if (chunk := next(chunks, None)) is not None:
+					queue.append(executor.submit(_run_chunk, chunk))
+				yield from results
+		else:
+			pending: set[Future[list[BatchResult]]] = {executor.submit(_run_chunk, chunk) for chunk in islice(chunks, 2 * workers)}
+			while len(pending) > 0:
+				done, pending = wait(pending, return_when = FIRST_COMPLETED)
+				for future in done:
+					if (chunk := next(chunks, None)) is not None:
+						pending.add(executor.submit(_run_chunk, chunk))
+					yield from future.result()
+	finally:
+		# Also when the caller stops early
+		executor.shutdown(cancel_futures = True)
@@ -1,18 +1,23 @@
 from __future__ import annotations
+from .approx import to_approx
 from .exceptions import *
 from .types import *
+from .utils import CacheInfo, LRUCache
 from collections import Counter
-from collections.abc import Callable, Sequence
+from collections.abc import Callable, Iterable, Iterator, Sequence
 from enum import Enum
 from itertools import chain
 from more_itertools import sliding_window
-from sympy import Float, I, Rational
+from sympy import Expr, I, Rational
+from types import MethodType
 from typing import Any, Optional, TYPE_CHECKING
-import random
+import hashlib
 import re
+import sys
 
 __all__ = (
 	'Associability',
+	'TokenizerEngine',
 	'OperatorInfo',
 	'PrecedenceLayer',
 	'Token',
@@ -28,6 +33,13 @@ class Associability(Enum):
 	LEFT = 1
 	RIGHT = 2
 
+# STATE_MACHINE walks the input character by character;
+# REGEX compiles the lexer configuration into a master pattern scanned by finditer.
+# Both engines produce the same tokens.
+class TokenizerEngine(Enum):
+	STATE_MACHINE = 0
+	REGEX = 1
+
 class OperatorInfo:
 	@classmethod
 	def factory(cls, op: type[Operator], *symbols: str) -> list[OperatorInfo]:
@@ -50,6 +62,14 @@ class OperatorInfo:
 	def symbol(self) -> str:
 		return self._symbol
 
+	def __eq__(self, other):
+		if not isinstance(other, OperatorInfo):
+			return NotImplemented
+		return self._op is other._op and self._symbol == other._symbol
+
+	def __hash__(self):
+		return hash((self._op, self._symbol))
+
 class PrecedenceLayer:
 	def __init__(self, asso: Associability, *ops: OperatorInfo):
 		if asso is Associability.NOTCARE:
@@ -85,7 +105,72 @@ class PrecedenceLayer:
 	def symbols(self) -> list[str]:
 		return [o.symbol for o in self._ops]
 
+	def __reduce__(self):
+		return (PrecedenceLayer, (self._asso, *self._ops))
+
+# Fingerprints of values described by identity, which only compare in this process
+LOCAL_FINGERPRINT = 'local-'
+
+def _importable(value: Any) -> bool:
+	# Whether the value is found again by its module and qualified name, like pickle does
+	module = sys.modules.get(getattr(value, '__module__', None) or '')
+	qualname = getattr(value, '__qualname__', None)
+	if module is None or not isinstance(qualname, str):
+		return False
+
+	found: Any = module
+	for attr in qualname.split('.'):
+		found = getattr(found, attr, None)
+	return found is value
+
+def _describe(value: Any, local: list[Any]) -> Any:
+	# A canonical form of a construction argument made of strings and numbers,
+	# which is the same in every process, except the values appended to local
+	if value is None or isinstance(value, (str, int, float)):
+		return value
+	elif isinstance(value, re.Pattern):
+		return ('re', value.pattern, value.flags)
+	elif isinstance(value, Enum):
+		return (type(value).__qualname__, value.name)
+	elif isinstance(value, OperatorInfo):
+		return ('op', value.symbol, _describe(value.op, local))
+	elif isinstance(value, PrecedenceLayer):
+		return ('layer', _describe(value.asso, local), tuple(_describe(o, local) for o in value))
+	elif isinstance(value, (list, tuple)):
+		return tuple(_describe(v, local) for v in value)
+	elif isinstance(value, dict):
+		return ('dict', tuple(sorted((_describe(k, local), _describe(v, local)) for k, v in value.items())))
+	elif isinstance(value, MethodType) and isinstance(value.__self__, Parser):
+		# The token preprocessor a parser gives its lexer; the parser describes its own state
+		return ('method', _describe(type(value.__self__), local), _describe(value.__func__, local))
+	elif (isinstance(value, type) or callable(value)) and _importable(value):
+		# Classes and functions are pickled by name as well
+		return ('name', value.__module__, value.__qualname__)
+	elif isinstance(value, type) or callable(value):
+		# Lambdas, local classes and functions, partials and callable objects
+		# may share their names, so they are told apart by identity
+		local.append(value)
+		return ('id', id(value))
+	raise TypeError(f'Unable to describe {type(value).__name__}')
+
+def _fingerprint(value: Any) -> str:
+	# Starting with LOCAL_FINGERPRINT if a part is described by identity;
+	# the owner of the fingerprint should keep the value alive, so its id is not reused
+	local: list[Any] = []
+	digest = hashlib.sha256(repr(_describe(value, local)).encode()).hexdigest()
+	return LOCAL_FINGERPRINT + digest if len(local) > 0 else digest
+
+def _construct(cls: type, args: tuple, kwargs: dict[str, Any]) -> Any:
+	return cls(*args, **kwargs)
+
+def _construct_shared(cls: type[Parser], key: str, args: tuple, kwargs: dict[str, Any]) -> Parser:
+	return cls._shared_by_key(key, args, kwargs)
+
 class Token:
+	# The origin is not copied: it is either the string itself, a given string,
+	# or a slice (position, length) of the source string.
+	__slots__ = ('_s', '_p', '_src', '_n')
+
 	_is_string_const: bool = False
 	_is_symbol: bool = False
 	_is_word: bool = False
@@ -93,10 +178,15 @@ class Token:
 	def __init__(self, s: str, position: int, origin: Optional[str] = None):
 		self._s = s
 		self._p = position
-		if origin is None:
-			self._o = s
-		else:
-			self._o = origin
+		self._src = origin
+		self._n = -1
+
+	@classmethod
+	def sliced(cls, s: str, position: int, source: str, length: int):
+		# The origin is source[position - 1:position - 1 + length]
+		token = cls(s, position, source)
+		token._n = length
+		return token
 
 	@property
 	def string(self) -> str:
@@ -108,7 +198,17 @@ class Token:
 
 	@property
 	def origin(self) -> str:
-		return self._o
+		if self._src is None:
+			return self._s
+		elif self._n < 0:
+			return self._src
+		else:
+			return self._src[self._p - 1:self._p - 1 + self._n]
+
+	@property
+	def source(self) -> Optional[str]:
+		# The source string if the origin is a slice of it
+		return self._src if self._n >= 0 else None
 
 	def __str__(self):
 		return self._s
@@ -126,12 +226,15 @@ class Token:
 		return self._is_word
 
 class WordToken(Token):
+	__slots__ = ()
 	_is_word = True
 
 class StringToken(Token):
+	__slots__ = ()
 	_is_string_const = True
 
 class SymbolToken(Token):
+	__slots__ = ()
 	_is_symbol = True
 
 class Lexer:
@@ -143,6 +246,8 @@ class Lexer:
 	symbol_re: Optional[re.Pattern[str]] = None
 	assert not(word_re is None and symbol_re is None)
 
+	_find_missing: Any = object()
+
 	class S(Enum):
 		SYMBOL = 0
 		WORD = 1
@@ -170,7 +275,12 @@ class Lexer:
 		word_re: Optional[re.Pattern[str]] = None,
 		symbol_re: Optional[re.Pattern[str]] = None,
 		space_re: Optional[re.Pattern[str]] = None,
-		token_preprocessors: Optional[Sequence[Callable[[Sequence[Token]], Sequence[Token]]]] = None, **kwargs):
+		token_preprocessors: Optional[Sequence[Callable[[Iterable[Token]], Iterable[Token]]]] = None,
+		engine: TokenizerEngine = TokenizerEngine.STATE_MACHINE,
+		find_cache_size: Optional[int] = 1024, **kwargs):
+
+		# For pickling, which builds the lexer again
+		self._arguments = ((list(op_symbols), word_re, symbol_re, space_re, token_preprocessors, engine, find_cache_size), kwargs.copy())
 
 		# Lexer constant check
 		SQ = kwargs.pop('SQ', Lexer.SQ)
@@ -206,7 +316,7 @@ class Lexer:
 			self.space_re = space_re
 
 		if token_preprocessors is None:
-			self._token_preprocessors: Sequence[Callable[[Sequence[Token]], Sequence[Token]]] = ()
+			self._token_preprocessors: Sequence[Callable[[Iterable[Token]], Iterable[Token]]] = ()
 		else:
 			self._token_preprocessors = token_preprocessors
 
@@ -227,34 +337,125 @@ class Lexer:
 				raise LexerConstructError('Operators mixed with symbols and words are disallowed')
 
 		self._parse_symbols = set(ss)
-		self._find_cache: dict[str, Optional[list[SymbolToken]]] = {'': []}
-
-	def _find_without_position(self, symbols: str) -> Optional[list[SymbolToken]]:
-		if symbols in self._find_cache:
-			return self._find_cache[symbols]
-
-		for i in range(len(symbols), 0, -1):
-			prefix = symbols[:i]
-			if prefix not in self._parse_symbols:
-				continue
+		# A trie over the symbols; the key '' marks the end of a symbol
+		self._symbol_trie: dict[str, Any] = {}
+		for symbol in self._parse_symbols:
+			node = self._symbol_trie
+			for c in symbol:
+				node = node.setdefault(c, {})
+			node[''] = True
+		# symbol run -> ((symbol, offset), ...) or None if the run cannot be split
+		self._find_cache: LRUCache[str, Optional[tuple[tuple[str, int], ...]]] = LRUCache(find_cache_size)
+
+		self._engine = engine
+		if engine is TokenizerEngine.REGEX:
+			self._master_re = self._build_master_re()
+			self._unescape_re = re.compile(f'{re.escape(BACKSLASH)}(.)', re.DOTALL)
+
+		self._fingerprint = _fingerprint((
+			sorted(set(op_symbols)), self.SQ, self.DQ, self.BACKSLASH,
+			self.word_re, self.symbol_re, self.space_re,
+			self._token_preprocessors, engine, find_cache_size,
+		))
 
-			sub_result = self._find_without_position(symbols[i:])
-			if sub_result is None:
-				continue
-			sub_result = [SymbolToken(token.string, token.position + i) for token in sub_result]
+	@property
+	def fingerprint(self) -> str:
+		# Lexers with the same fingerprint give the same tokens
+		return self._fingerprint
+
+	def __reduce__(self):
+		return (_construct, (Lexer, *self._arguments))
+
+	def _build_master_re(self) -> re.Pattern[str]:
+		# The character classes (space, word, symbol) are matched against single characters,
+		# so word_re/symbol_re/space_re should always match exactly one character.
+		# The priority is the same as the state machine: space > word > quote > symbol.
+		def scoped(pattern: re.Pattern[str]) -> str:
+			flags = ''
+			if pattern.flags & re.ASCII:
+				flags += 'a'
+			if pattern.flags & re.IGNORECASE:
+				flags += 'i'
+			if pattern.flags & re.DOTALL:
+				flags += 's'
+			if pattern.flags & re.VERBOSE:
+				flags += 'x'
+			return f'(?{flags}:{pattern.pattern})' if flags else f'(?:{pattern.pattern})'
+
+		space = scoped(self.space_re)
+		if self.word_re is not None:
+			word = f'(?:(?!{space}){scoped(self.word_re)})'
+		else:
+			assert self.symbol_re is not None
+			word = f'(?:(?!{space}){scoped(self.symbol_re)})'
+
+		quotes = dict.fromkeys((self.SQ, self.DQ))
+		strings = []
+		for quote in quotes:
+			q, b = re.escape(quote), re.escape(self.BACKSLASH)
+			if quote == self.BACKSLASH:
+				strings.append(f'{q}[^{q}]*{q}')
+			else:
+				strings.append(f'{q}(?:[^{q}{b}]|{b}(?s:.))*{q}')
+
+		any_quote = '[' + ''.join(re.escape(quote) for quote in quotes) + ']'
+		symbol = f'(?:(?!{space})(?!{word})(?!{any_quote})(?s:.))'
+
+		return re.compile(
+			f'(?P<space>{space}+)'
+			f'|(?P<word>{word}+)'
+			f'|(?P<string>{"|".join(strings)})'
+			f'|(?P<unclosed>{any_quote})'
+			f'|(?P<symbol>{symbol}+)'
+		)
+
+	def _find_without_position(self, symbols: str) -> Optional[tuple[tuple[str, int], ...]]:
+		result = self._find_cache.get(symbols, Lexer._find_missing)
+		if result is not Lexer._find_missing:
+			return result
+
+		# Same as trying the longest prefix first and backtracking,
+		# but done iteratively from the end of the run, so it is linear in len(symbols).
+		# step[i] is the longest symbol at i such that symbols[i + step[i]:] can be split.
+		n = len(symbols)
+		step = [0] * (n + 1)
+		splittable = [False] * n + [True]
+		trie = self._symbol_trie
+		for i in range(n - 1, -1, -1):
+			node = trie
+			for j in range(i, n):
+				node = node.get(symbols[j])
+				if node is None:
+					break
+				if '' in node and splittable[j + 1]:
+					step[i] = j + 1 - i
+			splittable[i] = step[i] > 0
+
+		if not splittable[0]:
+			self._find_cache.put(symbols, None)
+			return None
 
-			self._find_cache[symbols] = [SymbolToken(prefix, 0), *sub_result]
-			return self._find_cache[symbols]
+		found: list[tuple[str, int]] = []
+		i = 0
+		while i < n:
+			found.append((symbols[i:i + step[i]], i))
+			i += step[i]
 
-		self._find_cache[symbols] = None
-		return None
+		result = tuple(found)
+		self._find_cache.put(symbols, result)
+		return result
 
 	def _find(self, token: SymbolToken) -> Optional[list[SymbolToken]]:
 		result = self._find_without_position(token.string)
 		if result is None:
 			return None
 
-		return [SymbolToken(t.string, t.position + token.position) for t in result]
+		position = token.position
+		return [SymbolToken(s, offset + position) for s, offset in result]
+
+	@property
+	def find_cache_info(self) -> CacheInfo:
+		return self._find_cache.info()
 
 	def is_word(self, c):
 		# Pre-condition: no spaces
@@ -264,31 +465,46 @@ class Lexer:
 			assert self.symbol_re is not None
 			return self.symbol_re.match(c)
 
-	def tokenize(self, s: str) -> list[Token]:
+	def _split_regex(self, s: str) -> Iterator[Token]:
+		BACKSLASH = self.BACKSLASH
+
+		for m in self._master_re.finditer(s):
+			kind = m.lastgroup
+			i = m.start() + 1
+			match kind:
+				case 'word':
+					yield WordToken(m.group(), i)
+				case 'symbol':
+					yield SymbolToken(m.group(), i)
+				case 'string':
+					content = m.group()[1:-1]
+					if s[m.start()] != BACKSLASH and BACKSLASH in content:
+						# Only escape that \? = ?
+						content = self._unescape_re.sub(r'\1', content)
+					yield StringToken.sliced(content, i, s, m.end() - m.start())
+				case 'unclosed':
+					raise TokenizeError(i, 'Quote not closed')
+
+	def _split_state_machine(self, s: str) -> Iterator[Token]:
 		SQ = self.SQ
 		DQ = self.DQ
 		BACKSLASH = self.BACKSLASH
 		S = self.S
 
-		# First step split
-		first: list[Token] = []
 		status = S.SYMBOL
-		keep, keep_original_str, keep_from, quote = '', '', 0, DQ
+		keep, keep_from, quote = '', 0, DQ
 		for i, c in enumerate(s, 1):
 			match status:
 				case S.INQUOTE_ESCAPE:
 					# Only escape that \? = ?
 					# keep_from won't update
 					keep += c
-					keep_original_str += c
 					status = S.INQUOTE
 				case S.INQUOTE:
 					# keep_from won't update
-					keep_original_str += c
 					if quote == c:
-						first.append(StringToken(keep, keep_from, keep_original_str))
+						yield StringToken.sliced(keep, keep_from, s, i - keep_from + 1)
 						keep = ''
-						keep_original_str = ''
 						status = S.SYMBOL
 					elif c == BACKSLASH:
 						status = S.INQUOTE_ESCAPE
@@ -297,19 +513,18 @@ class Lexer:
 				case S.SYMBOL:
 					if self.space_re.match(c):
 						if len(keep) > 0:
-							first.append(SymbolToken(keep, keep_from))
+							yield SymbolToken(keep, keep_from)
 						keep = ''
 					elif self.is_word(c):
 						if len(keep) > 0:
-							first.append(SymbolToken(keep, keep_from))
+							yield SymbolToken(keep, keep_from)
 						keep = c
 						keep_from = i
 						status = S.WORD
 					elif c == SQ or c == DQ:
 						if len(keep) > 0:
-							first.append(SymbolToken(keep, keep_from))
+							yield SymbolToken(keep, keep_from)
 						keep = ''
-						keep_original_str = c
 						keep_from = i
 						quote = c
 						status = S.INQUOTE
@@ -320,7 +535,7 @@ class Lexer:
 				case S.WORD:
 					if self.space_re.match(c):
 						if len(keep) > 0:
-							first.append(WordToken(keep, keep_from))
+							yield WordToken(keep, keep_from)
 						keep = ''
 					elif self.is_word(c):
 						if len(keep) == 0:
@@ -328,15 +543,14 @@ class Lexer:
 						keep += c
 					elif c == SQ or c == DQ:
 						if len(keep) > 0:
-							first.append(WordToken(keep, keep_from))
+							yield WordToken(keep, keep_from)
 						keep = ''
-						keep_original_str = c
 						keep_from = i
 						quote = c
 						status = S.INQUOTE
 					else:
 						if len(keep) > 0:
-							first.append(WordToken(keep, keep_from))
+							yield WordToken(keep, keep_from)
 						keep = c
 						keep_from = i
 						status = S.SYMBOL
@@ -346,18 +560,26 @@ class Lexer:
 
 		if len(keep) > 0:
 			if status == S.WORD:
-				first.append(WordToken(keep, keep_from))
+				yield WordToken(keep, keep_from)
 			elif status == S.SYMBOL:
-				first.append(SymbolToken(keep, keep_from))
+				yield SymbolToken(keep, keep_from)
+
+	def iter_tokens(self, s: str) -> Iterator[Token]:
+		# Every stage is a generator, so tokens are produced lazily
+		# First step split
+		first: Iterable[Token]
+		if self._engine is TokenizerEngine.REGEX:
+			first = self._split_regex(s)
+		else:
+			first = self._split_state_machine(s)
 
-		# Note that no empty string in first list
+		# Note that no empty string in first stage
 
 		# Second, restore numbers with decimal points
-		processed_tokens: Sequence[Token] = first
+		processed_tokens: Iterable[Token] = first
 		for token_preprocessor in self._token_preprocessors:
 			processed_tokens = token_preprocessor(processed_tokens)
 
-		result: list[Token] = []
 		for token in processed_tokens:
 			if token.is_symbol:
 				if TYPE_CHECKING:
@@ -366,15 +588,16 @@ class Lexer:
 				find = self._find(token)
 				if find is None:
 					raise TokenizeError(token.position, f'Tokenize error with the symbols "{token.string}"')
-				result.extend(find)
+				yield from find
 			elif token.is_string_const:
-				result.append(token)
+				yield token
 			elif token.is_word:
-				result.append(token)
+				yield token
 			else:
 				raise TokenizeError(token.position, f'Unknown type of token')
 
-		return result
+	def tokenize(self, s: str) -> list[Token]:
+		return list(self.iter_tokens(s))
 
 class Parser:
 	LP = '('
@@ -391,6 +614,8 @@ class Parser:
 		WAIT_INFIX = 2
 
 	class SyntaxTreeNode:
+		__slots__ = ('content', 'position')
+
 		def __init__(self, content: Any, position: int):
 			self.content = content
 			self.position = position
@@ -445,13 +670,19 @@ class Parser:
 			return self._is_tuple
 
 	class WordNode(SyntaxTreeNode):
+		__slots__ = ()
+
 		_is_word = True
 
 	class StringNode(SyntaxTreeNode):
+		__slots__ = ()
+
 		_is_word = True
 		_is_str = True
 
 	class OpNode(SyntaxTreeNode):
+		__slots__ = ('_operand', )
+
 		_is_op = True
 
 		def __init__(self, symbol: str, position: int, operand: Optional[Parser.SyntaxTreeNode] = None):
@@ -473,24 +704,36 @@ class Parser:
 				return f'({self.operand}){super().__str__()}'
 
 	class InfixOPNode(OpNode):
+		__slots__ = ()
+
 		_is_infix_op = True
 
 	class PrefixOPNode(OpNode):
+		__slots__ = ()
+
 		_is_prefix_op = True
 
 	# Not in op_stack
 	class PostfixOPNode(OpNode):
+		__slots__ = ()
+
 		_is_postfix_op = True
 
 	# Not in total_stack
 	class CommaNode(SyntaxTreeNode):
+		__slots__ = ()
+
 		_is_comma = True
 
 	# Not in total_stack
 	class ParenthesesNode(SyntaxTreeNode):
+		__slots__ = ()
+
 		_is_parentheses = True
 
 	class TupleNode(SyntaxTreeNode):
+		__slots__ = ()
+
 		_is_tuple = True
 
 		def __init__(self, t: tuple[Parser.SyntaxTreeNode, ...], position: int):
@@ -503,6 +746,9 @@ class Parser:
 		imagine_re: Optional[re.Pattern[str]] = None,
 		wildcard_re: Optional[re.Pattern[str]] = None, **kwargs):
 
+		# For pickling, which builds the parser again
+		self._arguments = ((prefix_ops.copy(), postfix_ops.copy(), ptable.copy(), imagine_re, wildcard_re), kwargs.copy())
+
 		# Parser constant check
 		LP = kwargs.pop('LP', Parser.LP)
 		RP = kwargs.pop('RP', Parser.RP)
@@ -519,6 +765,16 @@ class Parser:
 		self.RP = RP
 		self.COMMA = COMMA
 
+		# Significant digits of non-integer number literals, which are exact if None (see calcs.approx)
+		# Integer literals stay exact, and become approximate in operations with approximate numbers
+		self._precision: Optional[int] = kwargs.pop('precision', None)
+
+		# Cache of parsed trees keyed by source strings; 0 disables the cache and None is unbounded
+		parse_cache_size: Optional[int] = kwargs.pop('parse_cache_size', 0)
+		self._parse_cache: Optional[LRUCache[str, TreeNodeType]] = None
+		if parse_cache_size != 0:
+			self._parse_cache = LRUCache(parse_cache_size)
+
 		# All special constants for the parser
 		self.SPECIAL = LP + RP + COMMA
 		self._special_re = re.compile(f'[{re.escape(self.SPECIAL)}]')
@@ -596,6 +852,59 @@ class Parser:
 			self._token_preprocessor_for_decimal, 
 		))
 
+		self._fingerprint = _fingerprint((
+			self._prefix_ops, self._postfix_ops, self._ptable,
+			self.imagine_re, self.wildcard_re, self.LP, self.RP, self.COMMA,
+			self._precision, parse_cache_size,
+			self._lexer.fingerprint,
+		))
+
+	# Parsers built by shared(), keyed by their arguments
+	_shared: LRUCache[str, Parser] = LRUCache(128)
+
+	@classmethod
+	def shared(cls,
+		prefix_ops: list[OperatorInfo] = [],
+		postfix_ops: list[OperatorInfo] = [],
+		ptable: list[PrecedenceLayer] | dict[int, PrecedenceLayer] = {},
+		imagine_re: Optional[re.Pattern[str]] = None,
+		wildcard_re: Optional[re.Pattern[str]] = None, **kwargs) -> Parser:
+		# The same as Parser(...), but parsers built with the same arguments are built once per process
+		# and shared, so they should not be modified.
+		# Describing the arguments is cheaper than building the tables and the lexer.
+		# Lambdas, local functions, partials and other callables which cannot be imported by name
+		# are compared by identity, so only the same objects give the same parser.
+		args = (prefix_ops, postfix_ops, ptable, imagine_re, wildcard_re)
+		return cls._shared_by_key(_fingerprint((cls, *args, kwargs)), args, kwargs)
+
+	@classmethod
+	def _shared_by_key(cls, key: str, args: tuple, kwargs: dict[str, Any]) -> Parser:
+		parser = cls._shared.get(key)
+		if parser is None:
+			parser = cls(*args, **kwargs)
+			cls._shared.put(key, parser)
+		return parser
+
+	@classmethod
+	def shared_cache_info(cls) -> CacheInfo:
+		return cls._shared.info()
+
+	@property
+	def fingerprint(self) -> str:
+		# Parsers with the same fingerprint have the same grammar and options
+		return self._fingerprint
+
+	def __reduce__(self):
+		# Pickled as its arguments, and unpickled through shared(),
+		# so a grammar is built once in every process receiving it
+		# The key of shared() goes along, so the receiver does not describe the arguments again
+		args, kwargs = self._arguments
+		key = _fingerprint((type(self), *args, kwargs))
+		if key.startswith(LOCAL_FINGERPRINT):
+			# Identities differ in the receiver
+			return (_construct, (type(self), args, kwargs))
+		return (_construct_shared, (type(self), key, args, kwargs))
+
 	def _pop_prefix(self, op_stack, total_stack):
 		while len(op_stack) > 0 and op_stack[-1]._is_prefix_op:
 			self._merge(op_stack.pop(), total_stack)
@@ -640,7 +949,7 @@ class Parser:
 					t = (n1, n2)
 				total_stack.append(TupleNode(t, n1.position))
 
-	def str_to_const(self, s: str) -> Constant | Var:
+	def str_to_const(self, s: str) -> Constant | Var | Wildcard:
 		# This method applies on a token in the parser
 		# That is, only a "word" should appear here
 		# Boolean parse
@@ -650,7 +959,7 @@ class Parser:
 			return BooleanConstant(False)
 
 		if self.wildcard_re.fullmatch(s):
-			return NumberConstant.create_dummy(Float(random.random()))
+			return Wildcard()
 
 		# Math constant parse
 		# pi...
@@ -660,10 +969,10 @@ class Parser:
 			# May be imaginary number
 			r = m.group(1)
 			if len(r) == 0:
-				return NumberConstant(I)
+				return self._number_literal(I)
 			try:
 				n = Rational(r)
-				return NumberConstant(n * I)
+				return self._number_literal(n * I)
 			except:
 				pass
 
@@ -671,14 +980,19 @@ class Parser:
 		try:
 			# Every real number can be given must be rational
 			n = Rational(s)
-			return NumberConstant(n)
+			return self._number_literal(n)
 		except:
 			pass
 
 		return Var(s)
 
-	def _token_preprocessor_for_decimal(self, first: Sequence[Token]) -> Sequence[Token]:
-		second: list[Token] = []
+	def _number_literal(self, n: Expr) -> NumberConstant:
+		if self._precision is not None and not n.is_Integer:
+			return NumberConstant(to_approx(n, self._precision))
+		return NumberConstant(n)
+
+	def _token_preprocessor_for_decimal(self, first: Iterable[Token]) -> Iterator[Token]:
+		# Streaming: only two tokens are looked ahead
 		fill = [Token('', -1), Token('', -1)]
 		processed = -1
 		for i, (t1, t2, t3) in enumerate(sliding_window(chain(first, fill), 3)):
@@ -705,77 +1019,114 @@ class Parser:
 							s1 = s1.lstrip('0')
 							if len(s1) == 0:
 								s1 = '0'
-							second.append(WordToken(f'{s1}{s2}{s3}', i1, f'{o1}{o2}{o3}'))
+							yield WordToken(f'{s1}{s2}{s3}', i1, f'{o1}{o2}{o3}')
 							processed = i + 2
 							continue
 
-			second.append(t1)
+			yield t1
 			processed = i
 
-		return second
+	def _resolve_operator(self, op_node: SyntaxTreeNode, position: int, operand: SyntaxTreeNode) -> tuple[type[Operator], tuple[Parser.SyntaxTreeNode, ...]]:
+		# Find the operator class and the operand nodes of an operator node
+		if op_node.is_prefix_op or op_node.is_postfix_op:
+			# prefix
+			ary: int
+			operands_node: tuple[Parser.SyntaxTreeNode, ...]
+			if not operand.is_tuple:
+				ary = 1
+				operands_node = (operand, )
+			else:
+				if TYPE_CHECKING:
+					assert isinstance(operand, Parser.TupleNode)
+
+				operands_node = operand.content
+				ary = len(operands_node)
 
-	def _to_semantic_tree(self, node: SyntaxTreeNode) -> TreeNodeType:
-		if node.is_str:
-			return StringConstant(node.content)
-		elif node.is_word:
-			return self.str_to_const(node.content)
-		elif node.is_op:
-			if TYPE_CHECKING:
-				assert isinstance(node, Parser.OpNode)
-
-			operand = node.operand
-			if operand is None:
-				raise ParseError(node.position, 'Unknown error: Operator with no operand')
-
-			if node.is_prefix_op or node.is_postfix_op:
-				# prefix
-				ary: int
-				operands_node: tuple[Parser.SyntaxTreeNode, ...]
-				if not operand.is_tuple:
-					ary = 1
-					operands_node = (operand, )
-				else:
-					if TYPE_CHECKING:
-						assert isinstance(operand, Parser.TupleNode)
+			if op_node.is_prefix_op:
+				if ary not in self._prefix_table[op_node.content]:
+					raise ParseError(position, f'Prefix operator {op_node.content} is not {ary}-ary')
 
-					operands_node = operand.content
-					ary = len(operands_node)
+				return self._prefix_table[op_node.content][ary], operands_node
+			else:
+				if ary not in self._postfix_table[op_node.content]:
+					raise ParseError(position, f'Postfix operator {op_node.content} is not {ary}-ary')
 
-				if node.is_prefix_op:
-					if ary not in self._prefix_table[node.content]:
-						raise ParseError(node.position, f'Prefix operator {node.content} is not {ary}-ary')
+				return self._postfix_table[op_node.content][ary], operands_node
+		else:
+			# infix
+			if not operand.is_tuple:
+				raise ParseError(position, 'Unknown error: Infix operator has only one operand')
 
-					operands = [self._to_semantic_tree(subn) for subn in operands_node]
-					op = self._prefix_table[node.content][ary]
-				else:
-					if ary not in self._postfix_table[node.content]:
-						raise ParseError(node.position, f'Postfix operator {node.content} is not {ary}-ary')
+			if TYPE_CHECKING:
+				assert isinstance(operand, Parser.TupleNode)
 
-					operands = [self._to_semantic_tree(subn) for subn in operands_node]
-					op = self._postfix_table[node.content][ary]
-			else:
-				# infix
-				if not operand.is_tuple:
-					raise ParseError(node.position, 'Unknown error: Infix operator has only one operand')
+			t = operand.content
+			if len(t) != 2:
+				raise ParseError(position, f'Unknown error: Infix operator has {len(t)} operand')
 
+			return self._infix_table[op_node.content], t
+
+	def _to_semantic_tree(self, node: SyntaxTreeNode) -> TreeNodeType:
+		# Post-order traversal with an explicit stack, so deep trees do not hit the recursion limit.
+		# An entry with an operator class means its operands have been converted.
+		results: list[TreeNodeType] = []
+		stack: list[tuple[Parser.SyntaxTreeNode, Optional[type[Operator]], int]] = [(node, None, 0)]
+		while len(stack) > 0:
+			node, op, n = stack.pop()
+			if op is not None:
+				operands = results[len(results) - n:]
+				del results[len(results) - n:]
+				results.append(op(*operands))
+			elif node.is_str:
+				results.append(StringConstant(node.content))
+			elif node.is_word:
+				results.append(self.str_to_const(node.content))
+			elif node.is_op:
 				if TYPE_CHECKING:
-					assert isinstance(operand, Parser.TupleNode)
+					assert isinstance(node, Parser.OpNode)
 
-				t = operand.content
-				if len(t) != 2:
-					raise ParseError(node.position, f'Unknown error: Infix operator has {len(t)} operand')
+				operand = node.operand
+				if operand is None:
+					raise ParseError(node.position, 'Unknown error: Operator with no operand')
 
-				operands = [self._to_semantic_tree(subn) for subn in t]
-				op = self._infix_table[node.content]
+				op, operands_node = self._resolve_operator(node, node.position, operand)
+				stack.append((node, op, len(operands_node)))
+				stack.extend((subn, None, 0) for subn in reversed(operands_node))
+			else:
+				raise ParseError(node.position, f'Unknown error: Invalid for semantic trees {type(node)}: {node}')
 
-			return op(*operands)
-		else:
-			raise ParseError(node.position, f'Unknown error: Invalid for semantic trees {type(node)}: {node}')
+		return results[0]
+
+	@property
+	def lexer(self) -> Lexer:
+		return self._lexer
 
 	def is_op_symbol(self, s: str) -> bool:
 		return s in self._op_symbols
 
+	@property
+	def parse_cache_info(self) -> Optional[CacheInfo]:
+		if self._parse_cache is None:
+			return None
+		return self._parse_cache.info()
+
+	def clear_parse_cache(self):
+		if self._parse_cache is not None:
+			self._parse_cache.clear()
+
 	def parse(self, s: str) -> TreeNodeType:
+		# Trees are immutable, so a cached tree is shared by every caller
+		cache = self._parse_cache
+		if cache is None:
+			return self._parse(s)
+
+		tree = cache.get(s)
+		if tree is None:
+			tree = self._parse(s)
+			cache.put(s, tree)
+		return tree
+
+	def _parse(self, s: str) -> TreeNodeType:
 		LP= self.LP
 		RP = self.RP
 		COMMA = self.COMMA
@@ -790,7 +1141,7 @@ class Parser:
 		ParenthesesNode = self.ParenthesesNode
 		TupleNode = self.TupleNode
 
-		tokens = self._lexer.tokenize(s)
+		tokens = self._lexer.iter_tokens(s)
 		status = S.INITIAL
 
 		op_stack: list[Parser.SyntaxTreeNode] = []
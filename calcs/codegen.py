@@ -0,0 +1,202 @@
+from .types import *
+from .types import RECURSIVE_EVAL_DEPTH
+from .op_basic import *
+from .op_basic import _BinaryBoolOperator
+from collections.abc import Callable, MutableMapping
+from typing import Any, Optional
+import ast
+import builtins
+
+__all__ = (
+	'generate',
+	'compile',
+)
+
+'''
+The tree is translated into a Python function
+	def _calcs_expr(mapping, kwargs): ...
+whose body is straight-line code: every node stores its value in a local variable
+in post-order, so the generated code does not nest however deep the tree is.
+Integer arithmetic and comparisons are inlined as Python expressions on the native values
+(see NumberConstant), guarded by checks falling back to the apply() methods of the operators
+for other values and in the approximate mode. Other strict operators are called through apply().
+The shortcut Boolean operators and IfThenElseOperator become if-statements to keep their laziness,
+with their logic inlined. Other operators are handed to the tree interpreter.
+Constants, variables and operator methods are passed by the global namespace of the code.
+'''
+
+FUNCTION_NAME = '_calcs_expr'
+
+def _to_bool(value: Value) -> bool:
+	return Operator.extract_constant(value).to_bool().value
+
+# The expressions of operators on native integers, which give what their apply() methods give
+# for native integers in the exact mode, and the constant types of the results
+_INLINE: dict[type[Operator], tuple[str, type[Constant]]] = {
+	PlusOperator: ('{} + {}', NumberConstant),
+	MinusOperator: ('{} - {}', NumberConstant),
+	MultipleOperator: ('{} * {}', NumberConstant),
+	NegativeOperator: ('-{}', NumberConstant),
+	LessOperator: ('{} < {}', BooleanConstant),
+	LeOperator: ('{} <= {}', BooleanConstant),
+	GreaterOperator: ('{} > {}', BooleanConstant),
+	GeOperator: ('{} >= {}', BooleanConstant),
+	EqualOperator: ('{} == {}', BooleanConstant),
+	NonequalOperator: ('{} != {}', BooleanConstant),
+}
+
+def _may_be_native(node: TreeNodeType) -> bool:
+	# Constants are known; other nodes are checked when the code runs
+	return not isinstance(node, Constant) or (type(node) is NumberConstant and node.is_native)
+
+def _shortcut(node: _BinaryBoolOperator) -> Optional[tuple[bool, bool, bool]]:
+	# (a, result, negated): the second operand is only evaluated if the first one is a,
+	# otherwise the result is decided; the second operand gives the result, negated or not.
+	# None if the logic of the operator is not of this form.
+	undecided = [a for a in (True, False) if node._logic(a) is None]
+	if len(undecided) != 1:
+		return None
+
+	a, = undecided
+	result = node._logic(not a)
+	if type(result) is not bool:
+		return None
+	elif node._logic(a, True) is True and node._logic(a, False) is False:
+		return (a, result, False)
+	elif node._logic(a, True) is False and node._logic(a, False) is True:
+		return (a, result, True)
+	return None
+
+class _Generator:
+	def __init__(self):
+		self.namespace: dict[str, Any] = {
+			'BooleanConstant': BooleanConstant,
+			'LValue': LValue,
+			'NumberConstant': NumberConstant,
+			'evaluate': evaluate,
+			'_to_bool': _to_bool,
+		}
+		self.lines: list[str] = []
+		self._counter = 0
+
+	def bind(self, obj: Any, prefix: str) -> str:
+		self._counter += 1
+		name = f'{prefix}{self._counter}'
+		self.namespace[name] = obj
+		return name
+
+	def temp(self) -> str:
+		self._counter += 1
+		return f'_t{self._counter}'
+
+	def line(self, indent: int, s: str):
+		self.lines.append('\t' * indent + s)
+
+	def native(self, node: TreeNodeType, name: str, indent: int) -> tuple[str, list[str]]:
+		# The expression of the native integer of the value of the node held by name,
+		# valid under the conditions
+		if isinstance(node, Constant):
+			# @Pre _may_be_native(node)
+			return (repr(node.native), [])
+
+		c = self.temp()
+		self.line(indent, f'{c} = {name}._content if type({name}) is LValue else {name}')
+		return (f'{c}._value', [f'type({c}) is NumberConstant', f'type({c}._value) is int'])
+
+	def boolean(self, name: str) -> str:
+		# The expression of the Boolean value of the value held by name
+		return f'({name}._value if type({name}) is BooleanConstant else _to_bool({name}))'
+
+	def emit(self, node: TreeNodeType, indent: int) -> str:
+		# Returns the name holding the value of the node
+		if node._depth >= RECURSIVE_EVAL_DEPTH:
+			# Keep the generator itself from deep recursion
+			n, t = self.bind(node, '_n'), self.temp()
+			self.line(indent, f'{t} = evaluate({n}, mapping, **kwargs)')
+			return t
+		elif isinstance(node, Constant):
+			return self.bind(node, '_c')
+		elif isinstance(node, Var):
+			v, t = self.bind(node, '_v'), self.temp()
+			self.line(indent, 'try:')
+			self.line(indent + 1, f'{t} = mapping[{v}]')
+			self.line(indent, 'except KeyError:')
+			self.line(indent + 1, f'{t} = {v}.eval(mapping, **kwargs)')
+			return t
+		elif isinstance(node, Operator):
+			if node._strict:
+				args = [self.emit(o, indent) for o in node._operands]
+				a, t = self.bind(node.apply, '_a'), self.temp()
+				call = f'{t} = {a}(mapping, {"".join(f"{arg}, " for arg in args)}**kwargs)'
+
+				if type(node) in _INLINE and all(_may_be_native(o) for o in node._operands):
+					natives = [self.native(o, arg, indent) for o, arg in zip(node._operands, args)]
+					expression, result = _INLINE[type(node)]
+					conditions = ['exact'] + [c for v in natives for c in v[1]]
+					self.line(indent, f'if {" and ".join(conditions)}:')
+					self.line(indent + 1, f'{t} = {result.__name__}({expression.format(*(v[0] for v in natives))})')
+					self.line(indent, 'else:')
+					self.line(indent + 1, call)
+					return t
+
+				self.line(indent, call)
+				return t
+			elif isinstance(node, _BinaryBoolOperator) and node._shortcut and (logic := _shortcut(node)) is not None:
+				# Same as _BinaryBoolOperator.eval with shortcuts
+				undecided, result, negated = logic
+				x = self.emit(node._operands[0], indent)
+				t = self.temp()
+				self.line(indent, f'if {"" if undecided else "not "}{self.boolean(x)}:')
+				y = self.emit(node._operands[1], indent + 1)
+				self.line(indent + 1, f'{t} = BooleanConstant({"not " if negated else ""}{self.boolean(y)})')
+				self.line(indent, 'else:')
+				self.line(indent + 1, f'{t} = BooleanConstant({result})')
+				return t
+			elif isinstance(node, _BinaryBoolOperator) and node._shortcut:
+				# Same as _BinaryBoolOperator.eval with shortcuts
+				x = self.emit(node._operands[0], indent)
+				logic, a, t = self.bind(node._logic, '_l'), self.temp(), self.temp()
+				self.line(indent, f'{a} = _to_bool({x})')
+				self.line(indent, f'{t} = {logic}({a})')
+				self.line(indent, f'if {t} is None:')
+				y = self.emit(node._operands[1], indent + 1)
+				self.line(indent + 1, f'{t} = {logic}({a}, _to_bool({y}))')
+				self.line(indent, f'{t} = BooleanConstant({t})')
+				return t
+			elif isinstance(node, IfThenElseOperator):
+				# Same as IfThenElseOperator.eval
+				x = self.emit(node._operands[0], indent)
+				t = self.temp()
+				self.line(indent, f'if _to_bool({x}):')
+				y = self.emit(node._operands[1], indent + 1)
+				self.line(indent + 1, f'{t} = {y}')
+				self.line(indent, 'else:')
+				z = self.emit(node._operands[2], indent + 1)
+				self.line(indent + 1, f'{t} = {z}')
+				return t
+
+		# Wildcards and other operators
+		n, t = self.bind(node, '_n'), self.temp()
+		self.line(indent, f'{t} = {n}.eval(mapping, **kwargs)')
+		return t
+
+def generate(tree: TreeNodeType) -> tuple[ast.Module, dict[str, Any]]:
+	# The module and the global namespace it should be executed in
+	g = _Generator()
+	g.line(1, "exact = kwargs.get('precision') is None")
+	result = g.emit(tree, 1)
+	g.line(1, f'return {result}')
+	source = f'def {FUNCTION_NAME}(mapping, kwargs):\n' + '\n'.join(g.lines) + '\n'
+	return ast.parse(source), g.namespace
+
+def compile(tree: TreeNodeType) -> Callable[..., Value]:
+	# compile(tree)(mapping, **kwargs) gives the same result as tree.eval(mapping, **kwargs)
+	module, namespace = generate(tree)
+	code = builtins.compile(module, '<calcs>', 'exec')
+	exec(code, namespace)
+	function = namespace[FUNCTION_NAME]
+
+	def compiled(mapping: MutableMapping[Var, LValue], **kwargs) -> Value:
+		return function(mapping, kwargs)
+
+	return compiled
@@ -0,0 +1,129 @@
+from .types import *
+from .types import RECURSIVE_EVAL_DEPTH
+from .op_basic import IfThenElseOperator, _BinaryBoolOperator
+from collections.abc import Callable, MutableMapping
+from typing import Any
+
+__all__ = (
+	'compile',
+)
+
+# A compiled node takes the mapping and the keyword arguments of eval() as a dict,
+# so no dict is rebuilt between nodes.
+CompiledNode = Callable[[MutableMapping[Var, LValue], dict[str, Any]], Value]
+
+extract_constant = Operator.extract_constant
+
+def _compile_constant(node: Constant) -> CompiledNode:
+	def run(mapping, kwargs):
+		return node
+
+	return run
+
+def _compile_var(node: Var) -> CompiledNode:
+	def run(mapping, kwargs):
+		try:
+			return mapping[node]
+		except KeyError:
+			# Undefined or anonymous variables
+			return node.eval(mapping, **kwargs)
+
+	return run
+
+def _compile_interpreted(node: TreeNodeType) -> CompiledNode:
+	def run(mapping, kwargs):
+		return node.eval(mapping, **kwargs)
+
+	return run
+
+def _compile_deep(node: TreeNodeType) -> CompiledNode:
+	def run(mapping, kwargs):
+		return evaluate(node, mapping, **kwargs)
+
+	return run
+
+def _compile_strict(node: Operator) -> CompiledNode:
+	apply = node.apply
+	fs = [_compile(o) for o in node._operands]
+
+	match len(fs):
+		case 0:
+			def run(mapping, kwargs):
+				return apply(mapping, **kwargs)
+		case 1:
+			f0, = fs
+			def run(mapping, kwargs):
+				return apply(mapping, f0(mapping, kwargs), **kwargs)
+		case 2:
+			f0, f1 = fs
+			def run(mapping, kwargs):
+				return apply(mapping, f0(mapping, kwargs), f1(mapping, kwargs), **kwargs)
+		case 3:
+			f0, f1, f2 = fs
+			def run(mapping, kwargs):
+				return apply(mapping, f0(mapping, kwargs), f1(mapping, kwargs), f2(mapping, kwargs), **kwargs)
+		case _:
+			def run(mapping, kwargs):
+				return apply(mapping, *[f(mapping, kwargs) for f in fs], **kwargs)
+
+	return run
+
+def _compile_shortcut(node: _BinaryBoolOperator) -> CompiledNode:
+	# Same as _BinaryBoolOperator.eval with shortcuts
+	logic = node._logic
+	f0, f1 = [_compile(o) for o in node._operands]
+
+	def run(mapping, kwargs):
+		a = extract_constant(f0(mapping, kwargs)).to_bool()
+		result = logic(a.value)
+
+		if result is not None:
+			return BooleanConstant(result)
+
+		b = extract_constant(f1(mapping, kwargs)).to_bool()
+		return BooleanConstant(logic(a.value, b.value))
+
+	return run
+
+def _compile_if_then_else(node: IfThenElseOperator) -> CompiledNode:
+	# Same as IfThenElseOperator.eval
+	f0, f1, f2 = [_compile(o) for o in node._operands]
+
+	def run(mapping, kwargs):
+		a = extract_constant(f0(mapping, kwargs)).to_bool()
+
+		if a.value:
+			return f1(mapping, kwargs)
+		else:
+			return f2(mapping, kwargs)
+
+	return run
+
+def _compile(node: TreeNodeType) -> CompiledNode:
+	if node._depth >= RECURSIVE_EVAL_DEPTH:
+		# Compiled nodes call each other recursively, so deep trees stay in the interpreter
+		return _compile_deep(node)
+	elif isinstance(node, Constant):
+		return _compile_constant(node)
+	elif isinstance(node, Var):
+		return _compile_var(node)
+	elif isinstance(node, Operator):
+		if node._strict:
+			return _compile_strict(node)
+		elif isinstance(node, _BinaryBoolOperator) and node._shortcut:
+			return _compile_shortcut(node)
+		elif isinstance(node, IfThenElseOperator):
+			return _compile_if_then_else(node)
+
+	# Wildcards and non-strict operators
+	return _compile_interpreted(node)
+
+def compile(tree: TreeNodeType) -> Callable[..., Value]:
+	# Turn a tree into nested closures with the operator dispatch resolved once.
+	# compile(tree)(mapping, **kwargs) gives the same result as tree.eval(mapping, **kwargs).
+	run = _compile(tree)
+
+	def compiled(mapping: MutableMapping[Var, LValue], **kwargs) -> Value:
+		return run(mapping, kwargs)
+
+	return compiled
@@ -0,0 +1,212 @@
+from .approx import DOUBLE_PRECISION
+from .types import *
+from .ops import UnaryOperator
+from .op_basic import (
+	DivideOperator,
+	GeOperator,
+	GreaterOperator,
+	LeOperator,
+	LessOperator,
+	MinusOperator,
+	MultipleOperator,
+	NegativeOperator,
+	PlusOperator,
+	PositiveOperator,
+	ProductOperator,
+	SumOperator,
+)
+from .op_num import AbsOperator, ImagOperator, PowOperator, RealOperator
+from .op_utils import ReverseOperator
+from .utils import LRUCache
+from collections.abc import Callable, Hashable
+from sympy import Abs, Add, Expr, Ge, Gt, im, Le, lambdify, Lt, Mul, re, S, Symbol
+from typing import Any, Optional
+import operator
+
+__all__ = (
+	'NumericKernelOperator',
+	'compile_kernels',
+)
+
+'''
+Subtrees of arithmetic, powers, abs, real, imag and comparisons over number variables
+are translated into SymPy expressions and compiled with sympy.lambdify for the math module,
+so evaluating such a subtree is one call of a Python function on floats and complex numbers
+instead of a NumberConstant for every operator.
+This is opt-in: compile_kernels(tree) puts NumericKernelOperator above those subtrees,
+and the rest of the tree stays exact.
+
+The results of kernels are approximate, like eval(mapping, precision = 15) (see calcs.approx),
+but SymPy canonicalizes the expression when translating it: terms may be reordered and collected,
+so the last digits can differ, and "x - x" is 0 and "x / x" is 1 even if x is not finite or zero.
+If a variable is not a number, or the kernel fails (e.g. division by zero, overflow or
+comparing complex numbers), the subtree is evaluated in the approximate mode instead.
+'''
+
+# Translations of the operators into SymPy
+_NUMERIC: dict[type[Operator], Callable[..., Expr]] = {
+	PlusOperator: operator.add,
+	MinusOperator: operator.sub,
+	MultipleOperator: operator.mul,
+	DivideOperator: operator.truediv,
+	SumOperator: Add,
+	ProductOperator: Mul,
+	PowOperator: operator.pow,
+	NegativeOperator: operator.neg,
+	PositiveOperator: lambda a: a,
+	AbsOperator: Abs,
+	RealOperator: re,
+	ImagOperator: im,
+}
+
+# Comparisons give Boolean values, so they are only the roots of kernels
+_COMPARISON: dict[type[Operator], Callable[..., Expr]] = {
+	LessOperator: Lt,
+	LeOperator: Le,
+	GreaterOperator: Gt,
+	GeOperator: Ge,
+}
+
+# The math module has no re and im, and math.sqrt rejects negative numbers
+# where the approximate mode gives complex numbers
+_MODULES = [{
+	're': lambda z: z.real,
+	'im': lambda z: z.imag,
+	'sqrt': lambda z: z ** 0.5,
+}, 'math']
+
+# (The function, the variables of its arguments); the function is None if the subtree has no kernel
+Kernel = tuple[Optional[Callable[..., Any]], tuple[Var, ...]]
+
+# Compiled functions keyed by expressions, so equal subtrees are compiled once
+_functions: LRUCache[Expr, Callable[..., Any]] = LRUCache(256)
+
+def _translate(tree: TreeNodeType) -> tuple[Expr, tuple[Var, ...]]:
+	# The expression with a symbol for every distinct variable, and the variables in order
+	symbols: dict[Hashable, Symbol] = {}
+	variables: list[Var] = []
+	results: list[Expr] = []
+	stack: list[tuple[TreeNodeType, bool]] = [(tree, False)]
+	while len(stack) > 0:
+		node, ready = stack.pop()
+		if ready:
+			assert isinstance(node, Operator)
+			n = len(node._operands)
+			operands = results[len(results) - n:]
+			del results[len(results) - n:]
+			results.append((_NUMERIC | _COMPARISON)[type(node)](*operands))
+		elif isinstance(node, Operator):
+			stack.append((node, True))
+			stack.extend((o, False) for o in reversed(node._operands))
+		elif isinstance(node, Var):
+			key = (node.name, id(node.scope))
+			if key not in symbols:
+				symbols[key] = Symbol(f'_{len(variables)}')
+				variables.append(node)
+			results.append(symbols[key])
+		else:
+			assert isinstance(node, NumberConstant)
+			results.append(node.value)
+
+	return results[0], tuple(variables)
+
+def _compile(tree: TreeNodeType) -> Kernel:
+	expr, variables = _translate(tree)
+	if expr.has(S.ComplexInfinity, S.Infinity, S.NegativeInfinity, S.NaN):
+		# SymPy found a division by zero; the approximate mode decides
+		return None, variables
+
+	function = _functions.get(expr)
+	if function is None:
+		symbols = [Symbol(f'_{i}') for i in range(len(variables))]
+		function = lambdify(symbols, expr, _MODULES)
+		_functions.put(expr, function)
+
+	return function, variables
+
+# Evaluates the numeric subtree below with a function compiled at the first evaluation
+class NumericKernelOperator(UnaryOperator):
+	_effects = Effect.READS_VARS | Effect.MAY_RAISE
+	_kernel: Optional[Kernel] = None
+
+	def eval(self, mapping, **kwargs):
+		if self._kernel is None:
+			self._kernel = _compile(self._operands[0])
+
+		function, variables = self._kernel
+		if function is None:
+			return self._fallback(mapping, kwargs)
+
+		args = []
+		for var in variables:
+			a = self.extract_constant(var.eval(mapping, **kwargs))
+			if not a.is_number or (v := a.approx(DOUBLE_PRECISION)) is None:
+				return self._fallback(mapping, kwargs)
+			args.append(v)
+
+		try:
+			result = function(*args)
+		except (ArithmeticError, TypeError, ValueError):
+			return self._fallback(mapping, kwargs)
+
+		if type(result) is bool:
+			return BooleanConstant(result)
+		return NumberConstant(result)
+
+	def _fallback(self, mapping, kwargs):
+		return evaluate(self._operands[0], mapping, **(kwargs | {'precision': DOUBLE_PRECISION}))
+
+	def __getstate__(self):
+		# Compiled functions are not picklable; they are compiled again
+		state = self.__dict__.copy()
+		state.pop('_kernel', None)
+		return state
+
+def compile_kernels(tree: TreeNodeType) -> TreeNodeType:
+	# Put a NumericKernelOperator above every largest subtree of numeric operators, number constants
+	# and variables, which has at least an operator and a variable, optionally under a comparison.
+	# Subtrees of constants are left to fold_constants.
+	# The input tree is not modified.
+
+	# (The new node, whether it is numeric, whether it is a comparison, whether it has a variable)
+	results: list[tuple[TreeNodeType, bool, bool, bool]] = []
+	stack: list[tuple[TreeNodeType, bool]] = [(tree, False)]
+	while len(stack) > 0:
+		node, ready = stack.pop()
+		if not ready:
+			if isinstance(node, ReverseOperator):
+				# It looks into the operand node, which should be kept as it is
+				results.append((node, False, False, False))
+			elif isinstance(node, Operator):
+				stack.append((node, True))
+				stack.extend((o, False) for o in reversed(node._operands))
+			else:
+				results.append((node, isinstance(node, (NumberConstant, Var)), False, isinstance(node, Var)))
+			continue
+
+		assert isinstance(node, Operator)
+		n = len(node._operands)
+		operands = results[len(results) - n:]
+		del results[len(results) - n:]
+
+		numeric = all(o[1] for o in operands)
+		has_var = any(o[3] for o in operands)
+		if numeric and type(node) in _NUMERIC:
+			# Kept for the operator above, which may be numeric as well
+			results.append((node, True, False, has_var))
+			continue
+		elif numeric and type(node) in _COMPARISON:
+			results.append((node, False, True, has_var))
+			continue
+
+		new_operands = [_wrap(*o) for o in operands]
+		if any(new is not old for new, old in zip(new_operands, node._operands)):
+			node = type(node)(*new_operands)
+		results.append((node, False, False, has_var))
+
+	return _wrap(*results[0])
+
+def _wrap(node: TreeNodeType, numeric: bool, comparison: bool, has_var: bool) -> TreeNodeType:
+	if (numeric or comparison) and has_var and isinstance(node, Operator):
+		return NumericKernelOperator(node)
+	return node
@@ -3,8 +3,9 @@ from .ops import BinaryOperator
 from .utils import filter_operator
 
 class AssignOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_operands(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.WRITES_VARS | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, **kwargs):
 		b = self.extract_constant(b)
 
 		if not a.is_lvalue:
@@ -14,6 +15,7 @@ class AssignOperator(BinaryOperator):
 		return a
 
 class DeclareOperator(BinaryOperator):
+	_effects = Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE
 	def eval(self, mapping, **kwargs):
 		a = self._operands[0]
 		if isinstance(a, Var):
@@ -32,6 +34,7 @@ class DeclareOperator(BinaryOperator):
 		raise ValueError('A variable name is needed')
 
 class DeclareReferenceOperator(BinaryOperator):
+	_effects = Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE
 	def eval(self, mapping, **kwargs):
 		a = self._operands[0]
 		if isinstance(a, Var):
@@ -1,13 +1,23 @@
+from .approx import ApproxType
 from .types import *
-from .ops import BinaryOperator, TernaryOperator, UnaryOperator
+from .ops import BinaryOperator, NaryOperator, TernaryOperator, UnaryOperator
 from .utils import filter_operator
-from sympy import Eq, Expr, Ne
+from functools import reduce
+from sympy import Add, Eq, Expr, Float, Ne, Number
 from typing import Optional, overload
+import math
+import operator
 
 class PlusOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.PURE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, b, **kwargs):
+		return self._add(*self.extract_constants(a, b), kwargs.get('precision'))
 
+	@staticmethod
+	def _add(a: Constant, b: Constant, precision: Optional[int] = None) -> Constant:
 		if a.is_str or b.is_str:
 			a, b = a.to_str(), b.to_str()
 			return StringConstant(a.value + b.value)
@@ -15,11 +25,19 @@ class PlusOperator(BinaryOperator):
 			return BooleanConstant(a.value or b.value)
 		else:
 			a, b = a.to_number(), b.to_number()
+			if (v := approximate(precision, a, b)) is not None:
+				return NumberConstant(v[0] + v[1])
+			elif a.is_native and b.is_native:
+				return NumberConstant(a.native + b.native)
 			return NumberConstant(a.value + b.value)
 
 class MinusOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		if a.is_str or b.is_str:
 			raise ValueError('Invalid string subtraction')
@@ -27,12 +45,22 @@ class MinusOperator(BinaryOperator):
 			return BooleanConstant(a.value and not b.value)
 		else:
 			a, b = a.to_number(), b.to_number()
+			if (v := approximate(kwargs.get('precision'), a, b)) is not None:
+				return NumberConstant(v[0] - v[1])
+			elif a.is_native and b.is_native:
+				return NumberConstant(a.native - b.native)
 			return NumberConstant(a.value - b.value)
 
 class MultipleOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, b, **kwargs):
+		return self._multiply(*self.extract_constants(a, b), kwargs.get('precision'))
 
+	@staticmethod
+	def _multiply(a: Constant, b: Constant, precision: Optional[int] = None) -> Constant:
 		if a.is_str or b.is_str:
 			# a:num/bool b:str
 			if a.is_str:
@@ -54,38 +82,131 @@ class MultipleOperator(BinaryOperator):
 			return BooleanConstant(a.value and b.value)
 		else:
 			a, b = a.to_number(), b.to_number()
+			if (v := approximate(precision, a, b)) is not None:
+				return NumberConstant(v[0] * v[1])
+			elif a.is_native and b.is_native:
+				return NumberConstant(a.native * b.native)
 			return NumberConstant(a.value * b.value)
 
+'''
+The n-ary forms of left-leaning chains of "+" and "*", built by calcs.optimize.flatten_associative.
+When every operand is a number, the SymPy values are combined directly,
+without a NumberConstant for every intermediate sum or product.
+Sums with symbolic terms are handed to SymPy in one Add(...), which canonicalizes once
+instead of at every step, but only without floats: SymPy would sum the floats in another
+order than the pairwise sums. Products go pairwise, since SymPy distributes a number over
+a sum only in a product of two factors, so Mul(...) could give another form of the result.
+Approximate numbers are summed and multiplied in order, like the binary operators.
+Strings and Boolean values have their own rules and go through the binary operators.
+'''
+class SumOperator(NaryOperator):
+	_strict = True
+	_effects = Effect.PURE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, *args, **kwargs):
+		args = self.extract_constants(*args)
+		precision = kwargs.get('precision')
+
+		if all(a.is_number and a.is_native for a in args) and precision is None:
+			return NumberConstant(sum(a.native for a in args))
+		elif all(a.is_number for a in args):
+			if (approx := approximate(precision, *args)) is not None:
+				return NumberConstant(reduce(operator.add, approx))
+
+			values = [a.value for a in args]
+			if not all(isinstance(v, Number) for v in values) and not any(v.has(Float) for v in values):
+				return NumberConstant(Add(*values))
+
+			return NumberConstant(reduce(operator.add, values))
+
+		return reduce(lambda a, b: PlusOperator._add(a, b, precision), args)
+
+class ProductOperator(NaryOperator):
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, *args, **kwargs):
+		args = self.extract_constants(*args)
+		precision = kwargs.get('precision')
+
+		if all(a.is_number and a.is_native for a in args) and precision is None:
+			return NumberConstant(reduce(operator.mul, (a.native for a in args)))
+		elif all(a.is_number for a in args):
+			if (approx := approximate(precision, *args)) is not None:
+				return NumberConstant(reduce(operator.mul, approx))
+			return NumberConstant(reduce(operator.mul, (a.value for a in args)))
+
+		return reduce(lambda a, b: MultipleOperator._multiply(a, b, precision), args)
+
 class DivideOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		if a.is_number and b.is_number:
+			# Division by zero is left to SymPy, which gives the complex infinity
+			if (v := approximate(kwargs.get('precision'), a, b)) is not None and v[1] != 0:
+				return NumberConstant(v[0] / v[1])
+			elif a.is_native and b.is_native and b.native != 0 and a.native % b.native == 0:
+				return NumberConstant(a.native // b.native)
 			return NumberConstant(a.value / b.value)
 		else:
 			raise ValueError('Invalid type division')
 
+def _approximate_real(precision: Optional[int], a: NumberConstant, b: NumberConstant) -> Optional[list[ApproxType]]:
+	# Floor division and modulo are only for real numbers
+	v = approximate(precision, a, b)
+	if v is None or v[0].imag != 0 or v[1].imag != 0:
+		return None
+	return [v[0].real, v[1].real]
+
+def _floor(value: ApproxType) -> ApproxType:
+	if type(value) is float:
+		return float(math.floor(value))
+	return value.context.floor(value)
+
 class IntegerDivideOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		if a.is_number and b.is_number:
+			if (v := _approximate_real(kwargs.get('precision'), a, b)) is not None and v[1] != 0:
+				return NumberConstant(_floor(v[0] / v[1]))
+			elif a.is_native and b.is_native and b.native != 0:
+				return NumberConstant(a.native // b.native)
 			return NumberConstant(a.value // b.value)
 		else:
 			raise ValueError('Invalid type division')
 
 class ModuloOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		if a.is_number and b.is_number:
+			if (v := _approximate_real(kwargs.get('precision'), a, b)) is not None and v[1] != 0:
+				return NumberConstant(v[0] % v[1])
+			elif a.is_native and b.is_native and b.native != 0:
+				return NumberConstant(a.native % b.native)
 			return NumberConstant(a.value % b.value)
 		else:
 			raise ValueError('Invalid type division')
 
 class PositiveOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if a.is_number:
 			return a.without_dummy()
@@ -93,17 +214,29 @@ class PositiveOperator(UnaryOperator):
 			raise ValueError('Only positive number')
 
 class NegativeOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if a.is_number:
+			if (v := approximate(kwargs.get('precision'), a)) is not None:
+				return NumberConstant(-v[0])
+			elif a.is_native:
+				return NumberConstant(-a.native)
 			return NumberConstant(-a.value)
 		else:
 			raise ValueError('Only negative number')
 
 class NotOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.PURE
+	_safe_operands = (Constant,)
+	_result_type = BooleanConstant
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if a.is_bool:
 			return BooleanConstant(not a.value)
@@ -112,7 +245,11 @@ class NotOperator(UnaryOperator):
 			return BooleanConstant(not a.value)
 
 class _BinaryBoolOperator(BinaryOperator):
+	_effects = Effect.PURE
+	_safe_operands = (Constant,)
+	_result_type = BooleanConstant
 	_shortcut: bool = True
+	_conditional = True
 
 	def eval(self, mapping, **kwargs):
 		if self._shortcut:
@@ -125,10 +262,29 @@ class _BinaryBoolOperator(BinaryOperator):
 			b = self.eval_and_extract_constant(1, mapping, **kwargs).to_bool()
 			return BooleanConstant(self._logic(a.value, b.value))
 		else:
-			a, b = self.eval_and_extract_constants(mapping, **kwargs)
+			return super().eval(mapping, **kwargs)
 
-			a, b = a.to_bool(), b.to_bool()
-			return BooleanConstant(self._logic(a.value, b.value))
+	def _select(self, values):
+		# Same as eval
+		if len(values) == 0:
+			return 0
+		elif len(values) == 1 and not (self._shortcut and self._logic(self._to_bool(values[0])) is not None):
+			return 1
+		return None
+
+	def _conclude(self, values):
+		return BooleanConstant(self._logic(*(self._to_bool(v) for v in values)))
+
+	@classmethod
+	def _to_bool(cls, value: Value) -> bool:
+		return cls.extract_constant(value).to_bool().value
+
+	def apply(self, mapping, a, b, **kwargs):
+		# Only for operators without shortcuts
+		a, b = self.extract_constants(a, b)
+
+		a, b = a.to_bool(), b.to_bool()
+		return BooleanConstant(self._logic(a.value, b.value))
 
 	@overload
 	def _logic(self, a: bool, /) -> Optional[bool]:
@@ -174,11 +330,15 @@ class NimplOperator(_BinaryBoolOperator):
 			return False
 
 class XorOperator(_BinaryBoolOperator):
+	_strict = True
+
 	_shortcut = False
 	def _logic(self, a, b = None, /):
 		return a != b
 
 class IffOperator(_BinaryBoolOperator):
+	_strict = True
+
 	_shortcut = False
 	def _logic(self, a, b = None, /):
 		return a == b
@@ -215,13 +375,19 @@ class ConverseNimplOperator(_BinaryBoolOperator):
 			return False
 
 class ConcatOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.PURE
+	_safe_operands = (Constant,)
+	_result_type = StringConstant
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		a, b = a.to_str(), b.to_str()
 		return StringConstant(a.value + b.value)
 
 class IfThenElseOperator(TernaryOperator):
+	_effects = Effect.PURE
+	_conditional = True
 	def eval(self, mapping, **kwargs):
 		a = self.eval_and_extract_constant(0, mapping, **kwargs)
 		a = a.to_bool()
@@ -231,34 +397,71 @@ class IfThenElseOperator(TernaryOperator):
 		else:
 			return self.eval_operand(2, mapping, **kwargs)
 
+	def _select(self, values):
+		# Same as eval
+		if len(values) == 0:
+			return 0
+		elif len(values) == 1:
+			return 1 if self.extract_constant(values[0]).to_bool().value else 2
+		return None
+
+	def _conclude(self, values):
+		return values[1]
+
 class EqualOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant, BooleanConstant)
+	_result_type = BooleanConstant
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		if type(a) != type(b):
 			return BooleanConstant(False)
+		elif a.is_number and (v := approximate(kwargs.get('precision'), a, b)) is not None:
+			return BooleanConstant(v[0] == v[1])
+		elif a.is_number and a.is_native and b.is_native:
+			return BooleanConstant(a.native == b.native)
 
 		return BooleanConstant(bool(Eq(a.value, b.value).simplify()))
 
 class NonequalOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant, BooleanConstant)
+	_result_type = BooleanConstant
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		if type(a) != type(b):
 			return BooleanConstant(True)
+		elif a.is_number and (v := approximate(kwargs.get('precision'), a, b)) is not None:
+			return BooleanConstant(v[0] != v[1])
+		elif a.is_number and a.is_native and b.is_native:
+			return BooleanConstant(a.native != b.native)
 
 		return BooleanConstant(bool(Ne(a.value, b.value).simplify()))
 
 class _BinaryComparisonOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant, BooleanConstant)
+	_result_type = BooleanConstant
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 		if a.is_bool:
 			a = a.to_number()
 		if b.is_bool:
 			b = b.to_number()
 
 		if a.is_number and b.is_number:
-			if a.is_('real') and b.is_('real'):
+			if (v := approximate(kwargs.get('precision'), a, b)) is not None:
+				if v[0].imag == 0 and v[1].imag == 0:
+					return BooleanConstant(self._compstr(v[0].real, v[1].real))
+				return BooleanConstant(v[0] == v[1])
+			elif a.is_native and b.is_native:
+				return BooleanConstant(self._compstr(a.native, b.native))
+			elif a.is_('real') and b.is_('real'):
 				return BooleanConstant(self._comp(a.value, b.value))
 			else:
 				return BooleanConstant(bool(Eq(a.value, b.value).simplify()))
@@ -272,6 +475,7 @@ class _BinaryComparisonOperator(BinaryOperator):
 		raise NotImplementedError
 
 	def _compstr(self, a: str, b: str, /) -> bool:
+		# Also used for native numbers
 		raise NotImplementedError
 
 class LessOperator(_BinaryComparisonOperator):
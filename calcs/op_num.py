@@ -1,94 +1,162 @@
+from .approx import context, precision_of
 from .types import *
 from .ops import BinaryOperator, TernaryOperator, UnaryOperator
 from .utils import filter_operator
+import math
 import sympy
 
 class AbsOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if not a.is_number:
 			raise ValueError('Only apply to numbers')
 
+		if (v := approximate(kwargs.get('precision'), a)) is not None:
+			return NumberConstant(abs(v[0]))
+		elif a.is_native:
+			return NumberConstant(abs(a.native))
 		return NumberConstant(sympy.Abs(a.value))
 
 class PowOperator(BinaryOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		if a.is_number and b.is_number:
+			if (v := approximate(kwargs.get('precision'), a, b)) is not None:
+				try:
+					return NumberConstant(v[0] ** v[1])
+				except OverflowError:
+					# Out of the range of float
+					ctx = context(precision_of(v[0]))
+					return NumberConstant(ctx.convert(v[0]) ** ctx.convert(v[1]))
+				except ZeroDivisionError:
+					# Zero to a negative power is left to SymPy, which gives the complex infinity
+					pass
+
+			if a.is_native and b.is_native and b.native >= 0:
+				return NumberConstant(a.native ** b.native)
 			return NumberConstant(a.value ** b.value)
 
 		raise ValueError('Only apply to numbers')
 
 class FactorialOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if not a.is_number:
 			raise ValueError('Only apply to numbers')
 
-		if a.is_('integer') and a.is_('nonnegative'):
+		if (v := approximate(kwargs.get('precision'), a)) is not None:
+			x = v[0]
+			if x.imag != 0 or x.real < 0 or x.real % 1 != 0:
+				raise ValueError('Only accepts nonnegative integer')
+
+			x = x.real
+			if type(x) is float:
+				try:
+					return NumberConstant(math.gamma(x + 1))
+				except OverflowError:
+					# Out of the range of float
+					x = context(precision_of(x)).convert(x)
+			return NumberConstant(x.context.factorial(x))
+		elif a.is_native and a.native >= 0:
+			return NumberConstant(math.factorial(a.native))
+		elif a.is_('integer') and a.is_('nonnegative'):
 			return NumberConstant(sympy.factorial(a.value))
 		else:
 			raise ValueError('Only accepts nonnegative integer')
 
 class RealOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if not a.is_number:
 			raise ValueError('Only apply to numbers')
 
+		if (v := approximate(kwargs.get('precision'), a)) is not None:
+			return NumberConstant(v[0].real)
 		return NumberConstant(sympy.re(a.value))
 
 class ImagOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (NumberConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if not a.is_number:
 			raise ValueError('Only apply to numbers')
 
+		if (v := approximate(kwargs.get('precision'), a)) is not None:
+			return NumberConstant(v[0].imag)
 		return NumberConstant(sympy.im(a.value))
 
+def _shift(a: NumberConstant, n: int) -> NumberConstant:
+	# Approximate numbers stay approximate
+	if a.is_approx:
+		return NumberConstant(a.approx(a.precision) + n)
+	elif a.is_native:
+		return NumberConstant(a.native + n)
+	return NumberConstant(a.value + n)
+
 # ++x
 class IncrementOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_operand(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
 		if a.is_lvalue and a.content.is_number:
-			a.content = NumberConstant(a.content.value + 1)
+			a.content = _shift(a.content, 1)
 			return a
 
 		raise ValueError('Only apply to number variables')
 
 # x++
 class PostIncrementOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_operand(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
 		if a.is_lvalue and a.content.is_number:
 			result = a.content
-			a.content = NumberConstant(result.value + 1)
+			a.content = _shift(result, 1)
 			return result.without_dummy()
 
 		raise ValueError('Only apply to number variables')
 
 # --x
 class DecrementOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_operand(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
 		if a.is_lvalue and a.content.is_number:
-			a.content = NumberConstant(a.content.value - 1)
+			a.content = _shift(a.content, -1)
 			return a
 
 		raise ValueError('Only apply to number variables')
 
 # x--
 class PostDecrementOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_operand(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
 		if a.is_lvalue and a.content.is_number:
 			result = a.content
-			a.content = NumberConstant(result.value - 1)
+			a.content = _shift(result, -1)
 			return result.without_dummy()
 
 		raise ValueError('Only apply to number variables')
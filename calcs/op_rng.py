@@ -5,12 +5,16 @@ from sympy import ceiling, Float, floor, Integer, Number
 from sympy.core.random import rng, random_complex_number
 
 class RandomOperator(NullaryOperator):
-	def eval(self, mapping, **kwargs):
+	_strict = True
+	_effects = Effect.USES_RNG
+	def apply(self, mapping, **kwargs):
 		return NumberConstant(Float(rng.random()))
 
 class RandomWithSeedOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if not a.is_dummy:
 			rng.seed(str(a))
@@ -18,8 +22,10 @@ class RandomWithSeedOperator(UnaryOperator):
 		return NumberConstant(Float(rng.random()))
 
 class SetSeedOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 		rng.seed(str(a))
 		return BooleanConstant(True)
 
@@ -39,39 +45,51 @@ class _RandomRangeOperator:
 		raise ValueError('Only apply numbers as input')
 
 class RandomRangeZeroOperator(UnaryOperator, _RandomRangeOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		return self._eval(NumberConstant(Integer(0)), a, NumberConstant(Integer(1)))
 
 class RandomRangeZeroWithSeedOperator(BinaryOperator, _RandomRangeOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		return self._eval(NumberConstant(Integer(0)), a, NumberConstant(Integer(1)), b)
 
 class RandomRangeStepOneOperator(BinaryOperator, _RandomRangeOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		return self._eval(a, b, NumberConstant(Integer(1)))
 
 class RandomRangeStepOneWithSeedOperator(TernaryOperator, _RandomRangeOperator):
-	def eval(self, mapping, **kwargs):
-		a, b, c = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, c, **kwargs):
+		a, b, c = self.extract_constants(a, b, c)
 
 		return self._eval(a, b, NumberConstant(Integer(1)), c)
 
 class RandomRangeOperator(TernaryOperator, _RandomRangeOperator):
-	def eval(self, mapping, **kwargs):
-		a, b, c = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, c, **kwargs):
+		a, b, c = self.extract_constants(a, b, c)
 
 		return self._eval(a, b, c)
 
 class RandomRangeWithSeedOperator(Operator, _RandomRangeOperator):
 	ary = 4
-	def eval(self, mapping, **kwargs):
-		a, b, c, d = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, c, d, **kwargs):
+		a, b, c, d = self.extract_constants(a, b, c, d)
 
 		return self._eval(a, b, c, d)
 
@@ -93,14 +111,18 @@ class _RandomIntOperator:
 		raise ValueError('Only apply real numbers as input')
 
 class RandomIntOperator(BinaryOperator, _RandomIntOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		return self._eval(a, b)
 
 class RandomIntWithSeedOperator(TernaryOperator, _RandomIntOperator):
-	def eval(self, mapping, **kwargs):
-		s, a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, s, a, b, **kwargs):
+		s, a, b = self.extract_constants(s, a, b)
 
 		return self._eval(a, b, s)
 
@@ -115,14 +137,18 @@ class _RandomRealOperator:
 		raise ValueError('Only apply real numbers as input')
 
 class RandomRealOperator(BinaryOperator, _RandomRealOperator):
-	def eval(self, mapping, **kwargs):
-		a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, **kwargs):
+		a, b = self.extract_constants(a, b)
 
 		return self._eval(a, b)
 
 class RandomRealWithSeedOperator(TernaryOperator, _RandomRealOperator):
-	def eval(self, mapping, **kwargs):
-		s, a, b = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, s, a, b, **kwargs):
+		s, a, b = self.extract_constants(s, a, b)
 
 		return self._eval(a, b, s)
 
@@ -138,15 +164,19 @@ class _RandomComplexOperator:
 
 class RandomComplexOperator(Operator, _RandomComplexOperator):
 	ary = 4
-	def eval(self, mapping, **kwargs):
-		a, b, c, d = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, a, b, c, d, **kwargs):
+		a, b, c, d = self.extract_constants(a, b, c, d)
 
 		return self._eval(a, b, c, d)
 
 class RandomComplexWithSeedOperator(Operator, _RandomComplexOperator):
 	ary = 5
-	def eval(self, mapping, **kwargs):
-		s, a, b, c, d = self.eval_and_extract_constants(mapping, **kwargs)
+	_strict = True
+	_effects = Effect.USES_RNG | Effect.MAY_RAISE
+	def apply(self, mapping, s, a, b, c, d, **kwargs):
+		s, a, b, c, d = self.extract_constants(s, a, b, c, d)
 
 		return self._eval(a, b, c, d, s)
 
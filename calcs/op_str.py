@@ -14,8 +14,12 @@ from sympy.parsing.sympy_parser import (
 )
 
 class LengthOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	_safe_operands = (StringConstant,)
+	_result_type = NumberConstant
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if not a.is_str:
 			raise ValueError('Only apply to strings')
@@ -57,8 +61,10 @@ but the other denotes "4".
 USE "=" INSTEAD OF "==" IF POSSUBLE TO GET WHAT YOU WANT, ANYWAY.
 '''
 class SymParseOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.READS_VARS | Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if not a.is_str:
 			raise ValueError('Only apply to strings')
@@ -110,8 +116,8 @@ class SymParseOperator(UnaryOperator):
 		return a.without_dummy()
 
 class StrictSymParseOperator(SymParseOperator):
-	def eval(self, mapping, **kwargs):
-		result = super().eval(mapping, **kwargs)
+	def apply(self, mapping, a, **kwargs):
+		result = super().apply(mapping, a, **kwargs)
 
 		if result.is_str:
 			raise ValueError(f'Cannot parse {result.value} into a number/Boolean value')
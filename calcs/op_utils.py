@@ -1,22 +1,33 @@
 from .types import *
 from .exceptions import UserDefinedError
-from .ops import BinaryOperator, TernaryOperator, UnaryOperator
+from .ops import BinaryOperator, NaryOperator, TernaryOperator, UnaryOperator
 from .utils import filter_operator
 from sympy.parsing.sympy_parser import auto_number, parse_expr, rationalize
 
 class ToStringOperator(UnaryOperator):
+	_strict = True
+	_effects = Effect.PURE
+	_safe_operands = (Constant,)
+	_result_type = StringConstant
 	# Just do str() to the contents of the constants
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		return StringConstant(str(a.value))
 
 class PrintOperator(UnaryOperator):
+	_strict = True
+	_effects = Effect.MAY_RAISE
 	# For numbers, the function returns expressions of primary types: int float complex
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		if a.is_number:
+			if a.is_approx:
+				v = a.approx(a.precision)
+				if v.imag == 0:
+					return StringConstant(str(v.real))
+				return StringConstant(f'({v.real}+{v.imag}j)')
 			if a.is_('integer'):
 				return StringConstant(str(a))
 			if a.is_('real'):
@@ -29,11 +40,42 @@ class PrintOperator(UnaryOperator):
 			return StringConstant(str(a.value))
 
 class PassOperator(BinaryOperator):
+	_strict = True
+	_effects = Effect.PURE
+	def apply(self, mapping, a, b, **kwargs):
+		return b
+
+# The n-ary form of a chain of pass operators: a; b; c
+class SequenceOperator(NaryOperator):
+	_strict = True
+	_effects = Effect.PURE
+	def apply(self, mapping, *args, **kwargs):
+		return args[-1]
+
+# A subtree appearing several times in a tree, evaluated at most once under a MemoScopeOperator
+class SharedOperator(UnaryOperator):
+	_effects = Effect.PURE
+	def eval(self, mapping, **kwargs):
+		memo = kwargs.get('memo')
+		if memo is None:
+			return self.eval_operand(0, mapping, **kwargs)
+
+		key = id(self)
+		if key not in memo:
+			memo[key] = self.eval_operand(0, mapping, **kwargs)
+
+		return memo[key]
+
+# Gives the shared subtrees below a fresh memo for every evaluation
+class MemoScopeOperator(UnaryOperator):
+	_effects = Effect.PURE
 	def eval(self, mapping, **kwargs):
-		return self.eval_operands(mapping, **kwargs)[1]
+		kwargs['memo'] = {}
+		return self.eval_operand(0, mapping, **kwargs)
 
 # It is weird to use reverse onto infix operators unless you know what you do
 class ReverseOperator(UnaryOperator):
+	_effects = Effect.MAY_RAISE
 	def eval(self, mapping, **kwargs):
 		operand = self._operands[0]
 		if isinstance(operand, Operator):
@@ -43,18 +85,23 @@ class ReverseOperator(UnaryOperator):
 		raise ValueError('Can only applied to an operation node')
 
 class DummizeOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.PURE
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		return a.with_dummy()
 
 class DedummizeOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.PURE
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		return a.without_dummy()
 
 class RepeatTwiceOperator(UnaryOperator):
+	_effects = Effect.PURE
 	def eval(self, mapping, **kwargs):
 		self.eval_operand(0, mapping, **kwargs)
 		a = self.eval_operand(0, mapping, **kwargs)
@@ -62,6 +109,7 @@ class RepeatTwiceOperator(UnaryOperator):
 		return a
 
 class RepeatTimesOperator(BinaryOperator):
+	_effects = Effect.MAY_RAISE
 	def eval(self, mapping, **kwargs):
 		a = self.eval_and_extract_constant(0, mapping, **kwargs)
 		if a.is_number and a.is_('integer') and a.is_('positive'):
@@ -74,14 +122,18 @@ class RepeatTimesOperator(BinaryOperator):
 		raise ValueError('Only accept positive integer as the first argument')
 
 class RaiseOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE | Effect.RAISES
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 
 		raise UserDefinedError(str(a))
 
 class DecimalPointOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.MAY_RAISE
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 		if a.is_number and a.is_('integer') and a.is_('nonnegative'):
 			n = a.simplify().value
 			return NumberConstant(parse_expr(f'0.{n}', transformations = (auto_number, rationalize)))
@@ -91,12 +143,16 @@ class DecimalPointOperator(UnaryOperator):
 		raise ValueError('Only apply to nonnegative integers or decimal strings')
 
 class MoveOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		return self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.PURE
+	def apply(self, mapping, a, **kwargs):
+		return self.extract_constant(a)
 
 class TypeOperator(UnaryOperator):
-	def eval(self, mapping, **kwargs):
-		a = self.eval_and_extract_constant(0, mapping, **kwargs)
+	_strict = True
+	_effects = Effect.PURE
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
 		if a.is_number:
 			return StringConstant('number')
 		elif a.is_bool:
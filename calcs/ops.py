@@ -10,4 +10,13 @@ class BinaryOperator(Operator):
 	ary = 2
 
 class TernaryOperator(Operator):
-	ary = 3
\ No newline at end of file
+	ary = 3
+
+class NaryOperator(Operator):
+	# Takes any positive number of operands; not meant for the parser
+	def __init__(self, *args):
+		if len(args) == 0:
+			raise ValueError('At least one operand is needed.')
+
+		self.ary = len(args)
+		super().__init__(*args)
@@ -0,0 +1,263 @@
+from .types import *
+from .op_basic import MultipleOperator, PlusOperator, ProductOperator, SumOperator
+from .op_utils import MemoScopeOperator, PassOperator, ReverseOperator, SequenceOperator, SharedOperator
+from collections.abc import Hashable
+from typing import Optional
+
+__all__ = (
+	'fold_constants',
+	'eliminate_dead_code',
+	'eliminate_common_subexpressions',
+	'flatten_associative',
+)
+
+def fold_constants(tree: TreeNodeType) -> TreeNodeType:
+	# Replace every subtree of constants and operators without effects other than raising
+	# by the constant it evaluates to, so repeated evaluations only pay for the parts
+	# depending on variables.
+	# The constant is the evaluated object itself, so the dummy attribute is kept.
+	# Subtrees that raise are kept, and the error comes up when the tree is evaluated.
+	# The input tree is not modified; operators above folded subtrees are rebuilt.
+
+	# (The new node, whether it is a constant)
+	results: list[tuple[TreeNodeType, bool]] = []
+	stack: list[tuple[TreeNodeType, bool]] = [(tree, False)]
+	while len(stack) > 0:
+		node, ready = stack.pop()
+		if not ready:
+			if isinstance(node, ReverseOperator):
+				# It looks into the operand node, which should be kept as it is
+				results.append((node, False))
+			elif isinstance(node, Operator):
+				stack.append((node, True))
+				stack.extend((o, False) for o in reversed(node._operands))
+			else:
+				# Variables and wildcards are not constant
+				results.append((node, isinstance(node, Constant)))
+			continue
+
+		assert isinstance(node, Operator)
+		n = len(node._operands)
+		operands = results[len(results) - n:]
+		del results[len(results) - n:]
+
+		if any(new is not old for (new, _), old in zip(operands, node._operands)):
+			node = type(node)(*(new for new, _ in operands))
+
+		# Raising is allowed since such subtrees are kept below
+		if not (node._effects & ~Effect.MAY_RAISE) and all(is_constant for _, is_constant in operands):
+			# Every operand is a constant now, so this does not recurse
+			try:
+				value = node.eval({})
+			except Exception:
+				value = None
+
+			if isinstance(value, Constant):
+				results.append((value, True))
+				continue
+
+		results.append((node, False))
+
+	return results[0][0]
+
+def _flatten_sequence(node: Operator) -> list[TreeNodeType]:
+	# The statements of nested pass and sequence operators, in order
+	statements: list[TreeNodeType] = []
+	stack: list[TreeNodeType] = [node]
+	while len(stack) > 0:
+		node = stack.pop()
+		if isinstance(node, (PassOperator, SequenceOperator)):
+			stack.extend(reversed(node._operands))
+		else:
+			statements.append(node)
+
+	return statements
+
+def eliminate_dead_code(tree: TreeNodeType, keep_errors: bool = True) -> TreeNodeType:
+	# Flatten every chain of pass operators into one SequenceOperator and drop the statements,
+	# except the last one, whose evaluation has no effect.
+	# Reading a variable has no effect by itself, but an undefined variable raises
+	# (or is defined by the keyword argument "anonymous_var" of eval()).
+	# With keep_errors = False, statements that may raise are dropped as well,
+	# e.g. "x + 1; y = 2" becomes "y = 2" even if x may be undefined,
+	# but raise statements are always kept (see Effect.RAISES).
+	# The input tree is not modified.
+	removable = Effect.READS_VARS
+	if not keep_errors:
+		removable |= Effect.MAY_RAISE
+
+	results: list[TreeNodeType] = []
+	# (node, None) to visit the node, (node, n) to rebuild it from the last n results
+	stack: list[tuple[TreeNodeType, Optional[int]]] = [(tree, None)]
+	while len(stack) > 0:
+		node, n = stack.pop()
+		if n is None:
+			if isinstance(node, ReverseOperator):
+				# It looks into the operand node, which should be kept as it is
+				results.append(node)
+			elif isinstance(node, (PassOperator, SequenceOperator)):
+				statements = _flatten_sequence(node)
+				stack.append((node, len(statements)))
+				stack.extend((o, None) for o in reversed(statements))
+			elif isinstance(node, Operator):
+				stack.append((node, len(node._operands)))
+				stack.extend((o, None) for o in reversed(node._operands))
+			else:
+				results.append(node)
+			continue
+
+		assert isinstance(node, Operator)
+		operands = results[len(results) - n:]
+		del results[len(results) - n:]
+
+		if isinstance(node, (PassOperator, SequenceOperator)):
+			# The value of the last statement is the result, so it is always kept
+			*init, last = operands
+			operands = [o for o in init if effects_of(o) & ~removable] + [last]
+			if len(operands) == 1:
+				# The pass operator returns its right operand as it is
+				results.append(operands[0])
+			else:
+				results.append(SequenceOperator(*operands))
+		elif any(new is not old for new, old in zip(operands, node._operands)):
+			results.append(type(node)(*operands))
+		else:
+			results.append(node)
+
+	return results[0]
+
+def eliminate_common_subexpressions(tree: TreeNodeType) -> TreeNodeType:
+	# Merge structurally equal subtrees into one node, so the tree becomes a DAG,
+	# and wrap the merged operators in SharedOperator, so each of them is evaluated
+	# once per evaluation under the MemoScopeOperator put at the root.
+	# Subtrees with effects other than reading variables and raising are never merged,
+	# and subtrees reading variables are only merged if nothing in the tree writes variables.
+	# The input tree is not modified.
+	shareable = Effect.MAY_RAISE
+	if not (effects_of(tree) & Effect.WRITES_VARS):
+		shareable |= Effect.READS_VARS
+
+	# Every distinct subtree gets an index in post-order, so operands come before their operators
+	indices: dict[Hashable, int] = {}
+	nodes: list[TreeNodeType] = []
+	operands: list[tuple[int, ...]] = []
+	effects: list[Effect] = []
+	counts: list[int] = []
+
+	results: list[int] = []
+	stack: list[tuple[TreeNodeType, bool]] = [(tree, False)]
+	while len(stack) > 0:
+		node, ready = stack.pop()
+		if not ready and isinstance(node, Operator) and not isinstance(node, ReverseOperator):
+			stack.append((node, True))
+			stack.extend((o, False) for o in reversed(node._operands))
+			continue
+
+		key: Hashable
+		children: tuple[int, ...] = ()
+		effect = node._effects
+		if ready:
+			assert isinstance(node, Operator)
+			n = len(node._operands)
+			children = tuple(results[len(results) - n:])
+			del results[len(results) - n:]
+			key = (type(node), children)
+			for i in children:
+				effect |= effects[i]
+		elif isinstance(node, Constant):
+			key = (type(node), node, node.is_dummy)
+		elif isinstance(node, Var):
+			key = (Var, node.name, id(node.scope))
+		else:
+			# Wildcards and ReverseOperator, which looks into the operand node
+			key = id(node)
+			effect = effects_of(node)
+
+		if key not in indices:
+			indices[key] = len(nodes)
+			nodes.append(node)
+			operands.append(children)
+			effects.append(effect)
+			counts.append(0)
+
+		i = indices[key]
+		counts[i] += 1
+		results.append(i)
+
+	built: list[TreeNodeType] = []
+	shared = False
+	for node, children, effect, count in zip(nodes, operands, effects, counts):
+		if len(children) > 0:
+			assert isinstance(node, Operator)
+			new_operands = [built[i] for i in children]
+			if any(new is not old for new, old in zip(new_operands, node._operands)):
+				node = type(node)(*new_operands)
+
+			if count > 1 and not (effect & ~shareable) and not isinstance(node, SharedOperator):
+				node = SharedOperator(node)
+				shared = True
+
+		built.append(node)
+
+	root = built[results[0]]
+	if shared:
+		return MemoScopeOperator(root)
+	return root
+
+# The n-ary operator replacing left-leaning chains of each binary operator
+_FLATTENED: dict[type[Operator], type[Operator]] = {
+	PlusOperator: SumOperator,
+	SumOperator: SumOperator,
+	MultipleOperator: ProductOperator,
+	ProductOperator: ProductOperator,
+}
+
+def _left_spine(node: Operator, flattened: type[Operator]) -> list[TreeNodeType]:
+	# The operands of the chain "((a + b) + c) + d" are [a, b, c, d]
+	right: list[TreeNodeType] = []
+	while _FLATTENED.get(type(node)) is flattened:
+		right.extend(reversed(node._operands[1:]))
+		node = node._operands[0]
+		if not isinstance(node, Operator):
+			break
+
+	right.append(node)
+	right.reverse()
+	return right
+
+def flatten_associative(tree: TreeNodeType) -> TreeNodeType:
+	# Turn left-leaning chains of "+" and "*" into SumOperator and ProductOperator.
+	# Only the left operands are followed, since "a + (b + c)" is not "a + b + c" for strings.
+	# The input tree is not modified.
+	results: list[TreeNodeType] = []
+	# (node, None) to visit the node, (node, n) to rebuild it from the last n results
+	stack: list[tuple[TreeNodeType, Optional[int]]] = [(tree, None)]
+	while len(stack) > 0:
+		node, n = stack.pop()
+		if n is None:
+			if isinstance(node, ReverseOperator):
+				# It looks into the operand node, which should be kept as it is
+				results.append(node)
+			elif type(node) in _FLATTENED and len(operands := _left_spine(node, _FLATTENED[type(node)])) > 2:
+				# A binary operator is cheaper for two operands
+				stack.append((node, len(operands)))
+				stack.extend((o, None) for o in reversed(operands))
+			elif isinstance(node, Operator):
+				stack.append((node, len(node._operands)))
+				stack.extend((o, None) for o in reversed(node._operands))
+			else:
+				results.append(node)
+			continue
+
+		assert isinstance(node, Operator)
+		operands = results[len(results) - n:]
+		del results[len(results) - n:]
+
+		if type(node) in _FLATTENED and n > 2:
+			results.append(_FLATTENED[type(node)](*operands))
+		elif any(new is not old for new, old in zip(operands, node._operands)):
+			results.append(type(node)(*operands))
+		else:
+			results.append(node)
+
+	return results[0]
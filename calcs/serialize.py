@@ -0,0 +1,478 @@
+from .approx import context, is_approx, precision_of
+from .types import *
+from .ops import NaryOperator
+from .utils import filter_operator
+from importlib import import_module
+from mpmath.ctx_mp_python import _mpf
+from mpmath.libmp import finf, fnan, fninf, fzero
+from sympy import Basic, Float, Integer, Rational, S
+from typing import Any, Union
+import struct
+import sympy
+
+__all__ = (
+	'dumps',
+	'loads',
+)
+
+'''
+A compact binary format of trees:
+
+	magic b'CLC' and the version byte
+	the operator classes: count, then every "module:qualname"
+	the variable names: count, then every name
+	the constants: count, then every constant (see below)
+	the nodes: count, then every node in post-order, as a code followed by its arguments:
+		CONST k     the constant k
+		VAR k       the variable named k
+		WILDCARD
+		REF k       the k-th node again, for trees sharing subtrees (see calcs.optimize)
+		OP + k [n]  the operator class k over the last n nodes, where n is only written for n-ary operators
+
+Every integer is an unsigned LEB128 varint, and signed integers are zigzag-encoded first.
+Strings are the length of the UTF-8 encoding and the encoding.
+A constant is a tag byte, with DUMMY set for dummy constants, and the value:
+Boolean values and native integers are in the tag; SymPy expressions are encoded by structure,
+with only the functions in _FUNCTIONS, which are rebuilt without evaluation,
+so loading never evaluates code or expressions; floats are IEEE doubles and mpmath numbers are their mantissas
+and exponents with the precision.
+
+Only operator classes in the calcs package are loaded, and only variables without scopes are dumped.
+'''
+
+MAGIC = b'CLC'
+VERSION = 1
+
+# Node codes
+CONST = 0
+VAR = 1
+WILDCARD = 2
+REF = 3
+OP = 4
+
+# Constant tags
+FALSE = 0
+TRUE = 1
+STR = 2
+INT = 3
+EXPR = 4
+FLOAT = 5
+COMPLEX = 6
+MPF = 7
+MPC = 8
+DUMMY = 0x80
+
+# SymPy expression tags
+E_INT = 0
+E_RATIONAL = 1
+E_FLOAT = 2
+E_SINGLETON = 3
+E_FUNCTION = 4
+
+# The SymPy functions in number values (see calcs.op_num and calcs.op_str), rebuilt without evaluation
+_FUNCTIONS: dict[str, type[Basic]] = {f.__name__: f for f in (
+	sympy.Add,
+	sympy.Mul,
+	sympy.Pow,
+	sympy.Abs,
+	sympy.re,
+	sympy.im,
+	sympy.arg,
+	sympy.conjugate,
+	sympy.sign,
+	sympy.factorial,
+	sympy.floor,
+	sympy.ceiling,
+	sympy.exp,
+	sympy.log,
+	sympy.sin,
+	sympy.cos,
+	sympy.tan,
+	sympy.asin,
+	sympy.acos,
+	sympy.atan,
+	sympy.sinh,
+	sympy.cosh,
+	sympy.tanh,
+)}
+
+# Varints longer than this are converted through bytes, which takes linear time instead of quadratic
+_LONG_VARINT = 16
+
+_double = struct.Struct('<d')
+_complex = struct.Struct('<dd')
+
+class _Writer:
+	def __init__(self):
+		self.buffer = bytearray()
+
+	def uint(self, n: int):
+		buffer = self.buffer
+		if n < 0x80:
+			# Most integers are small indices
+			buffer.append(n)
+			return
+		if n.bit_length() > 7 * _LONG_VARINT:
+			# Every 7 bytes are 8 groups of 7 bits
+			data = n.to_bytes((n.bit_length() + 55) // 56 * 7, 'little')
+			start = len(buffer)
+			for i in range(0, len(data), 7):
+				word = int.from_bytes(data[i:i + 7], 'little')
+				for _ in range(8):
+					buffer.append((word & 0x7f) | 0x80)
+					word >>= 7
+			while len(buffer) - start > 1 and buffer[-1] == 0x80:
+				buffer.pop()
+			buffer[-1] &= 0x7f
+			return
+		while n > 0x7f:
+			buffer.append((n & 0x7f) | 0x80)
+			n >>= 7
+		buffer.append(n)
+
+	def int(self, n: int):
+		self.uint(n << 1 if n >= 0 else ((-n) << 1) - 1)
+
+	def str(self, s: str):
+		b = s.encode()
+		self.uint(len(b))
+		self.buffer += b
+
+	def mpf(self, value: tuple[int, int, int, int]):
+		sign, man, exp, bc = value
+		self.uint(sign)
+		self.uint(man)
+		self.int(exp)
+		self.uint(bc)
+
+	def expr(self, value: Basic):
+		if value.is_Integer:
+			self.buffer.append(E_INT)
+			self.int(int(value))
+		elif value.is_Rational:
+			self.buffer.append(E_RATIONAL)
+			self.int(value.p)
+			self.uint(value.q)
+		elif value.is_Float:
+			self.buffer.append(E_FLOAT)
+			self.uint(value._prec)
+			self.mpf(value._mpf_)
+		elif len(value.args) == 0:
+			name = type(value).__name__
+			if getattr(S, name, None) is not value:
+				raise TypeError(f'Unable to dump {value}')
+			self.buffer.append(E_SINGLETON)
+			self.str(name)
+		else:
+			name = value.func.__name__
+			if _FUNCTIONS.get(name) is not value.func:
+				raise TypeError(f'Unable to dump {value}')
+			self.buffer.append(E_FUNCTION)
+			self.str(name)
+			self.uint(len(value.args))
+			for a in value.args:
+				self.expr(a)
+
+	def constant(self, c: Constant):
+		dummy = DUMMY if c.is_dummy else 0
+		if c.is_bool:
+			self.buffer.append((TRUE if c.value else FALSE) | dummy)
+		elif c.is_str:
+			self.buffer.append(STR | dummy)
+			self.str(c.value)
+		elif not isinstance(c, NumberConstant):
+			raise TypeError(f'Unable to dump {type(c).__name__}')
+		elif c.is_native:
+			self.buffer.append(INT | dummy)
+			self.int(c.native)
+		elif c.is_approx:
+			v = c.approx(c.precision)
+			if type(v) is float:
+				self.buffer.append(FLOAT | dummy)
+				self.buffer += _double.pack(v)
+			elif type(v) is complex:
+				self.buffer.append(COMPLEX | dummy)
+				self.buffer += _complex.pack(v.real, v.imag)
+			elif isinstance(v, _mpf):
+				self.buffer.append(MPF | dummy)
+				self.uint(c.precision)
+				self.mpf(v._mpf_)
+			else:
+				self.buffer.append(MPC | dummy)
+				self.uint(c.precision)
+				self.mpf(v.real._mpf_)
+				self.mpf(v.imag._mpf_)
+		else:
+			self.buffer.append(EXPR | dummy)
+			self.expr(c.value)
+
+def _constant_key(c: Constant) -> Any:
+	# Equal constants are put into the pool once, but floats equal to each other
+	# may differ in their signs (0.0 and -0.0) or precisions
+	value = c._value
+	if is_approx(value):
+		return (type(c), c.is_dummy, precision_of(value), repr(value))
+	return (type(c), c.is_dummy, type(value), value)
+
+def dumps(tree: TreeNodeType) -> bytes:
+	classes: dict[type[Operator], int] = {}
+	names: dict[str, int] = {}
+	constants: dict[Any, int] = {}
+	constant_list: list[Constant] = []
+	# Nodes already written, by identity, with their indices in the stream
+	written: dict[int, int] = {}
+
+	stream = _Writer()
+	count = 0
+	stack: list[tuple[TreeNodeType, bool]] = [(tree, False)]
+	while len(stack) > 0:
+		node, ready = stack.pop()
+		if not ready and id(node) in written:
+			# Only operators are written once; leaves are cheaper than references
+			stream.uint(REF)
+			stream.uint(written[id(node)])
+			count += 1
+			continue
+
+		if not ready and isinstance(node, Operator):
+			stack.append((node, True))
+			stack.extend((o, False) for o in reversed(node._operands))
+			continue
+
+		if isinstance(node, Operator):
+			cls = type(node)
+			if cls not in classes:
+				classes[cls] = len(classes)
+			stream.uint(OP + classes[cls])
+			if isinstance(node, NaryOperator):
+				stream.uint(len(node._operands))
+		elif isinstance(node, Constant):
+			key = _constant_key(node)
+			if key not in constants:
+				constants[key] = len(constant_list)
+				constant_list.append(node)
+			stream.uint(CONST)
+			stream.uint(constants[key])
+		elif isinstance(node, Var):
+			if node.scope is not None:
+				raise ValueError(f'Unable to dump the variable {node.name} with a scope')
+			if node.name not in names:
+				names[node.name] = len(names)
+			stream.uint(VAR)
+			stream.uint(names[node.name])
+		elif isinstance(node, Wildcard):
+			stream.uint(WILDCARD)
+		else:
+			raise TypeError(f'Unable to dump {type(node).__name__}')
+
+		if isinstance(node, Operator):
+			written[id(node)] = count
+		count += 1
+
+	header = _Writer()
+	header.buffer += MAGIC
+	header.buffer.append(VERSION)
+	header.uint(len(classes))
+	for cls in classes:
+		header.str(f'{cls.__module__}:{cls.__qualname__}')
+	header.uint(len(names))
+	for name in names:
+		header.str(name)
+	header.uint(len(constant_list))
+	for c in constant_list:
+		header.constant(c)
+	header.uint(count)
+
+	return bytes(header.buffer + stream.buffer)
+
+class _Reader:
+	def __init__(self, buffer: Union[bytes, bytearray, memoryview]):
+		# Slicing a memoryview does not copy
+		self.buffer = memoryview(buffer).cast('B')
+		self.position = 0
+
+	def byte(self) -> int:
+		try:
+			b = self.buffer[self.position]
+		except IndexError:
+			raise ValueError('Truncated data') from None
+		self.position += 1
+		return b
+
+	def uint(self) -> int:
+		buffer = self.buffer
+		position = self.position
+		if position < len(buffer) and (b := buffer[position]) < 0x80:
+			self.position = position + 1
+			return b
+
+		end = position
+		while True:
+			try:
+				b = buffer[end]
+			except IndexError:
+				raise ValueError('Truncated data') from None
+			end += 1
+			if b < 0x80:
+				break
+		self.position = end
+
+		if end - position > _LONG_VARINT:
+			# Every 8 groups of 7 bits are 7 bytes
+			data = bytearray()
+			for i in range(position, end, 8):
+				word = 0
+				for j, b in enumerate(buffer[i:min(i + 8, end)]):
+					word |= (b & 0x7f) << (7 * j)
+				data += word.to_bytes(7, 'little')
+			return int.from_bytes(data, 'little')
+
+		n = 0
+		for b in reversed(buffer[position:end]):
+			n = (n << 7) | (b & 0x7f)
+		return n
+
+	def int(self) -> int:
+		n = self.uint()
+		return -((n + 1) >> 1) if n & 1 else n >> 1
+
+	def bytes(self, n: int) -> memoryview:
+		if self.position + n > len(self.buffer):
+			raise ValueError('Truncated data')
+		b = self.buffer[self.position:self.position + n]
+		self.position += n
+		return b
+
+	def str(self) -> str:
+		return str(self.bytes(self.uint()), 'utf-8')
+
+	def mpf(self) -> tuple[int, int, int, int]:
+		value = (self.uint(), self.uint(), self.int(), self.uint())
+		sign, man, exp, bc = value
+		if man == 0:
+			if value not in (fzero, finf, fninf, fnan):
+				raise ValueError('Invalid mpf value')
+		elif sign > 1 or man & 1 == 0 or bc != man.bit_length():
+			raise ValueError('Invalid mpf value')
+		return value
+
+	def expr(self) -> Basic:
+		tag = self.byte()
+		if tag == E_INT:
+			return Integer(self.int())
+		elif tag == E_RATIONAL:
+			return Rational(self.int(), self.uint())
+		elif tag == E_FLOAT:
+			prec = self.uint()
+			return Float._new(self.mpf(), prec)
+		elif tag == E_SINGLETON:
+			name = self.str()
+			value = getattr(S, name, None)
+			if not isinstance(value, Basic):
+				raise ValueError(f'Unknown SymPy singleton {name}')
+			return value
+		elif tag == E_FUNCTION:
+			name = self.str()
+			func = _FUNCTIONS.get(name)
+			if func is None:
+				raise ValueError(f'Unknown SymPy function {name}')
+			args = [self.expr() for _ in range(self.uint())]
+			try:
+				return func(*args, evaluate = False)
+			except (TypeError, ValueError):
+				raise ValueError(f'Invalid arguments of {name}') from None
+		raise ValueError(f'Unknown expression tag {tag}')
+
+	def constant(self) -> Constant:
+		tag = self.byte()
+		dummy, tag = tag & DUMMY, tag & ~DUMMY
+		c: Constant
+		if tag == FALSE or tag == TRUE:
+			c = BooleanConstant(tag == TRUE)
+		elif tag == STR:
+			c = StringConstant(self.str())
+		elif tag == INT:
+			c = NumberConstant(self.int())
+		elif tag == EXPR:
+			c = NumberConstant(self.expr())
+		elif tag == FLOAT:
+			c = NumberConstant(_double.unpack(self.bytes(8))[0])
+		elif tag == COMPLEX:
+			c = NumberConstant(complex(*_complex.unpack(self.bytes(16))))
+		elif tag == MPF:
+			ctx = context(self.uint())
+			c = NumberConstant(ctx.make_mpf(self.mpf()))
+		elif tag == MPC:
+			ctx = context(self.uint())
+			c = NumberConstant(ctx.make_mpc((self.mpf(), self.mpf())))
+		else:
+			raise ValueError(f'Unknown constant tag {tag}')
+
+		if dummy:
+			return c.with_dummy()
+		return c
+
+def _load_class(name: str) -> type[Operator]:
+	module, _, qualname = name.partition(':')
+	if module != 'calcs' and not module.startswith('calcs.'):
+		raise ValueError(f'Operators out of calcs are not loaded: {name}')
+
+	value: Any
+	try:
+		value = import_module(module)
+	except ImportError:
+		raise ValueError(f'Unknown operator {name}') from None
+	for attr in qualname.split('.'):
+		value = getattr(value, attr, None)
+	if not (isinstance(value, type) and issubclass(value, Operator)):
+		raise ValueError(f'Unknown operator {name}')
+	# Abstract bases (e.g. BinaryOperator or _BinaryBoolOperator) are not operators of trees
+	if len(filter_operator({value.__name__: value})) == 0 or not (issubclass(value, NaryOperator) or type(getattr(value, 'ary', None)) is int):
+		raise ValueError(f'Unknown operator {name}')
+	return value
+
+def loads(buffer: Union[bytes, bytearray, memoryview]) -> TreeNodeType:
+	r = _Reader(buffer)
+	if bytes(r.bytes(len(MAGIC))) != MAGIC:
+		raise ValueError('Not a serialized tree')
+	if (version := r.byte()) != VERSION:
+		raise ValueError(f'Unsupported version {version}')
+
+	classes = [_load_class(r.str()) for _ in range(r.uint())]
+	names = [r.str() for _ in range(r.uint())]
+	constants = [r.constant() for _ in range(r.uint())]
+
+	# Every node in the stream, for references, and the nodes without their operators yet
+	nodes: list[TreeNodeType] = []
+	stack: list[TreeNodeType] = []
+	try:
+		for _ in range(r.uint()):
+			code = r.uint()
+			node: TreeNodeType
+			if code >= OP:
+				cls = classes[code - OP]
+				n = r.uint() if issubclass(cls, NaryOperator) else cls.ary
+				if n > len(stack):
+					raise ValueError('Too few operands')
+				operands = stack[len(stack) - n:]
+				del stack[len(stack) - n:]
+				node = cls(*operands)
+			elif code == CONST:
+				node = constants[r.uint()]
+			elif code == VAR:
+				node = Var(names[r.uint()])
+			elif code == WILDCARD:
+				node = Wildcard()
+			else:
+				node = nodes[r.uint()]
+
+			nodes.append(node)
+			stack.append(node)
+	except IndexError:
+		raise ValueError('Invalid index') from None
+
+	if len(stack) != 1:
+		raise ValueError('Not a tree')
+	if r.position != len(r.buffer):
+		raise ValueError('Trailing data')
+	return stack[0]
@@ -0,0 +1,134 @@
+import pytest
+import asyncio
+import threading
+import time
+import calcs
+from calcs import LValue, Var
+from calcs.aio import AsyncEvaluator, eval_async, parse_async
+from calcs.exceptions import ParseError
+from calcs.ops import UnaryOperator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from sympy import Integer
+
+adv_parser = calcs.give_advanced_parser()
+
+def make_mapping(x):
+	return {Var('x'): LValue(Var('x'), calcs.NumberConstant(Integer(x)))}
+
+# Blocks its thread for the operand in seconds, like a pathological expression
+class SleepOperator(UnaryOperator):
+	_strict = True
+	started: list[float] = []
+
+	def apply(self, mapping, a, **kwargs):
+		a = self.extract_constant(a)
+		self.started.append(a.approx(15))
+		time.sleep(a.approx(15))
+		return a
+
+def sleep(seconds):
+	return SleepOperator(calcs.NumberConstant(seconds))
+
+async def ticks(seconds):
+	# The number of times the loop ran a coroutine in the time
+	count = 0
+	end = time.monotonic() + seconds
+	while time.monotonic() < end:
+		await asyncio.sleep(0.01)
+		count += 1
+	return count
+
+def test_parse_eval():
+	async def main():
+		tree = await parse_async("x * 2 + 1", adv_parser)
+		assert repr(tree) == repr(adv_parser.parse("x * 2 + 1"))
+		assert (await eval_async(tree, make_mapping(20))).value == 41
+		assert (await eval_async(tree, make_mapping(20), precision = 15)).value == 41.0
+
+		with pytest.raises(ParseError):
+			await parse_async("1 +", adv_parser)
+
+	asyncio.run(main())
+
+def test_assignment():
+	async def main():
+		mapping = {}
+		assert (await eval_async(adv_parser.parse("x := 3; x * 2"), mapping)).value == 6
+		assert mapping[Var('x')].value == 3
+
+	asyncio.run(main())
+
+def test_not_blocking():
+	async def main():
+		evaluation = asyncio.ensure_future(eval_async(sleep(0.3)))
+		count = await ticks(0.2)
+		assert (await evaluation).value == 0.3
+		return count
+
+	assert asyncio.run(main()) > 5
+
+def test_timeout():
+	async def main():
+		start = time.monotonic()
+		with pytest.raises(TimeoutError):
+			await eval_async(sleep(0.5), timeout = 0.05)
+		assert time.monotonic() - start < 0.3
+
+	asyncio.run(main())
+
+def test_pending_cancelled():
+	SleepOperator.started.clear()
+	executor = ThreadPoolExecutor(1)
+	async def main():
+		first = asyncio.ensure_future(eval_async(sleep(0.2), executor = executor))
+		await asyncio.sleep(0.05)
+		with pytest.raises(TimeoutError):
+			await eval_async(sleep(0.01), executor = executor, timeout = 0.01)
+		await first
+
+	asyncio.run(main())
+	executor.shutdown()
+	assert SleepOperator.started == [0.2]
+
+def test_limit():
+	async def main():
+		async with AsyncEvaluator(adv_parser, limit = 1, timeout = 0.05) as evaluator:
+			with pytest.raises(TimeoutError):
+				await evaluator.eval_async(sleep(0.3))
+			# Still running, so it takes the slot
+			assert evaluator.running == 1
+			with pytest.raises(TimeoutError):
+				await evaluator.parse_async("1 + 2")
+
+			tree = await evaluator.parse_async("x + 1", timeout = None)
+			assert evaluator.running == 0
+			assert (await evaluator.eval_async(tree, make_mapping(1))).value == 2
+
+	asyncio.run(main())
+
+def test_concurrency():
+	async def main():
+		async with AsyncEvaluator(limit = 2) as evaluator:
+			start = time.monotonic()
+			results = await asyncio.gather(*(evaluator.eval_async(sleep(0.1)) for _ in range(4)))
+			assert len(results) == 4
+			return time.monotonic() - start
+
+	# Two at a time
+	assert 0.2 <= asyncio.run(main()) < 0.35
+
+def test_invalid_limit():
+	with pytest.raises(ValueError):
+		AsyncEvaluator(limit = 0)
+
+def test_processes():
+	async def main():
+		with ProcessPoolExecutor(1) as executor:
+			evaluator = AsyncEvaluator(adv_parser, executor = executor)
+			tree = await evaluator.parse_async("x := 3; x * 2")
+			mapping = {}
+			assert (await evaluator.eval_async(tree, mapping)).value == 6
+			# Changed in the worker
+			assert mapping == {}
+
+	asyncio.run(main())
@@ -0,0 +1,66 @@
+import pytest
+import pickle
+import calcs
+from calcs import LValue, Var
+from calcs.batch import BatchResult, evaluate_many
+from calcs.exceptions import ParseError, UserDefinedError
+from sympy import Integer
+
+def make_mapping(x):
+	return {Var('x'): LValue(Var('x'), calcs.NumberConstant(Integer(x)))}
+
+pairs = [
+	("x + 1", make_mapping(41)),
+	("1 +", None),
+	("raise 'boom'", None),
+	("'a' - 1", None),
+	("x := 3; x * 2", None),
+	("'a' . 'b'", None),
+] * 5
+
+def check(results):
+	assert [r.index for r in sorted(results)] == list(range(len(pairs)))
+	results = sorted(results)
+	assert results[0].value.value == 42
+	assert results[0].error is None
+	assert isinstance(results[1].error, ParseError)
+	assert isinstance(results[2].error, UserDefinedError)
+	assert isinstance(results[3].error, ValueError)
+	assert results[4].value.value == 6
+	assert results[5].value.value == 'ab'
+	assert results[6] == BatchResult(6, results[0].value, None)
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_ordered(workers):
+	results = list(evaluate_many(pairs, workers = workers, chunksize = 4))
+	assert [r.index for r in results] == list(range(len(pairs)))
+	check(results)
+
+def test_as_completed():
+	check(list(evaluate_many(pairs, workers = 2, chunksize = 4, ordered = False)))
+
+def test_kwargs():
+	results = list(evaluate_many([("1/4", None)], workers = 1, precision = 15))
+	assert results[0].value.approx(15) == 0.25
+
+def test_stop_early():
+	results = evaluate_many(iter(pairs), workers = 2, chunksize = 1)
+	assert next(results).index == 0
+	results.close()
+
+def test_chunksize():
+	with pytest.raises(ValueError):
+		list(evaluate_many(pairs, chunksize = 0))
+
+def test_pickle_parser():
+	parser = calcs.give_advanced_parser()
+	parser.parse("1 + 2")
+	parser = pickle.loads(pickle.dumps(parser))
+	assert parser.parse("1 + 2").eval({}).value == 3
+
+@pytest.mark.parametrize('workers', [0, 1])
+def test_arithmetic_error(workers):
+	results = list(evaluate_many([("1 + 1", None), ("7 // 0", None), ("2 + 2", None)], workers = workers))
+	assert results[0].value.value == 2
+	assert isinstance(results[1].error, ZeroDivisionError)
+	assert results[2].value.value == 4
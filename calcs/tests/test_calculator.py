@@ -1,5 +1,8 @@
 import pytest
+import functools
+import pickle
 import calcs
+from calcs.op_basic import AndOperator, IfThenElseOperator, ImplOperator, MinusOperator, OrOperator
 from sympy import I, Integer, Rational, zoo
 
 parser = calcs.give_basic_parser()
@@ -102,10 +105,28 @@ class TestConst:
 		assert const.value == R"""foo bar   42'"\1a...++ '"""
 
 	def test_dummy(self):
-		const = parser.parse("_")
+		wildcard = parser.parse("_")
+		assert isinstance(wildcard, calcs.Wildcard)
+		const = wildcard.eval({})
 		assert const.is_number
 		assert const.is_dummy
 
+	def test_dummy_resampled(self):
+		import random
+		wildcard = parser.parse("_")
+		n1 = wildcard.eval({}, rng = random.Random(42))
+		n2 = wildcard.eval({}, rng = random.Random(42))
+		n3 = wildcard.eval({}, rng = random.Random(43))
+		assert n1.value == n2.value
+		assert n1.value != n3.value
+
+	def test_dummy_pickle(self):
+		import pickle
+		import random
+		tree = adv_parser.parse("_ + _")
+		tree2 = pickle.loads(pickle.dumps(tree))
+		assert tree.eval({}, rng = random.Random(0)).value == tree2.eval({}, rng = random.Random(0)).value
+
 	def test_complicated_expr(self):
 		const = parser.parse("4*(5/2 - I)*(10 + 4*I)/29").eval({})
 		assert const.value != 4 # Cannot be implicitly simplified to 4
@@ -380,3 +401,333 @@ class TestPrecedence:
 		assert n.value == -72
 		assert n.value != -479001600 # -(12!)
 		assert n.value != zoo # (-12)!
+
+class TestTokenizerEngine:
+	lexer = calcs.calculator.Lexer(['+', '-', '*', '**', '<->', '<', '->', ':=&', ':=', '.', '!', '(', ')', ','])
+	regex_lexer = calcs.calculator.Lexer(['+', '-', '*', '**', '<->', '<', '->', ':=&', ':=', '.', '!', '(', ')', ','], engine = calcs.TokenizerEngine.REGEX)
+
+	@staticmethod
+	def dump(tokens):
+		return [(type(t), t.string, t.position, t.origin) for t in tokens]
+
+	@pytest.mark.parametrize('s', [
+		"",
+		"   ",
+		"42",
+		"3.14 + 42",
+		"a<->b->c",
+		"x:=&y",
+		"3**-2!",
+		"  foo  bar\tbaz ",
+		R"""'foo bar   42\'\"\\\1\a...++ "'""",
+		R'''"foo" . 'bar'"baz"''',
+		"abc'def'ghi",
+		"(1, 2, 3)",
+		"中文+1",
+	])
+	def test_equivalence(self, s):
+		assert self.dump(self.regex_lexer.tokenize(s)) == self.dump(self.lexer.tokenize(s))
+
+	@pytest.mark.parametrize('s', [
+		"'123",
+		'"123',
+		R"'123\'",
+		"123@456",
+	])
+	def test_equivalence_error(self, s):
+		with pytest.raises(calcs.exceptions.TokenizeError) as e1:
+			self.lexer.tokenize(s)
+		with pytest.raises(calcs.exceptions.TokenizeError) as e2:
+			self.regex_lexer.tokenize(s)
+		assert e1.value.args == e2.value.args
+
+	def test_symbol_re(self):
+		import re
+		ops = ['+', '-', '**']
+		lexer = calcs.calculator.Lexer(ops, symbol_re = re.compile(r'[+\-*]'))
+		regex_lexer = calcs.calculator.Lexer(ops, symbol_re = re.compile(r'[+\-*]'), engine = calcs.TokenizerEngine.REGEX)
+		for s in ("+ -", "** +", "+'foo'-"):
+			assert self.dump(regex_lexer.tokenize(s)) == self.dump(lexer.tokenize(s))
+
+	def test_parser(self):
+		regex_parser = calcs.give_advanced_parser()
+		regex_parser = calcs.Parser(
+			regex_parser._prefix_ops,
+			regex_parser._postfix_ops,
+			regex_parser._ptable,
+			engine = calcs.TokenizerEngine.REGEX
+		)
+		n = regex_parser.parse("len 'foo' + 0003.14 * 2").eval({})
+		assert n.value == Rational("9.28")
+
+class TestSymbolSplit:
+	def test_backtrack(self):
+		tokens = adv_parser._lexer.tokenize("x:=&y<->z**-1")
+		assert [t.string for t in tokens] == ['x', ':=&', 'y', '<->', 'z', '**', '-', '1']
+		assert [t.position for t in tokens] == [1, 2, 5, 6, 9, 10, 12, 13]
+
+	def test_long_run(self):
+		tokens = adv_parser._lexer.tokenize("3" + "-" * 5000 + "5")
+		assert len(tokens) == 5002
+		n = adv_parser.parse("3" + "-" * 51 + "5").eval({})
+		assert n.value == -2
+
+	def test_long_postfix_run(self):
+		tokens = adv_parser._lexer.tokenize("0" + "!" * 5000)
+		assert len(tokens) == 5001
+
+	def test_unsplittable_run(self):
+		with pytest.raises(calcs.exceptions.TokenizeError):
+			adv_parser._lexer.tokenize("1" + "-" * 5000 + "@")
+
+class TestFindCache:
+	def test_hit_miss(self):
+		# A parser of its own, since given parsers are shared
+		basic = calcs.give_basic_parser()
+		p = calcs.Parser(basic._prefix_ops, basic._postfix_ops, basic._ptable)
+		p.parse("1+-2")
+		info = p.lexer.find_cache_info
+		assert info.misses == 1
+		assert info.hits == 0
+		p.parse("3+-4")
+		info = p.lexer.find_cache_info
+		assert info.misses == 1
+		assert info.hits == 1
+
+	def test_bounded(self):
+		basic = calcs.give_basic_parser()
+		p = calcs.Parser(basic._prefix_ops, basic._postfix_ops, basic._ptable, find_cache_size = 2)
+		for s in ("1+-2", "1*-2", "1-+2", "1+-2"):
+			p.parse(s)
+		info = p.lexer.find_cache_info
+		assert info.size == 2
+		assert info.capacity == 2
+		assert info.evictions == 2
+		assert info.hits == 0
+
+	def test_unbounded(self):
+		basic = calcs.give_basic_parser()
+		p = calcs.Parser(basic._prefix_ops, basic._postfix_ops, basic._ptable, find_cache_size = None)
+		for s in ("1+-2", "1*-2", "1-+2", "1+-2"):
+			p.parse(s)
+		info = p.lexer.find_cache_info
+		assert info.size == 3
+		assert info.evictions == 0
+		assert info.hits == 1
+
+class TestIterTokens:
+	def test_same_as_tokenize(self):
+		s = "x = 003.14j + 'foo' . 1.5; y"
+		streamed = adv_parser.lexer.iter_tokens(s)
+		assert not isinstance(streamed, list)
+		assert [(t.string, t.position, t.origin) for t in streamed] == [(t.string, t.position, t.origin) for t in adv_parser.lexer.tokenize(s)]
+
+	def test_lazy(self):
+		tokens = adv_parser.lexer.iter_tokens("1 + 2 @ 'unclosed")
+		assert next(tokens).string == '1'
+		assert next(tokens).string == '+'
+		with pytest.raises(calcs.exceptions.TokenizeError):
+			list(tokens)
+
+	def test_decimal_stream(self):
+		tokens = adv_parser._token_preprocessor_for_decimal(iter(adv_parser.lexer._split_state_machine("0003.14 + 1. 5")))
+		assert [t.string for t in tokens] == ['3.14', '+', '1', '.', '5']
+
+class TestCompact:
+	def test_token_slots(self):
+		for token in adv_parser.lexer.tokenize("x = 'foo' . 3.14"):
+			assert not hasattr(token, '__dict__')
+
+	def test_string_origin(self):
+		s = R"""1 + 'foo\'bar'"""
+		token = adv_parser.lexer.tokenize(s)[-1]
+		assert token.string == "foo'bar"
+		assert token.origin == R"""'foo\'bar'"""
+		assert token.source is s
+
+	def test_node_slots(self):
+		node = calcs.Parser.InfixOPNode('+', 1, calcs.Parser.WordNode('x', 1))
+		assert not hasattr(node, '__dict__')
+		assert str(node) == '(x)+'
+
+class TestDeep:
+	def test_deep_plus(self):
+		tree = adv_parser.parse("+".join(["1"] * 20000))
+		assert tree.eval({}).value == 20000
+
+	def test_deep_statements(self):
+		mapping = {}
+		tree = adv_parser.parse("x := 0; " + "x = x + 1; " * 3000 + "x")
+		assert tree.eval(mapping).value == 3000
+
+	def test_deep_prefix(self):
+		tree = adv_parser.parse("-" * 5000 + "5")
+		assert tree.eval({}).value == 5
+
+	def test_deep_mixed(self):
+		# Non-strict operators in between
+		tree = adv_parser.parse("(true && " * 100 + "1 + 1" + ")" * 100 + " + " + "+".join(["1"] * 3000))
+		assert tree.eval({}).value == 3001
+
+	def test_deep_shortcut_parsed(self):
+		assert adv_parser.parse(" && ".join(["true"] * 20000)).eval({}).value is True
+		assert adv_parser.parse(" || ".join(["false"] * 20000)).eval({}).value is False
+		assert adv_parser.parse(" -> ".join(["true"] * 20000)).eval({}).value is True
+
+	# Trees of 10 ** 5 levels are built directly, which is much faster than parsing them
+	@pytest.mark.parametrize('cls, leaf', [(AndOperator, True), (OrOperator, False), (ImplOperator, True)])
+	def test_deep_shortcut(self, cls, leaf):
+		right = left = calcs.BooleanConstant(leaf)
+		for _ in range(10 ** 5):
+			right = cls(calcs.BooleanConstant(leaf), right)
+			left = cls(left, calcs.BooleanConstant(leaf))
+		assert right.eval({}).value is leaf
+		assert left.eval({}).value is leaf
+
+		# A deep chain evaluating an operand raising at its end, and the same chain not evaluated
+		chain = MinusOperator(calcs.StringConstant('a'), calcs.NumberConstant(Integer(1)))
+		for _ in range(10 ** 5):
+			chain = cls(calcs.BooleanConstant(leaf), chain)
+		with pytest.raises(ValueError):
+			chain.eval({})
+		assert cls(calcs.BooleanConstant(not leaf), chain).eval({}).value is (cls is not AndOperator)
+
+	def test_deep_if(self):
+		true, false = calcs.BooleanConstant(True), calcs.BooleanConstant(False)
+		tree = calcs.NumberConstant(Integer(1))
+		for i in range(10 ** 5):
+			if i % 2 == 0:
+				tree = IfThenElseOperator(true, tree, calcs.Var('undefined'))
+			else:
+				tree = IfThenElseOperator(false, calcs.Var('undefined'), tree)
+		assert tree.eval({}).value == 1
+		# Nested in the condition
+		tree = IfThenElseOperator(tree, true, false)
+		for _ in range(10 ** 5):
+			tree = IfThenElseOperator(tree, true, false)
+		assert tree.eval({}).value is True
+
+	def test_apply_var(self):
+		tree = adv_parser.parse("+".join(["x"] * 20000))
+		names = []
+		tree.apply_var(lambda v: names.append(v.name))
+		assert len(names) == 20000
+
+class TestParseCache:
+	def make_parser(self, size = 2):
+		return calcs.Parser(adv_parser._prefix_ops, adv_parser._postfix_ops, adv_parser._ptable, parse_cache_size = size)
+
+	def test_disabled(self):
+		assert adv_parser.parse_cache_info is None
+		assert adv_parser.parse("1 + 1") is not adv_parser.parse("1 + 1")
+
+	def test_hit(self):
+		p = self.make_parser()
+		t = p.parse("x + 1")
+		assert p.parse("x + 1") is t
+		info = p.parse_cache_info
+		assert (info.hits, info.misses, info.size) == (1, 1, 1)
+		mapping = {calcs.Var('x'): calcs.LValue(calcs.Var('x'), calcs.NumberConstant(Integer(41)))}
+		assert t.eval(mapping).value == 42
+
+	def test_bounded(self):
+		p = self.make_parser()
+		for s in ("1", "2", "3", "1"):
+			p.parse(s)
+		info = p.parse_cache_info
+		assert info.evictions == 2
+		assert info.size == 2
+
+	def test_clear(self):
+		p = self.make_parser()
+		t = p.parse("1 + 1")
+		p.clear_parse_cache()
+		assert p.parse_cache_info.size == 0
+		assert p.parse("1 + 1") is not t
+
+	def test_error_not_cached(self):
+		p = self.make_parser()
+		with pytest.raises(calcs.exceptions.ParseError):
+			p.parse("1 +")
+		assert p.parse_cache_info.size == 0
+
+	def test_wildcard_not_frozen(self):
+		p = self.make_parser()
+		t = p.parse("_ + 1")
+		assert p.parse("_ + 1") is t
+		assert t.eval({}).value != t.eval({}).value
+
+class TestPrecision:
+	parser = calcs.Parser(adv_parser._prefix_ops, adv_parser._postfix_ops, adv_parser._ptable, precision = 15)
+
+	def test_literal(self):
+		n = self.parser.parse("0.1").eval({})
+		assert n.is_approx
+		assert n.approx(15) == 0.1
+		n = self.parser.parse("2.5i").eval({})
+		assert n.approx(15) == 2.5j
+
+	def test_integer_exact(self):
+		assert self.parser.parse("3").eval({}).is_native
+		assert self.parser.parse("'ab' * 2").eval({}).value == 'abab'
+
+	def test_arithmetic(self):
+		n = self.parser.parse("0.1 + 0.2").eval({})
+		assert n.approx(15) == 0.1 + 0.2
+		n = self.parser.parse("2 ** 0.5").eval({})
+		assert n.approx(15) == 2 ** 0.5
+
+class TestShared:
+	def test_given(self):
+		assert calcs.give_basic_parser() is calcs.give_basic_parser()
+		assert calcs.give_advanced_parser() is calcs.give_advanced_parser([], [])
+		extra = [calcs.OperatorInfo(calcs.op_num.RealOperator, 're')]
+		p = calcs.give_advanced_parser(extra)
+		assert p is calcs.give_advanced_parser([calcs.OperatorInfo(calcs.op_num.RealOperator, 're')])
+		assert p is not calcs.give_advanced_parser()
+
+	def test_shared(self):
+		args = (adv_parser._prefix_ops, adv_parser._postfix_ops, adv_parser._ptable)
+		p = calcs.Parser.shared(*args, find_cache_size = 7)
+		assert calcs.Parser.shared(*args, find_cache_size = 7) is p
+		assert calcs.Parser.shared(*args, find_cache_size = 8) is not p
+
+	def test_fingerprint(self):
+		args = (adv_parser._prefix_ops, adv_parser._postfix_ops, adv_parser._ptable)
+		assert calcs.Parser(*args).fingerprint == adv_parser.fingerprint
+		assert calcs.Parser(*args).lexer.fingerprint == adv_parser.lexer.fingerprint
+		assert calcs.Parser(*args, precision = 15).fingerprint != adv_parser.fingerprint
+		assert calcs.Parser(*args, engine = calcs.TokenizerEngine.REGEX).lexer.fingerprint != adv_parser.lexer.fingerprint
+		assert calcs.give_basic_parser().fingerprint != adv_parser.fingerprint
+
+	def test_local_callables(self):
+		lexer = calcs.calculator.Lexer(['+'], token_preprocessors = [functools.partial(lambda tokens, k: tokens, k = 1)])
+		assert lexer.fingerprint.startswith(calcs.calculator.LOCAL_FINGERPRINT)
+		a = calcs.calculator.Lexer(['+'], token_preprocessors = [lambda tokens: tokens])
+		b = calcs.calculator.Lexer(['+'], token_preprocessors = [lambda tokens: tokens])
+		assert a.fingerprint != b.fingerprint
+
+		def make_operator():
+			class LocalOperator(calcs.op_num.RealOperator):
+				pass
+			return LocalOperator
+
+		first, second = make_operator(), make_operator()
+		p = calcs.Parser.shared([calcs.OperatorInfo(first, 're')])
+		assert calcs.Parser.shared([calcs.OperatorInfo(first, 're')]) is p
+		q = calcs.Parser.shared([calcs.OperatorInfo(second, 're')])
+		assert q is not p
+		assert isinstance(q.parse("re 1"), second)
+
+	def test_pickle(self):
+		p = pickle.loads(pickle.dumps(adv_parser))
+		assert p is adv_parser
+		p = calcs.Parser(adv_parser._prefix_ops, adv_parser._postfix_ops, adv_parser._ptable, parse_cache_size = 4)
+		q = pickle.loads(pickle.dumps(p))
+		assert q.fingerprint == p.fingerprint
+		assert q.parse("1 + 2 * 3").eval({}).value == 7
+		lexer = pickle.loads(pickle.dumps(p.lexer))
+		assert lexer.fingerprint == p.lexer.fingerprint
+		assert [str(t) for t in lexer.tokenize("a+-b")] == ['a', '+', '-', 'b']
+		layer = pickle.loads(pickle.dumps(adv_parser._ptable[10]))
+		assert layer.symbols == adv_parser._ptable[10].symbols
@@ -0,0 +1,120 @@
+import pytest
+import ast
+import random
+import calcs
+from calcs import LValue, OperatorInfo, Var
+from calcs.codegen import compile, generate
+from calcs.op_basic import IfThenElseOperator
+from calcs.op_num import IncrementOperator, PostIncrementOperator
+from calcs.op_utils import RepeatTimesOperator, TypeOperator
+from sympy import Integer
+
+adv_parser = calcs.give_advanced_parser(additional_prefix = [
+	OperatorInfo(IfThenElseOperator, 'if'),
+	OperatorInfo(IncrementOperator, 'inc'),
+	OperatorInfo(PostIncrementOperator, 'postinc'),
+	OperatorInfo(RepeatTimesOperator, 'repeatN'),
+	OperatorInfo(TypeOperator, 'type'),
+])
+
+def make_mapping():
+	x, y = Var('x'), Var('y')
+	return {x: LValue(x, calcs.NumberConstant(Integer(42))), y: LValue(y, calcs.StringConstant('foo'))}
+
+def run(f, mapping):
+	try:
+		value = f(mapping)
+	except Exception as e:
+		return ('error', type(e), str(e))
+
+	if value.is_lvalue:
+		return ('lvalue', value.var.name, type(value.content), value.value, value.content.is_dummy)
+	return (type(value), value.value, value.is_dummy)
+
+def dump_mapping(mapping):
+	return {v.name: (type(lv.content), lv.value) for v, lv in mapping.items()}
+
+def check(tree):
+	m1, m2 = make_mapping(), make_mapping()
+	assert run(compile(tree), m1) == run(tree.eval, m2)
+	assert dump_mapping(m1) == dump_mapping(m2)
+
+@pytest.mark.parametrize('s', [
+	"1 + 2 * 3",
+	"x * 2 + 1",
+	"y . x",
+	"x = 3; x = x * 5",
+	"z := x; z = 1; x",
+	"z :=& x; z = 'bar'; x",
+	"inc x",
+	"postinc x; x",
+	"false && undefined",
+	"true || undefined",
+	"x < 0 -> undefined",
+	"if (x > 0, 'pos', undefined)",
+	"if (x < 0, undefined, -x)",
+	"(if (x > 0, (x = 1), (x = 2))); x",
+	"dummy 3",
+	"pass (dummy 3, dummy 4)",
+	"repeatN (3, x = x + 1)",
+	"type (x . y)",
+	"reverse (x / 2)",
+	"undefined + 1",
+	"'foo' - 1",
+	"raise 'error'",
+	"x := 1",
+	"x * 2 - 3 > -x",
+	"x == 42 && x != 1.5",
+	"(dummy 3) + x",
+	"true + 1 < x",
+	"y + 1 >= x",
+	"x * x * x * x * x * x * x * x * x * x * x * x",
+])
+def test_same_as_eval(s):
+	check(adv_parser.parse(s))
+
+def test_generate():
+	module, namespace = generate(adv_parser.parse("x + 1"))
+	assert isinstance(module, ast.Module)
+	assert isinstance(module.body[0], ast.FunctionDef)
+	assert any(v is not None and isinstance(v, calcs.Var) for v in namespace.values())
+
+def test_inline():
+	tree = adv_parser.parse("x * 2 + 1 > 80 || undefined")
+	module, namespace = generate(tree)
+	source = ast.unparse(module)
+	assert '._value * 2' in source and '._value > 80' in source
+	# Approximate mode goes through apply()
+	for kwargs in ({}, {'precision': 15}):
+		assert repr(compile(tree)(make_mapping(), **kwargs)) == repr(tree.eval(make_mapping(), **kwargs))
+	value = compile(adv_parser.parse("x * 3 / 7"))(make_mapping(), precision = 15)
+	assert value.is_approx
+
+def test_deep():
+	tree = adv_parser.parse("+".join(["1"] * 5000))
+	assert compile(tree)({}).value == 5000
+
+def test_long_if_chain():
+	tree = adv_parser.parse("if (x > 0, " * 50 + "1" + ", 0)" * 50)
+	check(tree)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_differential(seed):
+	rng = random.Random(seed)
+	leaves = ["x", "y", "1", "2.5", "true", "false", "'a'", "undefined"]
+	infixes = ["+", "-", "*", "/", ".", "<", "==", "&&", "||", "->", "xor", "=", ";"]
+	prefixes = ["-", "~", "abs", "len", "type", "inc", "solid", "dummy"]
+
+	def expr(depth):
+		k = rng.random()
+		if depth == 0 or k < 0.2:
+			return rng.choice(leaves)
+		elif k < 0.4:
+			return f"{rng.choice(prefixes)} ({expr(depth - 1)})"
+		elif k < 0.5:
+			return f"if ({expr(depth - 1)}, {expr(depth - 1)}, {expr(depth - 1)})"
+		else:
+			return f"({expr(depth - 1)}) {rng.choice(infixes)} ({expr(depth - 1)})"
+
+	for _ in range(50):
+		check(adv_parser.parse(expr(4)))
@@ -0,0 +1,91 @@
+import pytest
+import calcs
+from calcs import LValue, OperatorInfo, Var
+from calcs.compiler import compile
+from calcs.op_basic import IfThenElseOperator
+from calcs.op_num import IncrementOperator, PostIncrementOperator
+from calcs.op_utils import RepeatTimesOperator
+from sympy import Integer
+
+adv_parser = calcs.give_advanced_parser(additional_prefix = [
+	OperatorInfo(IfThenElseOperator, 'if'),
+	OperatorInfo(IncrementOperator, 'inc'),
+	OperatorInfo(PostIncrementOperator, 'postinc'),
+	OperatorInfo(RepeatTimesOperator, 'repeatN'),
+])
+
+def make_mapping():
+	x, y = Var('x'), Var('y')
+	return {x: LValue(x, calcs.NumberConstant(Integer(42))), y: LValue(y, calcs.StringConstant('foo'))}
+
+def dump(value):
+	if value.is_lvalue:
+		return ('lvalue', value.var.name, type(value.content), value.value, value.content.is_dummy)
+	return (type(value), value.value, value.is_dummy)
+
+@pytest.mark.parametrize('s', [
+	"1 + 2 * 3",
+	"x * 2 + 1",
+	"y . x",
+	"x = 3; x = x * 5",
+	"z := x; z = 1; x",
+	"z :=& x; z = 'bar'; x",
+	"inc x",
+	"postinc x; x",
+	"x > 41 && len y == 3",
+	"false && undefined",
+	"true || undefined",
+	"x < 0 -> undefined",
+	"if (x > 0, 'pos', undefined)",
+	"if (x < 0, undefined, -x)",
+	"dummy 3",
+	"solid (dummy 3)",
+	"pass (dummy 3, dummy 4)",
+	"move x",
+	"repeatN (3, x = x + 1)",
+	"len y + abs (-3) ** 2",
+	"reverse (x / 2)",
+	"true xor false <-> true",
+])
+def test_same_as_eval(s):
+	tree = adv_parser.parse(s)
+	m1, m2 = make_mapping(), make_mapping()
+	assert dump(compile(tree)(m1)) == dump(tree.eval(m2))
+	assert {v.name: dump(lv) for v, lv in m1.items()} == {v.name: dump(lv) for v, lv in m2.items()}
+
+@pytest.mark.parametrize('s', [
+	"undefined + 1",
+	"'foo' - 1",
+	"raise 'error'",
+	"x := 1",
+])
+def test_same_error(s):
+	tree = adv_parser.parse(s)
+	with pytest.raises(Exception) as e1:
+		tree.eval(make_mapping())
+	with pytest.raises(Exception) as e2:
+		compile(tree)(make_mapping())
+	assert type(e1.value) is type(e2.value)
+	assert str(e1.value) == str(e2.value)
+
+def test_anonymous():
+	tree = adv_parser.parse("u = u + 2; u")
+	mapping = {}
+	n = compile(tree)(mapping, anonymous_var = True)
+	assert n.value == 2
+	assert len(mapping) == 1
+
+def test_reuse():
+	f = compile(adv_parser.parse("x * 2"))
+	for i in range(3):
+		x = Var('x')
+		assert f({x: LValue(x, calcs.NumberConstant(Integer(i)))}).value == 2 * i
+
+def test_wildcard():
+	import random
+	f = compile(adv_parser.parse("_ + 1"))
+	assert f({}, rng = random.Random(0)).value == f({}, rng = random.Random(0)).value
+
+def test_deep():
+	tree = adv_parser.parse("+".join(["1"] * 5000))
+	assert compile(tree)({}).value == 5000
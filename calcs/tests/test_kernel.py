@@ -0,0 +1,84 @@
+import pytest
+import pickle
+import calcs
+from calcs import LValue, OperatorInfo, Var
+from calcs.kernel import NumericKernelOperator, compile_kernels
+from calcs.op_num import ImagOperator, RealOperator
+from sympy import I, Integer, Rational
+
+adv_parser = calcs.give_advanced_parser(additional_prefix = [
+	OperatorInfo(RealOperator, 're'),
+	OperatorInfo(ImagOperator, 'im'),
+])
+
+def make_mapping(**values):
+	return {Var(k): LValue(Var(k), v if isinstance(v, calcs.Constant) else calcs.NumberConstant(v)) for k, v in values.items()}
+
+def kernels(tree):
+	found = []
+	stack = [tree]
+	while len(stack) > 0:
+		node = stack.pop()
+		if isinstance(node, NumericKernelOperator):
+			found.append(node)
+		if isinstance(node, calcs.Operator):
+			stack.extend(node._operands)
+	return found
+
+@pytest.mark.parametrize('s', [
+	"x * x + 2 * x * y - y ** 3 / 7",
+	"(abs(x - y)) + 1/3",
+	"x ** 0.5 + y",
+	"(re(x * 2i)) + (im(y + 3i))",
+	"-x + +y",
+	"x * 2 > y",
+	"x / y <= 1/2",
+])
+def test_same_as_approx(s):
+	tree = adv_parser.parse(s)
+	compiled = compile_kernels(tree)
+	assert isinstance(compiled, NumericKernelOperator)
+	for x, y in [(3, Rational(5, 2)), (-2, 7), (0.5, -1.25)]:
+		mapping = make_mapping(x = x, y = y)
+		expected = tree.eval(mapping, precision = 15)
+		result = compiled.eval(mapping)
+		if expected.is_bool:
+			assert result.value == expected.value
+		else:
+			assert result.is_approx or result.is_native
+			assert complex(result.approx(15)) == pytest.approx(complex(expected.approx(15)))
+
+def test_largest_subtrees():
+	tree = compile_kernels(adv_parser.parse("print(x + 1); y := x * 2 . 'a'; 1 + 2"))
+	assert [repr(k._operands[0]) for k in kernels(tree)] == ['MultipleOperator(x, 2)', 'PlusOperator(x, 1)']
+
+def test_constants_not_compiled():
+	tree = adv_parser.parse("1 + 2 * 3")
+	assert compile_kernels(tree) is tree
+
+def test_input_not_modified():
+	tree = adv_parser.parse("(x + 1) . 'a'")
+	r = repr(tree)
+	compile_kernels(tree)
+	assert repr(tree) == r
+
+def test_fallback():
+	tree = compile_kernels(adv_parser.parse("x / y"))
+	# Division by zero is evaluated in the approximate mode
+	assert tree.eval(make_mapping(x = 1, y = 0)).value == calcs.NumberConstant(Integer(1) / 0).value
+	# Variables which are not numbers
+	with pytest.raises(ValueError):
+		tree.eval(make_mapping(x = calcs.StringConstant('a'), y = 2))
+	# Comparisons of complex numbers
+	tree = compile_kernels(adv_parser.parse("x < y"))
+	assert tree.eval(make_mapping(x = I, y = I)).value
+	# Undefined variables
+	with pytest.raises(ValueError):
+		tree.eval({})
+
+def test_pickle():
+	tree = compile_kernels(adv_parser.parse("x * 2 + 1"))
+	mapping = make_mapping(x = 3)
+	assert tree.eval(mapping).approx(15) == 7.0
+	tree = pickle.loads(pickle.dumps(tree))
+	assert tree.eval(mapping).approx(15) == 7.0
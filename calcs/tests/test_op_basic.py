@@ -453,3 +453,107 @@ class TestIfThenElse:
 		n = self.parser.parse("ifthenelse (false, x=1, x=0)").eval(mapping)
 		assert n.is_lvalue
 		assert mapping[x].value == 0
+
+class TestNative:
+	# Integers are computed without SymPy, but must give the same values
+	values = [Integer(0), Integer(1), Integer(-7), Integer(12), Rational(1, 3), Rational(-5, 2), Integer(10) ** 30]
+
+	@pytest.mark.parametrize('op, f', [
+		(PlusOperator, lambda a, b: a + b),
+		(MinusOperator, lambda a, b: a - b),
+		(MultipleOperator, lambda a, b: a * b),
+		(DivideOperator, lambda a, b: a / b),
+		(IntegerDivideOperator, lambda a, b: a // b),
+		(ModuloOperator, lambda a, b: a % b),
+		(LessOperator, lambda a, b: a < b),
+		(GeOperator, lambda a, b: a >= b),
+		(EqualOperator, lambda a, b: a == b),
+		(NonequalOperator, lambda a, b: a != b),
+	])
+	def test_binary(self, op, f):
+		for a in self.values:
+			for b in self.values:
+				x, y = calcs.NumberConstant(a), calcs.NumberConstant(b)
+				try:
+					expected = f(a, b)
+				except ZeroDivisionError:
+					with pytest.raises(ZeroDivisionError):
+						op(x, y).eval({})
+					continue
+
+				n = op(x, y).eval({})
+				assert n.value == expected
+				if n.is_number:
+					assert type(n.value) is type(expected)
+
+	def test_nary(self):
+		args = [calcs.NumberConstant(v) for v in self.values[1:]]
+		assert SumOperator(*args).eval({}).value == sum(self.values[1:])
+		assert ProductOperator(*args).eval({}).value == Integer(-7) * 12 * Rational(1, 3) * Rational(-5, 2) * Integer(10) ** 30
+
+	def test_native(self):
+		n = parser.parse("1/2 + 3/2").eval({})
+		assert n.is_native
+		assert type(n.native) is int
+		assert type(n.value) is Integer
+		assert not parser.parse("1/2").eval({}).is_native
+
+	def test_promotion(self):
+		n = parser.parse("(1/2 + 1/3) * 2i").eval({})
+		assert not n.is_native
+		assert n.value == Rational(5, 3) * I
+		n = parser.parse("1/3 + 0.5").eval({})
+		assert n.value == Rational(5, 6)
+
+	def test_divide_zero(self):
+		assert parser.parse("1 / 0").eval({}).value == S.ComplexInfinity
+		assert parser.parse("0 / 0").eval({}).value is S.NaN
+
+class TestApprox:
+	def test_float(self):
+		n = parser.parse("1/3 + 1").eval({}, precision = 15)
+		assert n.is_approx
+		assert n.precision == 15
+		assert type(n.approx(15)) is float
+		assert str(n) == str(1 / 3 + 1)
+
+	def test_exact_without_precision(self):
+		n = parser.parse("1/3 + 1").eval({})
+		assert not n.is_approx
+		assert n.value == Rational(4, 3)
+
+	def test_high_precision(self):
+		n = parser.parse("1/3").eval({}, precision = 40)
+		assert n.precision == 40
+		assert str(n).startswith('0.' + '3' * 39)
+
+	def test_promotion(self):
+		# Exact numbers become approximate with an approximate operand
+		x = calcs.NumberConstant(0.5)
+		n = PlusOperator(x, calcs.NumberConstant(Rational(1, 4))).eval({})
+		assert n.is_approx
+		assert n.approx(15) == 0.75
+		# The highest precision wins
+		y = calcs.NumberConstant(calcs.approx.to_approx(Rational(1, 3), 30))
+		assert MultipleOperator(x, y).eval({}).precision == 30
+
+	def test_nary(self):
+		args = [calcs.NumberConstant(Integer(i)) for i in range(1, 5)]
+		assert SumOperator(*args).eval({}, precision = 15).approx(15) == 10.0
+		assert ProductOperator(*args).eval({}, precision = 15).approx(15) == 24.0
+		assert SumOperator(*args).eval({}).is_native
+
+	def test_divide(self):
+		assert parser.parse("7.5 // -2").eval({}, precision = 15).approx(15) == -4.0
+		assert parser.parse("7.5 % -2").eval({}, precision = 20).approx(20) == -0.5
+		# Division by zero stays exact
+		assert parser.parse("1 / 0").eval({}, precision = 15).value == S.ComplexInfinity
+
+	def test_compare(self):
+		assert parser.parse("1/3 < 0.34").eval({}, precision = 15).value
+		assert parser.parse("0.1 + 0.2 == 0.3").eval({}, precision = 15).value is False
+		assert parser.parse("0.1 + 0.2 == 0.3").eval({}).value
+
+	def test_negative(self):
+		n = parser.parse("-(1/4)").eval({}, precision = 15)
+		assert n.approx(15) == -0.25
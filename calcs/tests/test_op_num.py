@@ -2,7 +2,7 @@ import pytest
 import calcs
 from calcs import LValue, OperatorInfo, Var
 from calcs.op_num import *
-from sympy import Integer, Rational
+from sympy import factorial, Integer, Rational
 
 adv_parser = calcs.give_advanced_parser(additional_prefix = [
 	OperatorInfo(RealOperator, 'real'),
@@ -69,3 +69,33 @@ def test_dec(x, mapping):
 	assert not n.is_lvalue
 	assert n.value == 42
 	assert mapping[x].value == 41
+
+def test_native_pow():
+	values = [Integer(0), Integer(1), Integer(-2), Integer(3), Rational(2, 3), Rational(-1, 2)]
+	for a in values:
+		for b in values:
+			n = PowOperator(calcs.NumberConstant(a), calcs.NumberConstant(b)).eval({})
+			assert n.value == a ** b
+			assert type(n.value) is type(a ** b)
+
+def test_native_factorial():
+	n = FactorialOperator(calcs.NumberConstant(Integer(20))).eval({})
+	assert n.is_native
+	assert n.value == factorial(20)
+
+class TestApprox:
+	def test_pow_overflow(self):
+		# Out of the range of float, so mpmath takes over
+		n = adv_parser.parse("2 ** 100000").eval({}, precision = 15)
+		assert n.is_approx
+		assert str(n).endswith('e+30102')
+
+	def test_factorial(self):
+		assert adv_parser.parse("5!").eval({}, precision = 15).approx(15) == 120.0
+		assert str(adv_parser.parse("200!").eval({}, precision = 15)).endswith('e+374')
+		with pytest.raises(ValueError):
+			adv_parser.parse("(1/2)!").eval({}, precision = 15)
+
+	def test_abs(self):
+		n = calcs.op_num.AbsOperator(calcs.NumberConstant(-0.5)).eval({})
+		assert n.approx(15) == 0.5
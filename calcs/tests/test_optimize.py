@@ -0,0 +1,246 @@
+import pytest
+import calcs
+from calcs import Constant, LValue, OperatorInfo, Var
+from calcs.exceptions import UserDefinedError
+from calcs.optimize import eliminate_common_subexpressions, eliminate_dead_code, flatten_associative, fold_constants
+from calcs.op_basic import IfThenElseOperator, PlusOperator, ProductOperator, SumOperator
+from calcs.op_num import IncrementOperator
+from calcs.op_utils import MemoScopeOperator, RepeatTimesOperator, SequenceOperator, SharedOperator
+from sympy import Integer
+import random
+
+adv_parser = calcs.give_advanced_parser(additional_prefix = [
+	OperatorInfo(IfThenElseOperator, 'if'),
+	OperatorInfo(RepeatTimesOperator, 'repeatN'),
+	OperatorInfo(IncrementOperator, 'inc'),
+])
+
+def make_mapping():
+	x = Var('x')
+	return {x: LValue(x, calcs.NumberConstant(Integer(42)))}
+
+def test_fold():
+	tree = adv_parser.parse("x * (2**10 + 3!) / 7")
+	folded = fold_constants(tree)
+	assert isinstance(folded._operands[1], Constant)
+	assert folded._operands[1].value == 7
+	assert isinstance(folded._operands[0]._operands[1], Constant)
+	assert folded._operands[0]._operands[1].value == 1030
+	assert folded.eval(make_mapping()).value == tree.eval(make_mapping()).value
+
+def test_whole():
+	folded = fold_constants(adv_parser.parse("if (1 < 2, 'a' . 'b', 3)"))
+	assert isinstance(folded, Constant)
+	assert folded.value == 'ab'
+
+def test_not_modified():
+	tree = adv_parser.parse("x + (1 + 2)")
+	operand = tree._operands[1]
+	fold_constants(tree)
+	assert tree._operands[1] is operand
+
+def test_dummy():
+	assert fold_constants(adv_parser.parse("pass (1, dummy 3)")).is_dummy
+	assert not fold_constants(adv_parser.parse("+ (dummy 3)")).is_dummy
+	assert fold_constants(adv_parser.parse("dummy 3")).is_dummy
+
+@pytest.mark.parametrize('s', [
+	"random 5",
+	"_ + 1",
+	"raise 'error'",
+	"x = 1 + 2",
+	"y := 3",
+	"reverse (4 - 1)",
+])
+def test_impure(s):
+	assert not isinstance(fold_constants(adv_parser.parse(s)), Constant)
+
+def test_assign():
+	tree = fold_constants(adv_parser.parse("x = 1 + 2"))
+	assert isinstance(tree._operands[1], Constant)
+	mapping = make_mapping()
+	assert tree.eval(mapping).value == 3
+	assert mapping[Var('x')].value == 3
+
+def test_reverse():
+	tree = fold_constants(adv_parser.parse("reverse (4 - 1)"))
+	assert tree.eval({}).value == -3
+
+def test_error_kept():
+	tree = fold_constants(adv_parser.parse("x + ('a' - 1)"))
+	with pytest.raises(ValueError):
+		tree.eval(make_mapping())
+
+def test_deep():
+	tree = fold_constants(adv_parser.parse("+".join(["1"] * 5000) + " + x"))
+	assert tree._operands[0].value == 5000
+	assert tree.eval(make_mapping()).value == 5042
+
+def test_print():
+	# Print only formats its operand
+	folded = fold_constants(adv_parser.parse("print (1 + 2)"))
+	assert isinstance(folded, Constant)
+	assert folded.value == '3'
+
+def test_dead_code():
+	tree = eliminate_dead_code(fold_constants(adv_parser.parse("1 + 2; 'a'; x = 3; dummy 4; x * 2")))
+	assert isinstance(tree, SequenceOperator)
+	assert len(tree._operands) == 2
+	mapping = make_mapping()
+	assert tree.eval(mapping).value == 6
+	assert mapping[Var('x')].value == 3
+
+def test_dead_code_errors():
+	s = "x + 1; undefined; 'a' - 1; y := 2; y"
+	tree = eliminate_dead_code(adv_parser.parse(s))
+	assert len(tree._operands) == 5
+	with pytest.raises(ValueError):
+		tree.eval(make_mapping())
+
+	tree = eliminate_dead_code(adv_parser.parse(s), keep_errors = False)
+	assert len(tree._operands) == 2
+	assert tree.eval(make_mapping()).value == 2
+
+def test_dead_code_typed():
+	# Operators on constants of the types they never raise on are dead without folding
+	tree = eliminate_dead_code(adv_parser.parse("1 - 2 * 3; 'a' . 4 < 5; (len 'abc') / 2; 1 // 0; 'a' - 1; y := 2; y"))
+	# A string is compared with a number, and the others may raise
+	assert [type(o).__name__ for o in tree._operands] == ['LessOperator', 'IntegerDivideOperator', 'MinusOperator', 'DeclareOperator', 'Var']
+
+def test_dead_code_raise():
+	tree = eliminate_dead_code(adv_parser.parse("x + 1; raise 'boom'; 2"), keep_errors = False)
+	with pytest.raises(UserDefinedError):
+		tree.eval(make_mapping())
+
+def test_dead_code_last():
+	# The last statement gives the value and keeps its dummy attribute
+	tree = eliminate_dead_code(adv_parser.parse("1; 2; dummy 3"))
+	assert isinstance(tree, Constant) is False
+	assert tree.eval({}).is_dummy
+	assert eliminate_dead_code(adv_parser.parse("x; 3"), keep_errors = False).value == 3
+
+def test_dead_code_nested():
+	tree = eliminate_dead_code(adv_parser.parse("(x = 1; 2); (if (x > 0, (3; x = x + 1; x), 0)); pass (1, x)"))
+	assert isinstance(tree, SequenceOperator)
+	assert len(tree._operands) == 3
+	assert len(tree._operands[1]._operands[1]._operands) == 2
+	mapping = make_mapping()
+	assert tree.eval(mapping).value == 2
+
+def test_dead_code_long():
+	s = "x = 0; " + "x + 1; x = x + 1; " * 3000 + "x"
+	tree = eliminate_dead_code(adv_parser.parse(s), keep_errors = False)
+	assert len(tree._operands) == 3002
+	assert tree._depth < 10
+	assert tree.eval(make_mapping()).value == 3000
+
+def test_constant_hash():
+	assert hash(calcs.NumberConstant(Integer(2))) == hash(calcs.NumberConstant(Integer(2)))
+	assert len({calcs.NumberConstant(Integer(2)), calcs.NumberConstant(Integer(2)), calcs.StringConstant('2')}) == 2
+
+def count_plus(monkeypatch):
+	calls = []
+	apply = PlusOperator.apply
+	def counted(self, *args, **kwargs):
+		calls.append(self)
+		return apply(self, *args, **kwargs)
+	monkeypatch.setattr(PlusOperator, 'apply', counted)
+	return calls
+
+def make_ab():
+	a, b = Var('a'), Var('b')
+	return {a: LValue(a, calcs.NumberConstant(Integer(2))), b: LValue(b, calcs.NumberConstant(Integer(3)))}
+
+def test_cse(monkeypatch):
+	tree = adv_parser.parse("(a+b)*(a+b) + (a+b)!")
+	dag = eliminate_common_subexpressions(tree)
+	assert isinstance(dag, MemoScopeOperator)
+	mul, fac = dag._operands[0]._operands
+	assert isinstance(mul._operands[0], SharedOperator)
+	assert mul._operands[0] is mul._operands[1] is fac._operands[0]
+
+	calls = count_plus(monkeypatch)
+	assert tree.eval(make_ab()).value == 145
+	assert len(calls) == 4
+	calls.clear()
+	assert dag.eval(make_ab()).value == 145
+	assert len(calls) == 2
+	# A fresh memo for every evaluation
+	mapping = make_ab()
+	mapping[Var('a')].content = calcs.NumberConstant(Integer(1))
+	assert dag.eval(mapping).value == 40
+
+@pytest.mark.parametrize('s', [
+	"(a+b) + (a = 1; a+b)",
+	"(inc a) * (inc a)",
+	"(random()) + (random())",
+	"(_ + 1) * (_ + 1)",
+])
+def test_cse_effects(s):
+	tree = adv_parser.parse(s)
+	assert not isinstance(eliminate_common_subexpressions(tree), MemoScopeOperator)
+
+def test_cse_without_writes():
+	# Var-free subtrees are merged even if the tree writes variables
+	dag = eliminate_common_subexpressions(adv_parser.parse("a = (2 ** 10) * (2 ** 10)"))
+	assert isinstance(dag, MemoScopeOperator)
+	mapping = make_ab()
+	assert dag.eval(mapping).value == 2 ** 20
+	assert mapping[Var('a')].value == 2 ** 20
+
+def test_cse_dummy():
+	# Dummy constants are not merged with plain ones
+	dag = eliminate_common_subexpressions(adv_parser.parse("pass (-(dummy 1), -1)"))
+	assert not isinstance(dag, MemoScopeOperator)
+
+def test_cse_deep():
+	s = "+".join(["(a*b)"] * 3000)
+	dag = eliminate_common_subexpressions(adv_parser.parse(s))
+	assert dag.eval(make_ab()).value == 18000
+
+def test_flatten():
+	tree = flatten_associative(adv_parser.parse("1 + 2 + x * 3 * x + (4 + 5)"))
+	assert isinstance(tree, SumOperator)
+	assert len(tree._operands) == 4
+	assert isinstance(tree._operands[2], ProductOperator)
+	assert isinstance(tree._operands[3], PlusOperator)
+	assert tree.eval(make_mapping()).value == 3 + 3 * 42 * 42 + 9
+
+def test_flatten_right():
+	# The right operands are not followed
+	tree = flatten_associative(adv_parser.parse("0 + 1 + (2 + 'a' + 3)"))
+	assert isinstance(tree, SumOperator)
+	assert len(tree._operands) == 3
+	assert isinstance(tree._operands[2], SumOperator)
+	assert tree.eval({}).value == '12a3'
+
+def test_flatten_binary():
+	# Two operands are left to the binary operator
+	tree = adv_parser.parse("x * (2 + 3)")
+	assert flatten_associative(tree) is tree
+
+@pytest.mark.parametrize('seed', range(5))
+def test_flatten_same(seed):
+	rng = random.Random(seed)
+	terms = ["1", "1/3", "0.1", "2.5", "sqrt", "pi", "I", "(2 + I)", "true", "false", "'a'", "'bc'", "(-3)", "0", "x"]
+	for _ in range(100):
+		op = rng.choice(["+", "*"])
+		s = f" {op} ".join(rng.choice(terms) for _ in range(rng.randint(2, 6)))
+		s = s.replace("sqrt", "parse 'sqrt(2)'")
+		tree = adv_parser.parse(s)
+		try:
+			expected = tree.eval(make_mapping())
+		except Exception as e:
+			with pytest.raises(type(e)):
+				flatten_associative(tree).eval(make_mapping())
+			continue
+
+		result = flatten_associative(tree).eval(make_mapping())
+		assert type(result) is type(expected)
+		assert str(result.value) == str(expected.value)
+		assert result.value == expected.value
+
+def test_flatten_long():
+	tree = flatten_associative(adv_parser.parse(" + ".join(f"parse 'sqrt({i})'" for i in range(1000))))
+	assert len(tree._operands) == 1000
+	assert tree._depth == 2
@@ -0,0 +1,153 @@
+import pytest
+import pickle
+import time
+import calcs
+from calcs import LValue, Var
+from calcs.approx import to_approx
+from calcs.ops import NaryOperator
+from calcs.optimize import eliminate_common_subexpressions
+from calcs.serialize import dumps, loads
+from itertools import cycle, islice
+from sympy import Float, I, Rational, sqrt, zoo
+
+adv_parser = calcs.give_advanced_parser()
+
+def make_mapping(**values):
+	return {Var(k): LValue(Var(k), calcs.NumberConstant(v)) for k, v in values.items()}
+
+def same(a, b):
+	# Iterative, so deep trees can be compared
+	stack = [(a, b)]
+	while len(stack) > 0:
+		x, y = stack.pop()
+		if type(x) is not type(y):
+			return False
+		if isinstance(x, calcs.Operator):
+			if len(x._operands) != len(y._operands):
+				return False
+			stack.extend(zip(x._operands, y._operands))
+		elif repr(x) != repr(y):
+			return False
+	return True
+
+def operator_classes():
+	for module in (calcs.op_assign, calcs.op_basic, calcs.op_num, calcs.op_rng, calcs.op_str, calcs.op_utils):
+		for name in module.__all__:
+			cls = getattr(module, name)
+			if isinstance(cls, type) and issubclass(cls, calcs.Operator) and cls.__module__ == module.__name__:
+				yield cls
+
+@pytest.mark.parametrize('cls', list(operator_classes()), ids = lambda cls: cls.__name__)
+def test_every_operator(cls):
+	n = 3 if issubclass(cls, NaryOperator) else cls.ary
+	operands = [Var('x'), calcs.NumberConstant(2), calcs.StringConstant('s'), calcs.BooleanConstant(True), calcs.Wildcard()]
+	tree = cls(*islice(cycle(operands), n))
+	loaded = loads(dumps(tree))
+	assert type(loaded) is cls
+	assert repr(loaded) == repr(tree)
+
+@pytest.mark.parametrize('s', [
+	"1 + 2 * x - 3/4 ** y",
+	"x := 'abc' . 3i; print(x); (1 + 2) + 2.5",
+	"-(1/3) + 2.5 * (x + 1)!; abs y; x == y || x != y",
+])
+def test_parsed(s):
+	tree = adv_parser.parse(s)
+	loaded = loads(dumps(tree))
+	assert repr(loaded) == repr(tree)
+	assert len(dumps(tree)) < len(pickle.dumps(tree))
+
+@pytest.mark.parametrize('value', [
+	0, -7, 10 ** 40, True, False, 'ünïcode',
+	0.1, -0.0, 1 + 2j,
+	to_approx(Rational(1, 3), 40), to_approx(I / 3, 40),
+	3 * sqrt(2) + I, Float('0.1', 30), Rational(-2, 3), zoo,
+])
+def test_constants(value):
+	if isinstance(value, bool):
+		c = calcs.BooleanConstant(value)
+	elif isinstance(value, str):
+		c = calcs.StringConstant(value)
+	else:
+		c = calcs.NumberConstant(value)
+
+	loaded = loads(dumps(c))
+	assert type(loaded) is type(c)
+	assert repr(loaded) == repr(c)
+	assert repr(loaded._value) == repr(c._value)
+
+def test_dummy():
+	c = calcs.NumberConstant.create_dummy(5)
+	loaded = loads(dumps(c))
+	assert loaded.is_dummy
+	assert loaded == c
+
+def test_shared_subtrees():
+	tree = eliminate_common_subexpressions(adv_parser.parse("(x * y + 1) * (x * y + 1) + (x * y + 1)"))
+	loaded = loads(dumps(tree))
+	assert repr(loaded) == repr(tree)
+	mapping = make_mapping(x = 2, y = 3)
+	assert loaded.eval(mapping) == tree.eval(mapping)
+
+def test_deep():
+	tree = adv_parser.parse(' + '.join(f'x * {i} - {i}/7' for i in range(2000)))
+	assert same(loads(dumps(tree)), tree)
+
+def test_memoryview():
+	tree = adv_parser.parse("x * 2 + 1")
+	buffer = bytearray(b'..' + dumps(tree) + b'..')
+	assert repr(loads(memoryview(buffer)[2:-2])) == repr(tree)
+
+@pytest.mark.parametrize('data', [
+	b'',
+	b'XYZ\x01',
+	b'CLC\x02',
+	b'CLC\x01\x00\x00\x00\x00',
+	b'CLC\x01\x00\x00\x00\x01\x05',
+	b'CLC\x01\x00\x00\x00\x01\x02\x00',
+	b'CLC\x01\x00\x00\x00\x02\x02\x02',
+	b'CLC\x01\x01\x0bos:PathLike\x00\x00\x01\x04',
+	b'CLC\x01\x01\x0fcalcs.types:Var\x00\x00\x01\x04',
+	b'CLC\x01\x01\x0ecalcs.nothing:A\x00\x00\x01\x04',
+])
+def test_invalid(data):
+	with pytest.raises(ValueError):
+		loads(data)
+
+@pytest.mark.parametrize('name', [
+	'calcs.types:Operator',
+	'calcs.ops:BinaryOperator',
+	'calcs.ops:NaryOperator',
+	'calcs.op_basic:_BinaryBoolOperator',
+])
+def test_abstract_operator(name):
+	# One class, then a node of it without operands
+	data = b'CLC\x01\x01' + bytes([len(name)]) + name.encode() + b'\x00\x00\x01\x04'
+	with pytest.raises(ValueError, match = 'Unknown operator'):
+		loads(data)
+
+def test_truncated():
+	data = dumps(adv_parser.parse("x * 2.5 + 'abc'"))
+	for i in range(len(data)):
+		with pytest.raises(ValueError):
+			loads(data[:i])
+
+def test_scoped_variables():
+	with pytest.raises(ValueError):
+		dumps(Var('x', scope = object()))
+
+def test_not_evaluated():
+	# factorial(10 ** 6), which SymPy would compute if it were evaluated
+	data = b'CLC\x01\x00\x00\x01\x04\x04\tfactorial\x01\x00\x80\x89z\x01\x00\x00'
+	start = time.monotonic()
+	c = loads(data)
+	assert time.monotonic() - start < 1
+	assert repr(c) == 'factorial(1000000)'
+
+def test_unknown_function():
+	with pytest.raises(ValueError):
+		loads(b'CLC\x01\x00\x00\x01\x04\x04\x08simplify\x01\x00\x02\x01\x00\x00')
+
+def test_long_integers():
+	for n in (2 ** 200, -(3 ** 5000) + 1, 2 ** (7 * 17)):
+		assert loads(dumps(calcs.NumberConstant(n))).value == n
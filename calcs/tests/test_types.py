@@ -0,0 +1,60 @@
+import pytest
+import calcs
+from calcs import Effect, OperatorInfo, effects_of
+from calcs.op_basic import IfThenElseOperator
+from calcs.op_num import IncrementOperator
+from calcs.op_rng import SetSeedOperator
+from calcs.ops import UnaryOperator
+import inspect
+
+adv_parser = calcs.give_advanced_parser(additional_prefix = [
+	OperatorInfo(IfThenElseOperator, 'if'),
+	OperatorInfo(IncrementOperator, 'inc'),
+	OperatorInfo(SetSeedOperator, 'seed'),
+])
+
+@pytest.mark.parametrize('s, effects', [
+	("1 + 2", Effect.PURE),
+	("1 - 2 * 3 / 4", Effect.PURE),
+	("(1 - 2) < 3 && 'a' . x", Effect.READS_VARS | Effect.MAY_RAISE),
+	("1 - (2 // 3)", Effect.MAY_RAISE),
+	("1 - 'a'", Effect.MAY_RAISE),
+	("(len 'abc') - 1", Effect.PURE),
+	("(1 < 2) == true", Effect.PURE),
+	("'a' + x", Effect.READS_VARS | Effect.MAY_RAISE),
+	("pass (dummy 1, 'a')", Effect.PURE),
+	("x + 1", Effect.READS_VARS | Effect.MAY_RAISE),
+	("x = 1", Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE),
+	("inc x", Effect.READS_VARS | Effect.WRITES_VARS | Effect.MAY_RAISE),
+	("random()", Effect.USES_RNG),
+	("seed 1", Effect.USES_RNG),
+	("_", Effect.USES_RNG),
+	("if (_ < 0.5, 1, 2)", Effect.USES_RNG | Effect.MAY_RAISE),
+])
+def test_effects_of(s, effects):
+	assert effects_of(adv_parser.parse(s)) == effects
+
+def test_unknown():
+	class SomeOperator(UnaryOperator):
+		pass
+
+	assert effects_of(SomeOperator(calcs.BooleanConstant(True))) == Effect.UNKNOWN
+
+@pytest.mark.parametrize('module', [
+	calcs.op_assign,
+	calcs.op_basic,
+	calcs.op_num,
+	calcs.op_rng,
+	calcs.op_str,
+	calcs.op_utils,
+])
+def test_declared(module):
+	# Every operator in the library declares its effects
+	for name in module.__all__:
+		op = getattr(module, name)
+		if inspect.isclass(op) and issubclass(op, calcs.Operator):
+			assert op._effects != Effect.UNKNOWN, name
+
+def test_deep():
+	tree = adv_parser.parse("+".join(["1"] * 5000) + " + x")
+	assert effects_of(tree) == Effect.READS_VARS | Effect.MAY_RAISE
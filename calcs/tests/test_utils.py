@@ -0,0 +1,41 @@
+import pytest
+import pickle
+from calcs.utils import LRUCache
+
+def test_lru_order():
+	cache = LRUCache(2)
+	cache.put('a', 1)
+	cache.put('b', 2)
+	assert cache.get('a') == 1
+	cache.put('c', 3)
+	assert 'a' in cache
+	assert 'b' not in cache
+	assert cache.evictions == 1
+
+def test_lru_stats():
+	cache = LRUCache(2)
+	assert cache.get('a', 42) == 42
+	cache.put('a', None)
+	assert cache.get('a', 42) is None
+	info = cache.info()
+	assert (info.hits, info.misses, info.size) == (1, 1, 1)
+	cache.clear()
+	assert cache.info() == (0, 0, 0, 0, 2)
+
+def test_lru_zero():
+	cache = LRUCache(0)
+	cache.put('a', 1)
+	assert len(cache) == 0
+
+def test_lru_negative():
+	with pytest.raises(ValueError):
+		LRUCache(-1)
+
+def test_lru_pickle():
+	cache = LRUCache(2)
+	cache.put('a', 1)
+	cache = pickle.loads(pickle.dumps(cache))
+	assert cache.capacity == 2
+	assert len(cache) == 0
+	cache.put('a', 1)
+	assert cache.get('a') == 1
@@ -0,0 +1,109 @@
+import pytest
+import calcs
+from calcs import LValue, OperatorInfo, Var
+from calcs.op_basic import IfThenElseOperator
+
+np = pytest.importorskip('numpy')
+from calcs.vectorize import evaluate
+
+adv_parser = calcs.give_advanced_parser(additional_prefix = [
+	OperatorInfo(IfThenElseOperator, 'if'),
+])
+
+columns = {
+	'x': np.array([-3, -2, -1, 0, 1, 2, 3]),
+	'y': np.array([0.5, 1, 2, -1, 0.25, 3, 1.5]),
+	'b': np.array([True, False, True, False, True, True, False]),
+	's': np.array(['a', 'bc', 'def', '', 'g', 'hi', 'jkl']),
+}
+
+def row_mapping(i):
+	mapping = {}
+	for name, a in columns.items():
+		v = a[i].item()
+		if isinstance(v, str):
+			c = calcs.StringConstant(v)
+		elif isinstance(v, bool):
+			c = calcs.BooleanConstant(v)
+		else:
+			c = calcs.NumberConstant(v)
+		mapping[Var(name)] = LValue(Var(name), c)
+	return mapping
+
+def check(s):
+	tree = adv_parser.parse(s)
+	result = evaluate(tree, columns)
+	assert result.shape == (7, )
+	for i in range(7):
+		expected = calcs.Operator.extract_constant(tree.eval(row_mapping(i), precision = 15))
+		if expected.is_number:
+			assert complex(result[i]) == pytest.approx(complex(expected.approx(15)))
+		else:
+			assert result[i] == expected.value
+
+@pytest.mark.parametrize('s', [
+	"x * 2 + y ** 2 - 1",
+	"x / y",
+	"x // 2",
+	"-x % 3",
+	"x ** 0.5",
+	"(abs(x - y)) + 1/3",
+	"x * 2 + y > 3",
+	"x == y - 1",
+	"x != 1",
+	"b == 1",
+	"not x",
+	"b && x > 0",
+	"b xor y > 1",
+	"b -> x < 0",
+	"b + b",
+	"b * true",
+	"y > 0 && x / y > 1",
+	"(if (x > 0, x, -x))",
+	"1 + 2 * 3",
+])
+def test_vectorized(s):
+	check(s)
+
+@pytest.mark.parametrize('s', [
+	"s . x",
+	"(len(s)) + x",
+	"s + 1",
+	"(if (b, s, 'no'))",
+	"b || (len(s)) > 1",
+	# The guarded operands raise in the rows the operators do not evaluate them
+	"x > 100 && (len x) > 0",
+	"x < 5 || (len x) > 0",
+	"y > 0 && x > 100 && (len x) > 0",
+	"(if (x > 100, s - 1, x))",
+	"b && (if (x > 100, s - 1, x > 0))",
+	"z := x; z * 2",
+])
+def test_by_rows(s):
+	check(s)
+
+def test_error():
+	with pytest.raises(ValueError):
+		evaluate(adv_parser.parse("b / 2"), columns)
+	with pytest.raises(ValueError):
+		evaluate(adv_parser.parse("x"), {'x': np.zeros(2), 'y': np.zeros(3)})
+
+def test_constant():
+	result = evaluate(adv_parser.parse("1 + 1"), columns)
+	assert result.dtype == np.float64
+	assert list(result) == [2.0] * 7
+	assert evaluate(adv_parser.parse("s . 1"), columns)[0] == 'a1'
+
+def test_dtypes():
+	assert evaluate(adv_parser.parse("x > 0"), columns).dtype == np.bool_
+	assert evaluate(adv_parser.parse("x + 1"), columns).dtype == np.float64
+	assert evaluate(adv_parser.parse("+x"), columns).dtype == np.int64
+	assert evaluate(adv_parser.parse("x ** 0.5"), columns).dtype == np.complex128
+	result = evaluate(adv_parser.parse("s . x"), columns)
+	assert result.dtype == np.object_
+	assert result[1] == 'bc-2'
+
+def test_ieee():
+	# Divisions by zero are not exact
+	result = evaluate(adv_parser.parse("1 / x"), columns)
+	assert np.isinf(result[3])
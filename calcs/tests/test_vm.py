@@ -0,0 +1,129 @@
+import pytest
+import pickle
+import random
+import calcs
+from calcs import LValue, OperatorInfo, Var
+from calcs.vm import Opcode, compile
+from calcs.op_basic import IfThenElseOperator
+from calcs.op_num import IncrementOperator, PostIncrementOperator
+from calcs.op_utils import RepeatTimesOperator, TypeOperator
+from sympy import Integer
+
+adv_parser = calcs.give_advanced_parser(additional_prefix = [
+	OperatorInfo(IfThenElseOperator, 'if'),
+	OperatorInfo(IncrementOperator, 'inc'),
+	OperatorInfo(PostIncrementOperator, 'postinc'),
+	OperatorInfo(RepeatTimesOperator, 'repeatN'),
+	OperatorInfo(TypeOperator, 'type'),
+])
+
+def make_mapping():
+	x, y = Var('x'), Var('y')
+	return {x: LValue(x, calcs.NumberConstant(Integer(42))), y: LValue(y, calcs.StringConstant('foo'))}
+
+def run(f, mapping):
+	try:
+		value = f(mapping)
+	except Exception as e:
+		return ('error', type(e), str(e))
+
+	if value.is_lvalue:
+		return ('lvalue', value.var.name, type(value.content), value.value, value.content.is_dummy)
+	return (type(value), value.value, value.is_dummy)
+
+def dump_mapping(mapping):
+	return {v.name: (type(lv.content), lv.value) for v, lv in mapping.items()}
+
+def check(tree):
+	m1, m2 = make_mapping(), make_mapping()
+	assert run(compile(tree), m1) == run(tree.eval, m2)
+	assert dump_mapping(m1) == dump_mapping(m2)
+
+@pytest.mark.parametrize('s', [
+	"1 + 2 * 3",
+	"x * 2 + 1",
+	"y . x",
+	"x = 3; x = x * 5",
+	"z := x; z = 1; x",
+	"z :=& x; z = 'bar'; x",
+	"inc x",
+	"postinc x; x",
+	"false && undefined",
+	"true || undefined",
+	"x < 0 -> undefined",
+	"if (x > 0, 'pos', undefined)",
+	"if (x < 0, undefined, -x)",
+	"(if (x > 0, (x = 1), (x = 2))); x",
+	"dummy 3",
+	"pass (dummy 3, dummy 4)",
+	"repeatN (3, x = x + 1)",
+	"type (x . y)",
+	"reverse (x / 2)",
+	"undefined + 1",
+	"'foo' - 1",
+	"raise 'error'",
+	"x := 1",
+])
+def test_same_as_eval(s):
+	check(adv_parser.parse(s))
+
+def test_program():
+	program = compile(adv_parser.parse("x * x + 1"))
+	assert program.code.typecode == 'I'
+	assert len(program) == 5
+	assert [Opcode(op) for op in program.code[::2]] == [Opcode.VAR, Opcode.VAR, Opcode.APPLY, Opcode.CONST, Opcode.APPLY]
+	# The same variable shares one slot
+	assert program.vars == (Var('x'),)
+	assert len(program.disassemble()) == 5
+
+def test_jumps():
+	program = compile(adv_parser.parse("x > 0 && y"))
+	ops = [Opcode(op) for op in program.code[::2]]
+	assert Opcode.SHORTCUT in ops and Opcode.JUMP in ops and Opcode.COMBINE in ops
+	program = compile(adv_parser.parse("if (x > 0, 1, 2)"))
+	assert Opcode.JUMP_IF_FALSE in [Opcode(op) for op in program.code[::2]]
+
+def test_pickle():
+	program = compile(adv_parser.parse("x = x * 2 + 1; x > 80 || undefined"))
+	restored = pickle.loads(pickle.dumps(program))
+	assert restored.code == program.code
+	assert run(restored, make_mapping()) == run(program, make_mapping())
+
+def test_pickle_deep():
+	# Lowered operators are kept as classes, so pickling does not recurse through the tree
+	tree = adv_parser.parse(" - ".join(f"x * {i}" for i in range(3000)))
+	program = compile(tree)
+	assert program.nodes == ()
+	assert all(isinstance(cls, type) for cls, n in program.operators)
+	restored = pickle.loads(pickle.dumps(program))
+	assert run(restored, make_mapping()) == run(tree.eval, make_mapping())
+
+def test_deep():
+	tree = adv_parser.parse("+".join(["1"] * 5000))
+	assert compile(tree)({}).value == 5000
+
+def test_deep_if_chain():
+	# Too deep for the interpreter, which recurses through non-strict operators
+	tree = adv_parser.parse("if (x > 0, " * 500 + "x" + ", 0)" * 500)
+	assert compile(tree)(make_mapping()).value == 42
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_differential(seed):
+	rng = random.Random(seed)
+	leaves = ["x", "y", "1", "2.5", "true", "false", "'a'", "undefined"]
+	infixes = ["+", "-", "*", "/", ".", "<", "==", "&&", "||", "->", "xor", "=", ";"]
+	prefixes = ["-", "~", "abs", "len", "type", "inc", "solid", "dummy"]
+
+	def expr(depth):
+		k = rng.random()
+		if depth == 0 or k < 0.2:
+			return rng.choice(leaves)
+		elif k < 0.4:
+			return f"{rng.choice(prefixes)} ({expr(depth - 1)})"
+		elif k < 0.5:
+			return f"if ({expr(depth - 1)}, {expr(depth - 1)}, {expr(depth - 1)})"
+		else:
+			return f"({expr(depth - 1)}) {rng.choice(infixes)} ({expr(depth - 1)})"
+
+	for _ in range(50):
+		check(adv_parser.parse(expr(4)))
@@ -1,11 +1,15 @@
 from __future__ import annotations
+from .approx import ApproxType, is_approx, precision_of, to_approx, to_sympy
 from collections.abc import Callable, MutableMapping, Sequence
-from sympy import Expr, floor, Integer, simplify
+from enum import Flag
+from sympy import Expr, Float, floor, Integer, simplify
 from sympy.codegen.cfunctions import log10
 from typing import Any, Generic, no_type_check, Optional, TypeVar
+import random
 
 __all__ = (
 	'TEMPVAR',
+	'Effect',
 	'TreeNodeType',
 	'Value',
 	'Var',
@@ -15,12 +19,33 @@ __all__ = (
 	'BooleanConstant',
 	'StringConstant',
 	'LValue',
+	'Wildcard',
 	'Operator',
+	'evaluate',
+	'effects_of',
+	'approximate',
 )
 
 TEMPVAR = object()
 
+class Effect(Flag):
+	# What evaluating a node may do other than computing its value.
+	# Operands are not counted; see effects_of() for whole trees.
+	PURE = 0
+	READS_VARS = 1
+	WRITES_VARS = 2
+	USES_RNG = 4
+	MAY_RAISE = 8
+	# Raising is the purpose (the raise statement), so it is never dead code
+	RAISES = 16
+	# Nodes without declared effects are assumed to do anything
+	UNKNOWN = READS_VARS | WRITES_VARS | USES_RNG | MAY_RAISE | RAISES
+
 class TreeNodeType:
+	# The height of the tree; leaves are 0
+	_depth: int = 0
+	_effects: Effect = Effect.UNKNOWN
+
 	# Note that for the items (car, lvalue) in mapping,
 	# it is syntactically not needed to make var == lvalue.var
 	# And, semantically, this feature helps us to
@@ -44,6 +69,8 @@ class Value:
 		return self._is_lvalue
 
 class Var(TreeNodeType):
+	# Undefined variables raise
+	_effects = Effect.READS_VARS | Effect.MAY_RAISE
 	_name: str
 	_scope: Any # None for "weird" or "naive" variables
 
@@ -110,6 +137,7 @@ class Constant(TreeNodeType, Value, Generic[ConstType]):
 	_is_dummy: bool = False
 
 	_is_constant = True
+	_effects = Effect.PURE
 
 	@classmethod
 	def create_dummy(cls, dummy_value: ConstType):
@@ -155,6 +183,9 @@ class Constant(TreeNodeType, Value, Generic[ConstType]):
 
 		return self._value == other._value
 
+	def __hash__(self):
+		return hash((type(self), self._value))
+
 	def cast(self, to_type: type[Constant]):
 		raise NotImplementedError
 
@@ -207,23 +238,92 @@ class NumberConstant(Constant[Expr]):
 
 	# In general that will cause problems if we don't restrict the Expr types used
 	# Thus the value expressions should satisfy "is_number"
-	def __init__(self, value: Expr):
-		assert value.is_number
-		super().__init__(value)
+
+	# Integers are kept as int (the native value), so the arithmetic in op_basic
+	# can skip SymPy while the values stay integers.
+	# The SymPy value is only built when the value property is read.
+	# Rationals stay SymPy expressions: Fraction arithmetic is slower than SymPy's.
+	# Approximate numbers (see calcs.approx) are kept as float, complex or mpmath numbers,
+	# and their value is a SymPy Float at their precision.
+	_value: Any # int, Expr or ApproxType
+	_expr: Optional[Expr]
+
+	def __init__(self, value: Expr | int | ApproxType):
+		if type(value) is int or is_approx(value):
+			self._value = value
+			self._expr = None
+		else:
+			assert value.is_number
+			self._value = int(value) if value.is_Integer else value
+			self._expr = value
+
+	@property
+	def value(self) -> Expr:
+		if self._expr is None:
+			if type(self._value) is int:
+				self._expr = Integer(self._value)
+			else:
+				self._expr = to_sympy(self._value)
+		return self._expr
+
+	@property
+	def is_native(self) -> bool:
+		return type(self._value) is int
+
+	@property
+	def native(self) -> int:
+		# @Pre is_native
+		return self._value
+
+	@property
+	def is_approx(self) -> bool:
+		return is_approx(self._value)
+
+	@property
+	def precision(self) -> Optional[int]:
+		# None for exact numbers
+		if self.is_approx:
+			return precision_of(self._value)
+		return None
+
+	def approx(self, precision: int) -> Optional[ApproxType]:
+		return to_approx(self._value, precision)
 
 	def __str__(self):
+		if self.is_approx:
+			return str(self._value)
 		return str(self._simplify())
 
+	def __repr__(self):
+		return repr(self.value)
+
+	def __eq__(self, other):
+		if type(self) is not type(other):
+			return NotImplemented
+
+		if self.is_native and other.is_native:
+			return self._value == other._value
+		return self.value == other.value
+
+	def __hash__(self):
+		return hash((type(self), self.value))
+
 	def _simplify(self) -> Expr:
+		if self.is_native or self.is_approx:
+			# Integers and floats are simplified already
+			return self.value
+
 		if self._value not in self._simplify_cache:
 			self._simplify_cache[self._value] = self._value.simplify()
 		return self._simplify_cache[self._value]
 
 	def simplify(self) -> NumberConstant:
+		if self.is_native or self.is_approx:
+			return NumberConstant(self._value)
 		return NumberConstant(self._simplify())
 
 	def is_(self, what):
-		result = getattr(self._value, f'is_{what}')
+		result = getattr(self.value, f'is_{what}')
 		if result is None:
 			result = getattr(self._simplify(), f'is_{what}')
 		return result
@@ -233,8 +333,13 @@ class NumberConstant(Constant[Expr]):
 		if to_type is NumberConstant:
 			return self
 		elif to_type is BooleanConstant:
+			if self.is_native or self.is_approx:
+				return BooleanConstant(bool(self._value))
 			return BooleanConstant(bool(self._simplify()))
 		elif to_type is StringConstant:
+			if self.is_approx:
+				return StringConstant(str(self._value))
+
 			s, v = '', self._simplify()
 			if v.is_integer:
 				s = str(int(v))
@@ -341,28 +446,89 @@ class LValue(Value):
 	def value(self):
 		return self._content.value
 
+class Wildcard(TreeNodeType):
+	# The wildcard is sampled when it is evaluated, so a tree is a pure function of its inputs.
+	# The RNG can be given by the keyword argument "rng" of eval(), otherwise the random module is used.
+	_effects = Effect.USES_RNG
+
+	def __repr__(self):
+		return '_'
+
+	def __eq__(self, other):
+		if not isinstance(other, Wildcard):
+			return NotImplemented
+
+		return True
+
+	def __hash__(self):
+		return hash(Wildcard)
+
+	def eval(self, mapping, **kwargs):
+		rng = kwargs.get('rng')
+		if rng is None:
+			rng = random
+
+		return NumberConstant.create_dummy(Float(rng.random()))
+
+	def apply_var(self, f):
+		pass
+
 class Operator(TreeNodeType):
 	# An immutable type
 	ary: int
 	_operands: Sequence[TreeNodeType]
+	# A strict operator evaluates every operand exactly once, from left to right,
+	# before doing its own work, and does not look into the operand nodes.
+	# Its work is implemented in apply(), which receives the evaluated operands.
+	# Strict operators in deep trees are unfolded by evaluate() instead of recursion.
+	_strict: bool = False
+	# A conditional operator evaluates some of its operands one by one, choosing each from
+	# the values of the operands before it (e.g. the shortcut Boolean operators).
+	# Conditional operators in deep trees are unfolded by evaluate() through _select() and _conclude().
+	_conditional: bool = False
+	# MAY_RAISE in _effects does not apply if every operand is of these types,
+	# and then the values are of _result_type (None if unknown); see effects_of()
+	_safe_operands: tuple[type[Constant], ...] = ()
+	_result_type: Optional[type[Constant]] = None
 
 	def __init__(self, *args: TreeNodeType):
 		if len(args) != self.ary:
 			raise ValueError('Unmatched numbers of operands.')
 
 		self._operands = args
+		self._depth = 1 + max((o._depth for o in args), default = 0)
 
 	def __repr__(self):
 		return type(self).__name__ + '(' + ', '.join(repr(o) for o in self._operands) + ')'
 
 	def eval(self, mapping, **kwargs):
+		if self._strict:
+			return self.apply(mapping, *self.eval_operands(mapping, **kwargs), **kwargs)
+
+		raise NotImplementedError
+
+	def apply(self, mapping: MutableMapping[Var, LValue], *args: Value, **kwargs) -> Value:
+		raise NotImplementedError
+
+	def _select(self, values: list[Value]) -> Optional[int]:
+		# The index of the operand to evaluate after the operands with the values, or None if it is done
+		raise NotImplementedError
+
+	def _conclude(self, values: list[Value]) -> Value:
+		# The value of the operator from the values of the operands it evaluated
 		raise NotImplementedError
 
 	def eval_operand(self, i: int, mapping: MutableMapping[Var, LValue], **kwargs) -> Value:
-		return self._operands[i].eval(mapping, **kwargs)
+		o = self._operands[i]
+		if o._depth < RECURSIVE_EVAL_DEPTH:
+			return o.eval(mapping, **kwargs)
+		return evaluate(o, mapping, **kwargs)
 
 	def eval_operands(self, mapping: MutableMapping[Var, LValue], **kwargs) -> list[Value]:
-		return [o.eval(mapping, **kwargs) for o in self._operands]
+		return [
+			o.eval(mapping, **kwargs) if o._depth < RECURSIVE_EVAL_DEPTH else evaluate(o, mapping, **kwargs)
+			for o in self._operands
+		]
 
 	def eval_and_extract_constant(self, i: int, mapping: MutableMapping[Var, LValue], **kwargs) -> Constant:
 		return self.extract_constant(self.eval_operand(i, mapping, **kwargs))
@@ -371,8 +537,13 @@ class Operator(TreeNodeType):
 		return self.extract_constants(*self.eval_operands(mapping, **kwargs))
 
 	def apply_var(self, f):
-		for o in self._operands:
-			o.apply_var(f)
+		stack: list[TreeNodeType] = [self]
+		while len(stack) > 0:
+			node = stack.pop()
+			if isinstance(node, Operator):
+				stack.extend(reversed(node._operands))
+			else:
+				node.apply_var(f)
 
 	@staticmethod
 	def extract_constant(value: Value) -> Constant:
@@ -385,3 +556,100 @@ class Operator(TreeNodeType):
 	@classmethod
 	def extract_constants(cls, *args: Value) -> list[Constant]:
 		return [cls.extract_constant(v) for v in args]
+
+def approximate(precision: Optional[int], *args: NumberConstant) -> Optional[list[ApproxType]]:
+	# The approximations of the numbers if they should be computed approximately: at the requested
+	# precision (the keyword argument "precision" of eval()) or the highest precision of the operands.
+	# None for exact computation, or if a number has no approximation.
+	for a in args:
+		if a.is_approx:
+			p = a.precision
+			if precision is None or p > precision:
+				precision = p
+
+	if precision is None:
+		return None
+
+	result = [a.approx(precision) for a in args]
+	if any(v is None for v in result):
+		return None
+	return result
+
+# Subtrees lower than this are evaluated by plain recursion
+RECURSIVE_EVAL_DEPTH = 64
+
+def evaluate(node: TreeNodeType, mapping: MutableMapping[Var, LValue], **kwargs) -> Value:
+	# Same as node.eval(mapping, **kwargs), but deep chains of strict and conditional operators
+	# are evaluated with an explicit stack, so the depth of the tree is not limited by recursion.
+	# Other operators evaluate themselves, and their deep operands come back here.
+	if node._depth < RECURSIVE_EVAL_DEPTH or not (isinstance(node, Operator) and (node._strict or node._conditional)):
+		return node.eval(mapping, **kwargs)
+
+	values: list[Value] = []
+	# (node, None) to visit the node; (strict operator, []) to apply it to the values of its operands;
+	# (conditional operator, values) to take the value of its last operand and choose the next one
+	stack: list[tuple[TreeNodeType, Optional[list[Value]]]] = [(node, None)]
+	while len(stack) > 0:
+		node, evaluated = stack.pop()
+		if evaluated is None:
+			if not (node._depth >= RECURSIVE_EVAL_DEPTH and isinstance(node, Operator) and (node._strict or node._conditional)):
+				values.append(node.eval(mapping, **kwargs))
+				continue
+			elif node._strict:
+				stack.append((node, []))
+				stack.extend((o, None) for o in reversed(node._operands))
+				continue
+			evaluated = []
+		elif node._strict:
+			assert isinstance(node, Operator)
+			n = len(node._operands)
+			operands = values[len(values) - n:]
+			del values[len(values) - n:]
+			values.append(node.apply(mapping, *operands, **kwargs))
+			continue
+		else:
+			evaluated.append(values.pop())
+
+		# A conditional operator
+		assert isinstance(node, Operator)
+		if (i := node._select(evaluated)) is None:
+			values.append(node._conclude(evaluated))
+		else:
+			stack.append((node, evaluated))
+			stack.append((node._operands[i], None))
+
+	return values[0]
+
+def effects_of(tree: TreeNodeType) -> Effect:
+	# All the effects evaluating the tree may have.
+	# An operator may not raise because of the types of its operands, known from constants
+	# and the result types of operators: "1 - 2 * 3" does not raise, but "1 - x" may.
+	# (The effects of a subtree, the type of its values or None if unknown)
+	results: list[tuple[Effect, Optional[type[Constant]]]] = []
+	stack: list[tuple[TreeNodeType, bool]] = [(tree, False)]
+	while len(stack) > 0:
+		node, ready = stack.pop()
+		if not ready:
+			if isinstance(node, Operator):
+				stack.append((node, True))
+				stack.extend((o, False) for o in reversed(node._operands))
+			else:
+				results.append((node._effects, type(node) if isinstance(node, Constant) else None))
+			continue
+
+		assert isinstance(node, Operator)
+		n = len(node._operands)
+		operands = results[len(results) - n:]
+		del results[len(results) - n:]
+
+		effects, result_type = node._effects, None
+		safe = node._safe_operands
+		# Unknown types are only safe for operators taking every constant
+		if len(safe) > 0 and all(issubclass(t or Constant, safe) for _, t in operands):
+			effects &= ~Effect.MAY_RAISE
+			result_type = node._result_type
+		for e, _ in operands:
+			effects |= e
+		results.append((effects, result_type))
+
+	return results[0][0]
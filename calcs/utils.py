@@ -1,5 +1,8 @@
 from .types import *
-from collections.abc import Mapping
+from collections import OrderedDict
+from collections.abc import Hashable, Mapping
+from threading import Lock
+from typing import Any, Generic, NamedTuple, Optional, TypeVar
 
 # Simply pick the firstly encountered variable.
 def mapping_flatten(mapping: Mapping[Var, LValue]) -> Mapping[Var, LValue]:
@@ -17,10 +20,99 @@ def filter_operator(g: dict[str, object]) -> list[str]:
 	return [name for name in g if
 		not name.startswith('_') and
 		name.endswith('Operator') and
-		name not in ('Operator', 'NullaryOperator', 'UnaryOperator', 'BinaryOperator', 'TernaryOperator')
+		name not in ('Operator', 'NullaryOperator', 'UnaryOperator', 'BinaryOperator', 'TernaryOperator', 'NaryOperator')
 	]
 
+class CacheInfo(NamedTuple):
+	hits: int
+	misses: int
+	evictions: int
+	size: int
+	capacity: Optional[int]
+
+K = TypeVar('K', bound = Hashable)
+V = TypeVar('V')
+
+# A size-bounded LRU cache; capacity None means unbounded.
+class LRUCache(Generic[K, V]):
+	_missing: Any = object()
+
+	def __init__(self, capacity: Optional[int] = 128):
+		if capacity is not None and capacity < 0:
+			raise ValueError('Capacity should be non-negative')
+
+		self._capacity = capacity
+		self._data: OrderedDict[K, V] = OrderedDict()
+		self._lock = Lock()
+		self._hits = 0
+		self._misses = 0
+		self._evictions = 0
+
+	def __len__(self):
+		return len(self._data)
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def get(self, key: K, default: Any = None) -> Any:
+		with self._lock:
+			value = self._data.get(key, self._missing)
+			if value is self._missing:
+				self._misses += 1
+				return default
+
+			self._data.move_to_end(key)
+			self._hits += 1
+			return value
+
+	def put(self, key: K, value: V):
+		if self._capacity == 0:
+			return
+
+		with self._lock:
+			self._data[key] = value
+			self._data.move_to_end(key)
+			if self._capacity is not None:
+				while len(self._data) > self._capacity:
+					self._data.popitem(last = False)
+					self._evictions += 1
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+			self._hits = 0
+			self._misses = 0
+			self._evictions = 0
+
+	@property
+	def capacity(self) -> Optional[int]:
+		return self._capacity
+
+	@property
+	def hits(self) -> int:
+		return self._hits
+
+	@property
+	def misses(self) -> int:
+		return self._misses
+
+	@property
+	def evictions(self) -> int:
+		return self._evictions
+
+	def info(self) -> CacheInfo:
+		return CacheInfo(self._hits, self._misses, self._evictions, len(self._data), self._capacity)
+
+	# Pickled as an empty cache of the same capacity, since locks are not picklable
+	def __getstate__(self):
+		return {'capacity': self._capacity}
+
+	def __setstate__(self, state):
+		self.__init__(state['capacity'])
+
 __all__ = (
 	'mapping_flatten',
 	'filter_operator',
+	'CacheInfo',
+	'LRUCache',
 )
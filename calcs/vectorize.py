@@ -0,0 +1,421 @@
+from .approx import DOUBLE_PRECISION
+from .types import *
+from .types import evaluate as _evaluate
+from .op_basic import *
+from .op_basic import _BinaryBoolOperator, _BinaryComparisonOperator
+from .op_num import AbsOperator, ImagOperator, PowOperator, RealOperator
+from .op_utils import PassOperator, SequenceOperator
+from collections.abc import Callable, Mapping
+from typing import Any, Optional
+import numpy as np
+
+__all__ = (
+	'evaluate',
+)
+
+'''
+A tree is evaluated over many rows of variable bindings at once.
+The bindings are columns: NumPy arrays keyed by variable names, one element per row.
+Numbers are computed as float64 or complex128 arrays and Boolean values as bool arrays,
+so every row gets what tree.eval(mapping, precision = 15) gives in the approximate mode
+(see calcs.approx), except that overflows and divisions by zero give inf and nan as in NumPy.
+Integers are int64 arrays until they meet arithmetic, which is approximate, as in that mode.
+
+Operators without a kernel below, and kernels meeting operands they do not handle (e.g. strings),
+are evaluated row by row with the ordinary operators, and their results are packed into arrays again.
+Operators deciding which operands to evaluate (the shortcut Boolean operators and IfThenElseOperator)
+are only vectorized if their operands are; otherwise they are evaluated row by row as a whole,
+so the operands are evaluated exactly when the interpreter would evaluate them.
+Operands with nodes without kernels are found before evaluating anything, and operands meeting
+kernels which do not handle them stop being vectorized before any row is evaluated.
+Trees writing variables are evaluated row by row as a whole, each row with its own mapping.
+
+NumPy is an optional dependency, installed with the extra "vectorize".
+'''
+
+# Kernels take the operator and the arrays of its operands, and give None for operands they do not handle
+Kernel = Callable[..., Optional[np.ndarray]]
+
+def _is_bool(a: np.ndarray) -> bool:
+	return a.dtype == np.bool_
+
+def _is_object(a: np.ndarray) -> bool:
+	return a.dtype == np.object_
+
+def _approx(a: np.ndarray) -> np.ndarray:
+	if np.iscomplexobj(a):
+		return a
+	return a.astype(np.float64)
+
+def _numbers(*arrays: np.ndarray) -> Optional[list[np.ndarray]]:
+	# Approximate numbers, where Boolean values are converted into numbers
+	if any(_is_object(a) for a in arrays):
+		return None
+	return [_approx(a) for a in arrays]
+
+def _strict_numbers(*arrays: np.ndarray) -> Optional[list[np.ndarray]]:
+	# Approximate numbers, and no Boolean values
+	if any(_is_object(a) or _is_bool(a) for a in arrays):
+		return None
+	return [_approx(a) for a in arrays]
+
+def _real_numbers(*arrays: np.ndarray) -> Optional[list[np.ndarray]]:
+	if any(_is_object(a) or _is_bool(a) or np.iscomplexobj(a) for a in arrays):
+		return None
+	return [_approx(a) for a in arrays]
+
+def _to_bool(a: np.ndarray) -> Optional[np.ndarray]:
+	if _is_bool(a):
+		return a
+	elif _is_object(a):
+		return None
+	return a != 0
+
+def _plus(node, a, b):
+	if _is_bool(a) and _is_bool(b):
+		return a | b
+	elif (v := _numbers(a, b)) is not None:
+		return v[0] + v[1]
+	return None
+
+def _minus(node, a, b):
+	if _is_bool(a) and _is_bool(b):
+		return a & ~b
+	elif (v := _numbers(a, b)) is not None:
+		return v[0] - v[1]
+	return None
+
+def _multiply(node, a, b):
+	if _is_bool(a) and _is_bool(b):
+		return a & b
+	elif (v := _numbers(a, b)) is not None:
+		return v[0] * v[1]
+	return None
+
+def _reduce(kernel: Kernel) -> Kernel:
+	def run(node, *args):
+		result = args[0]
+		for a in args[1:]:
+			if (result := kernel(node, result, a)) is None:
+				return None
+		return result
+
+	return run
+
+def _divide(node, a, b):
+	if (v := _strict_numbers(a, b)) is not None:
+		return v[0] / v[1]
+	return None
+
+def _integer_divide(node, a, b):
+	if (v := _real_numbers(a, b)) is not None:
+		return np.floor_divide(v[0], v[1])
+	return None
+
+def _modulo(node, a, b):
+	if (v := _real_numbers(a, b)) is not None:
+		return np.mod(v[0], v[1])
+	return None
+
+def _positive(node, a):
+	# Integers stay exact
+	if _is_object(a) or _is_bool(a):
+		return None
+	return a
+
+def _negative(node, a):
+	if (v := _strict_numbers(a)) is not None:
+		return -v[0]
+	return None
+
+def _not(node, a):
+	if (v := _to_bool(a)) is not None:
+		return ~v
+	return None
+
+# The Boolean operators in NumPy
+_LOGIC: dict[type[_BinaryBoolOperator], Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+	AndOperator: lambda a, b: a & b,
+	OrOperator: lambda a, b: a | b,
+	ImplOperator: lambda a, b: ~a | b,
+	NimplOperator: lambda a, b: a & ~b,
+	XorOperator: lambda a, b: a ^ b,
+	IffOperator: lambda a, b: ~(a ^ b),
+	NandOperator: lambda a, b: ~(a & b),
+	NorOperator: lambda a, b: ~(a | b),
+	ConverseImplOperator: lambda a, b: a | ~b,
+	ConverseNimplOperator: lambda a, b: ~a & b,
+}
+
+def _logic(node, a, b):
+	a, b = _to_bool(a), _to_bool(b)
+	if a is None or b is None:
+		return None
+	return _LOGIC[type(node)](a, b)
+
+def _compare(node, a, b):
+	if (v := _numbers(a, b)) is None:
+		return None
+
+	a, b = v
+	if not (np.iscomplexobj(a) or np.iscomplexobj(b)):
+		return node._compstr(a, b)
+
+	# Non-real numbers are only compared for equality
+	real = (a.imag == 0) & (b.imag == 0)
+	return np.where(real, node._compstr(a.real, b.real), a == b)
+
+def _equal(node, a, b):
+	if _is_object(a) or _is_object(b):
+		return None
+	elif _is_bool(a) != _is_bool(b):
+		# Boolean values never equal numbers
+		return np.zeros(np.broadcast_shapes(a.shape, b.shape), np.bool_)
+	return a == b
+
+def _nonequal(node, a, b):
+	if (v := _equal(node, a, b)) is not None:
+		return ~v
+	return None
+
+def _if_then_else(node, a, b, c):
+	if (a := _to_bool(a)) is None or _is_object(b) or _is_object(c) or _is_bool(b) != _is_bool(c):
+		return None
+	return np.where(a, b, c)
+
+def _abs(node, a):
+	if (v := _strict_numbers(a)) is not None:
+		return np.abs(v[0])
+	return None
+
+def _pow(node, a, b):
+	if (v := _strict_numbers(a, b)) is None:
+		return None
+
+	a, b = v
+	if not (np.iscomplexobj(a) or np.iscomplexobj(b)) and np.any((a < 0) & (b != np.floor(b))):
+		# Negative bases to fractional powers are complex, as in Python
+		a = a.astype(np.complex128)
+	return np.power(a, b)
+
+def _real(node, a):
+	if (v := _strict_numbers(a)) is not None:
+		return np.real(v[0])
+	return None
+
+def _imag(node, a):
+	if (v := _strict_numbers(a)) is not None:
+		return np.imag(v[0]).astype(np.float64)
+	return None
+
+def _last(node, *args):
+	return args[-1]
+
+_KERNELS: dict[type[Operator], Kernel] = {
+	PlusOperator: _plus,
+	MinusOperator: _minus,
+	MultipleOperator: _multiply,
+	SumOperator: _reduce(_plus),
+	ProductOperator: _reduce(_multiply),
+	DivideOperator: _divide,
+	IntegerDivideOperator: _integer_divide,
+	ModuloOperator: _modulo,
+	PositiveOperator: _positive,
+	NegativeOperator: _negative,
+	NotOperator: _not,
+	**{op: _logic for op in _LOGIC},
+	LessOperator: _compare,
+	LeOperator: _compare,
+	GreaterOperator: _compare,
+	GeOperator: _compare,
+	EqualOperator: _equal,
+	NonequalOperator: _nonequal,
+	IfThenElseOperator: _if_then_else,
+	AbsOperator: _abs,
+	PowOperator: _pow,
+	RealOperator: _real,
+	ImagOperator: _imag,
+	PassOperator: _last,
+	SequenceOperator: _last,
+}
+
+# Operators whose operands are only vectorized together with the operator
+_CONDITIONAL = (_BinaryBoolOperator, IfThenElseOperator)
+
+def _to_constant(value: Any) -> Constant:
+	if isinstance(value, Constant):
+		return value
+	elif isinstance(value, (bool, np.bool_)):
+		return BooleanConstant(bool(value))
+	elif isinstance(value, (int, np.integer)):
+		return NumberConstant(int(value))
+	elif isinstance(value, (float, np.floating)):
+		return NumberConstant(float(value))
+	elif isinstance(value, (complex, np.complexfloating)):
+		return NumberConstant(complex(value))
+	elif isinstance(value, str):
+		return StringConstant(value)
+	raise TypeError(f'Unable to bind {type(value).__name__}')
+
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+def _pack(constants: list[Constant]) -> np.ndarray:
+	# The array of the values of the constants, or an object array of the constants themselves
+	if all(c.is_bool for c in constants):
+		return np.array([c.value for c in constants], np.bool_)
+	elif all(c.is_number and c.is_native and _INT64_MIN <= c.native <= _INT64_MAX for c in constants):
+		return np.array([c.native for c in constants], np.int64)
+	elif all(c.is_number for c in constants):
+		values = [c.approx(DOUBLE_PRECISION) for c in constants]
+		if not any(v is None for v in values):
+			if any(type(v) is complex for v in values):
+				return np.array(values, np.complex128)
+			return np.array(values, np.float64)
+
+	a = np.empty(len(constants), np.object_)
+	a[:] = constants
+	return a
+
+def _unpack(a: np.ndarray, i: int) -> Constant:
+	if a.ndim > 0:
+		return _to_constant(a[i])
+	return _to_constant(a[()])
+
+def _column(name: str, values: Any) -> np.ndarray:
+	a = np.asarray(values)
+	if a.ndim != 1:
+		raise ValueError(f'The column {name} is not one-dimensional')
+
+	match a.dtype.kind:
+		case 'b':
+			return a
+		case 'i' | 'u' if a.dtype.itemsize < 8 or a.dtype.kind == 'i':
+			return a.astype(np.int64)
+		case 'i' | 'u' | 'f':
+			return a.astype(np.float64)
+		case 'c':
+			return a.astype(np.complex128)
+		case _:
+			return _pack([_to_constant(v) for v in a])
+
+class _Fallback(Exception):
+	# Raised instead of evaluating rows in the operands of a conditional operator
+	pass
+
+class _Evaluation:
+	def __init__(self, columns: Mapping[str, Any], kwargs: dict[str, Any]):
+		self.columns = {name: _column(name, values) for name, values in columns.items()}
+		sizes = {len(a) for a in self.columns.values()}
+		if len(sizes) != 1:
+			raise ValueError('The columns should have the same positive number of rows')
+
+		self.size, = sizes
+		self.kwargs = {**kwargs, 'precision': DOUBLE_PRECISION}
+		# The outermost conditional operator being vectorized, with the sizes of the results
+		# and of the stack of run() when it was visited
+		self.guard: Optional[tuple[Operator, int, int]] = None
+
+	def mapping(self, i: int) -> dict[Var, LValue]:
+		mapping = {}
+		for name, a in self.columns.items():
+			var = Var(name)
+			mapping[var] = LValue(var, _unpack(a, i))
+		return mapping
+
+	def by_rows(self, node: TreeNodeType) -> np.ndarray:
+		if self.guard is not None:
+			raise _Fallback()
+		return _pack([
+			Operator.extract_constant(_evaluate(node, self.mapping(i), **self.kwargs))
+			for i in range(self.size)
+		])
+
+	def apply_by_rows(self, node: Operator, operands: list[np.ndarray]) -> np.ndarray:
+		if self.guard is not None:
+			raise _Fallback()
+		return _pack([
+			Operator.extract_constant(node.apply(self.mapping(i), *(_unpack(a, i) for a in operands), **self.kwargs))
+			for i in range(self.size)
+		])
+
+	def leaf(self, node: TreeNodeType) -> np.ndarray:
+		if isinstance(node, Constant):
+			return _pack([node]).reshape(())
+		elif isinstance(node, Var) and node.name in self.columns:
+			return self.columns[node.name]
+		# Wildcards, undefined variables and operators without kernels
+		return self.by_rows(node)
+
+	def vectorizable(self, tree: TreeNodeType) -> bool:
+		# Whether every node of the tree is a constant, a column or an operator with a kernel
+		stack = [tree]
+		while len(stack) > 0:
+			node = stack.pop()
+			if isinstance(node, Operator):
+				if type(node) not in _KERNELS:
+					return False
+				stack.extend(node._operands)
+			elif not (isinstance(node, Constant) or (isinstance(node, Var) and node.name in self.columns)):
+				return False
+		return True
+
+	def run(self, tree: TreeNodeType) -> np.ndarray:
+		if effects_of(tree) & Effect.WRITES_VARS:
+			return self.by_rows(tree)
+
+		results: list[np.ndarray] = []
+		# (node, False) to visit the node, (node, True) to combine the results of its operands
+		stack: list[tuple[TreeNodeType, bool]] = [(tree, False)]
+		while len(stack) > 0:
+			node, combine = stack.pop()
+			try:
+				if not combine:
+					if isinstance(node, Operator) and type(node) in _KERNELS:
+						if isinstance(node, _CONDITIONAL) and self.guard is None:
+							if not self.vectorizable(node):
+								# Some operand would be evaluated in rows the operator would not evaluate it
+								results.append(self.by_rows(node))
+								continue
+							self.guard = (node, len(results), len(stack))
+						stack.append((node, True))
+						stack.extend((o, False) for o in reversed(node._operands))
+					else:
+						results.append(self.leaf(node))
+					continue
+
+				assert isinstance(node, Operator)
+				if self.guard is not None and self.guard[0] is node:
+					self.guard = None
+
+				n = len(node._operands)
+				operands = results[len(results) - n:]
+				del results[len(results) - n:]
+
+				if (result := _KERNELS[type(node)](node, *operands)) is not None:
+					results.append(np.asarray(result))
+				elif node._strict:
+					results.append(self.apply_by_rows(node, operands))
+				else:
+					results.append(self.by_rows(node))
+			except _Fallback:
+				# A kernel in the operands of the conditional operator does not handle its operands
+				node, size, depth = self.guard
+				self.guard = None
+				del results[size:]
+				del stack[depth:]
+				results.append(self.by_rows(node))
+
+		return results[0]
+
+def evaluate(tree: TreeNodeType, columns: Mapping[str, Any], **kwargs) -> np.ndarray:
+	# The values of the tree in every row: a bool, float64 or complex128 array,
+	# an int64 array of integers, or an object array of the values of other constants (e.g. strings).
+	# The keyword arguments are passed to eval().
+	e = _Evaluation(columns, kwargs)
+	with np.errstate(all = 'ignore'):
+		result = e.run(tree)
+
+	result = np.broadcast_to(result, (e.size,))
+	if _is_object(result):
+		return np.array([c.value for c in result], np.object_)
+	return result.copy()
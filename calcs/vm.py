@@ -0,0 +1,225 @@
+from .types import *
+from .op_basic import IfThenElseOperator, _BinaryBoolOperator
+from array import array
+from collections.abc import MutableMapping
+from enum import IntEnum
+from typing import Any, Union
+
+__all__ = (
+	'Opcode',
+	'Program',
+	'compile',
+)
+
+'''
+A tree is lowered into a flat program for a small stack machine.
+Every instruction is two words in an array('I'): the opcode and its argument.
+The argument is an index into one of the pools of the program,
+or a word offset into the code for jumps.
+
+	CONST k         push constants[k]
+	VAR k           push the value of vars[k]
+	APPLY k         pop the n operands of operators[k] = (cls, n) and push cls.apply(...)
+	EVAL k          push nodes[k].eval(...), for nodes the machine does not lower
+	JUMP t          continue at t
+	JUMP_IF_FALSE t pop a value and continue at t if it is false
+	SHORTCUT k      pop a value and convert it to bool a; if cls._logic(a) is decided,
+	                push the result and run the next instruction (a JUMP past the operator),
+	                otherwise push a and skip the next instruction
+	COMBINE k       pop b and a, then push cls._logic(a, b)
+
+Lowered operators are kept as their class and number of operands, not as nodes,
+so a program does not hold the tree; only the nodes run by EVAL keep their subtrees.
+
+The shortcut Boolean operators and IfThenElseOperator are lowered with jumps,
+so their operands are evaluated exactly when the interpreter would evaluate them.
+Neither lowering nor running the program uses recursion.
+'''
+
+class Opcode(IntEnum):
+	CONST = 0
+	VAR = 1
+	APPLY = 2
+	EVAL = 3
+	JUMP = 4
+	JUMP_IF_FALSE = 5
+	SHORTCUT = 6
+	COMBINE = 7
+
+CONST, VAR, APPLY, EVAL, JUMP, JUMP_IF_FALSE, SHORTCUT, COMBINE = (int(op) for op in Opcode)
+
+extract_constant = Operator.extract_constant
+
+class Program:
+	__slots__ = ('code', 'constants', 'vars', 'operators', 'nodes', '_operators')
+
+	code: array
+	constants: tuple[Constant, ...]
+	vars: tuple[Var, ...]
+	operators: tuple[tuple[type[Operator], int], ...]
+	nodes: tuple[TreeNodeType, ...]
+
+	def __init__(self, code: array, constants: tuple[Constant, ...], vars: tuple[Var, ...],
+		operators: tuple[tuple[type[Operator], int], ...], nodes: tuple[TreeNodeType, ...]):
+		self.code = code
+		self.constants = constants
+		self.vars = vars
+		self.operators = operators
+		self.nodes = nodes
+		# apply and _logic of lowered operators only use the class, not the operands,
+		# so they are called on an instance without operands
+		self._operators = tuple((object.__new__(cls), n) for cls, n in operators)
+
+	def __len__(self):
+		# The number of instructions
+		return len(self.code) // 2
+
+	def __getstate__(self):
+		return (self.code, self.constants, self.vars, self.operators, self.nodes)
+
+	def __setstate__(self, state):
+		self.__init__(*state)
+
+	def __call__(self, mapping: MutableMapping[Var, LValue], **kwargs) -> Value:
+		# Gives the same result as tree.eval(mapping, **kwargs)
+		code, constants, vars, operators, nodes = self.code, self.constants, self.vars, self._operators, self.nodes
+		stack: list[Any] = []
+		push, pop = stack.append, stack.pop
+		pc, end = 0, len(code)
+
+		while pc < end:
+			op, arg = code[pc], code[pc + 1]
+			pc += 2
+
+			if op == CONST:
+				push(constants[arg])
+			elif op == VAR:
+				v = vars[arg]
+				try:
+					push(mapping[v])
+				except KeyError:
+					# Undefined or anonymous variables
+					push(v.eval(mapping, **kwargs))
+			elif op == APPLY:
+				operator, n = operators[arg]
+				if n == 0:
+					push(operator.apply(mapping, **kwargs))
+				else:
+					operands = stack[-n:]
+					del stack[-n:]
+					push(operator.apply(mapping, *operands, **kwargs))
+			elif op == EVAL:
+				push(nodes[arg].eval(mapping, **kwargs))
+			elif op == JUMP:
+				pc = arg
+			elif op == JUMP_IF_FALSE:
+				if not extract_constant(pop()).to_bool().value:
+					pc = arg
+			elif op == SHORTCUT:
+				a = extract_constant(pop()).to_bool().value
+				result = operators[arg][0]._logic(a)
+				if result is None:
+					push(a)
+					pc += 2
+				else:
+					push(BooleanConstant(result))
+			elif op == COMBINE:
+				b = extract_constant(pop()).to_bool().value
+				a = pop()
+				push(BooleanConstant(operators[arg][0]._logic(a, b)))
+			else:
+				raise ValueError(f'Unknown opcode {op}')
+
+		return stack[-1]
+
+	def disassemble(self) -> list[str]:
+		lines = []
+		for pc in range(0, len(self.code), 2):
+			op, arg = Opcode(self.code[pc]), self.code[pc + 1]
+			match op:
+				case Opcode.CONST:
+					operand = repr(self.constants[arg])
+				case Opcode.VAR:
+					operand = repr(self.vars[arg])
+				case Opcode.APPLY | Opcode.SHORTCUT | Opcode.COMBINE:
+					operand = self.operators[arg][0].__name__
+				case Opcode.EVAL:
+					operand = type(self.nodes[arg]).__name__
+				case _:
+					operand = str(arg)
+			lines.append(f'{pc:>4} {op.name:<13} {arg:<4} {operand}')
+		return lines
+
+class _Label:
+	__slots__ = ('address',)
+
+	def __init__(self):
+		self.address = -1
+
+class _Lowering:
+	def __init__(self):
+		self.code = array('I')
+		self.constants: list[Constant] = []
+		self.vars: list[Var] = []
+		self.operators: list[tuple[type[Operator], int]] = []
+		self.nodes: list[TreeNodeType] = []
+		self._indices: dict[Any, int] = {}
+		self._jumps: list[tuple[int, _Label]] = []
+
+	def index(self, pool: list, obj: Any, key: Any) -> int:
+		key = (id(pool), key)
+		if key not in self._indices:
+			self._indices[key] = len(pool)
+			pool.append(obj)
+		return self._indices[key]
+
+	def operator(self, node: Operator) -> int:
+		# Operators of the same class and number of operands share one entry
+		entry = (type(node), len(node._operands))
+		return self.index(self.operators, entry, entry)
+
+	def emit(self, op: int, arg: Union[int, _Label]):
+		if isinstance(arg, _Label):
+			self._jumps.append((len(self.code) + 1, arg))
+			arg = 0
+		self.code.append(op)
+		self.code.append(arg)
+
+	def lower(self, tree: TreeNodeType) -> Program:
+		# Items are either nodes to lower, instructions to emit, or labels to place
+		stack: list[Any] = [tree]
+		while len(stack) > 0:
+			item = stack.pop()
+			if isinstance(item, _Label):
+				item.address = len(self.code)
+			elif isinstance(item, tuple):
+				self.emit(*item)
+			elif isinstance(item, Constant):
+				self.emit(CONST, self.index(self.constants, item, id(item)))
+			elif isinstance(item, Var):
+				self.emit(VAR, self.index(self.vars, item, item))
+			elif isinstance(item, Operator) and (item._strict or (isinstance(item, _BinaryBoolOperator) and not item._shortcut)):
+				stack.append((APPLY, self.operator(item)))
+				stack.extend(reversed(item._operands))
+			elif isinstance(item, _BinaryBoolOperator):
+				# Same as _BinaryBoolOperator.eval with shortcuts
+				k, done = self.operator(item), _Label()
+				a, b = item._operands
+				stack.extend(reversed([a, (SHORTCUT, k), (JUMP, done), b, (COMBINE, k), done]))
+			elif isinstance(item, IfThenElseOperator):
+				# Same as IfThenElseOperator.eval
+				otherwise, done = _Label(), _Label()
+				a, b, c = item._operands
+				stack.extend(reversed([a, (JUMP_IF_FALSE, otherwise), b, (JUMP, done), otherwise, c, done]))
+			else:
+				# Wildcards and other operators
+				self.emit(EVAL, self.index(self.nodes, item, id(item)))
+
+		for i, label in self._jumps:
+			self.code[i] = label.address
+
+		return Program(self.code, tuple(self.constants), tuple(self.vars), tuple(self.operators), tuple(self.nodes))
+
+def compile(tree: TreeNodeType) -> Program:
+	# compile(tree)(mapping, **kwargs) gives the same result as tree.eval(mapping, **kwargs)
+	return _Lowering().lower(tree)